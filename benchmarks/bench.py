@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Speed and accuracy benchmarks for betarat. Sweeps a grid of table sizes and success rate balances, timing each of
+
+    pdf   each available hyp2f1 backend (see betarat.backends), and the auto dispatcher
+    cdf   numerical integration at several quadr_maxiter (exact and asymptotic engines turned off), and the default
+    ppf   method="optim" versus method="simpson"
+    map   map versus lt_map
+
+and recording each result's error against a high precision reference. The report is written as JSON, and two
+reports (say, from before and after a change) can be compared to catch regressions in speed or accuracy:
+
+    python benchmarks/bench.py run -o before.json
+    python benchmarks/bench.py run -o after.json
+    python benchmarks/bench.py compare before.json after.json
+"""
+
+from __future__ import division
+import argparse
+import datetime
+import json
+import platform
+import sys
+import timeit
+
+import mpmath
+import numpy as np
+import scipy
+from scipy import optimize
+
+from betarat import BetaRat, defaults, backends
+from betarat.version import __version__
+from betarat.exact_cdf import exact_cdf
+
+
+# Number of trials per arm, and (X1 success rate, X2 success rate) pairs, from balanced to lopsided
+SIZES = (10, 40, 160)
+BALANCES = ((0.5, 0.5), (0.3, 0.5), (0.1, 0.5), (0.05, 0.3))
+QUICK_SIZES = (10, 40)
+QUICK_BALANCES = ((0.5, 0.5), (0.1, 0.5))
+
+PDF_POINTS = (0.5, 1.0, 2.0)
+QUADR_MAXITERS = (10, 50)
+QUANTILE = 0.05
+
+# Working precision, in decimal digits, for the reference values
+REFERENCE_DPS = 30
+
+
+def grid(sizes, balances):
+    "Tables (a, b, c, d) with n trials per arm at each pair of success rates"
+    for n in sizes:
+        for p1, p2 in balances:
+            a, b = int(round(n * p1)), int(round(n * p2))
+            yield a, b, n - a, n - b
+
+
+def best_time(fn, repeat):
+    "Best wall time over repeat calls to fn, along with its (last) result"
+    results = []
+    timer = timeit.Timer(lambda: results.append(fn()))
+    return min(timer.repeat(repeat, 1)), results[-1]
+
+
+def reference_pdf(br, w):
+    with mpmath.workdps(REFERENCE_DPS):
+        return float(br.pdf(w, hypf=mpmath.hyp2f1))
+
+
+def reference_ppf(br, q):
+    "Root of the exact CDF, which is correct to double precision for the (integer) tables of the grid"
+    f = lambda w: exact_cdf(br.a1, br.a2, br.b1, br.b2, w) - q
+    hi = 1.0
+    while f(hi) < 0:
+        hi *= 2
+    return optimize.brentq(f, 0, hi, xtol=1e-15, rtol=1e-15)
+
+
+def reference_mode(br, log_transformed=False):
+    """ Mode of the pdf (or of the log transformed pdf, whose mode is lt_map), found by bounded minimization of
+    the negative log density at high precision """
+    def objective(t):
+        w = mpmath.exp(t)
+        with mpmath.workdps(REFERENCE_DPS):
+            density = br.pdf(w, hypf=mpmath.hyp2f1) * (w if log_transformed else 1)
+            return -float(mpmath.log(density))
+    t = optimize.minimize_scalar(objective, bounds=(-12, 12), method='bounded', options=dict(xatol=1e-12)).x
+    return float(np.exp(t))
+
+
+def benchmark_table(table, repeat):
+    "All of the benchmark records for one table"
+    br = BetaRat(*table)
+    records = []
+
+    def record(quantity, method, arg, fn, reference):
+        seconds, value = best_time(fn, repeat)
+        value = float(value) if value != 'NA' else None
+        error = abs(value - reference) / abs(reference) if value is not None and reference else None
+        records.append(dict(table=list(table), quantity=quantity, method=method, arg=arg, seconds=seconds,
+            value=value, reference=reference, rel_error=error))
+
+    for w in PDF_POINTS:
+        reference = reference_pdf(br, w)
+        for name in available_backends() + ['auto']:
+            record('pdf', name, w, lambda: br.pdf(w, hypf=name), reference)
+
+    reference = exact_cdf(br.a1, br.a2, br.b1, br.b2, 1.0)
+    for maxiter in QUADR_MAXITERS:
+        record('cdf', 'quadrature_{}'.format(maxiter), 1.0,
+                lambda: br.cdf(1.0, quadr_maxiter=maxiter, exact_max_terms=0, approx_tol=0), reference)
+    record('cdf', 'default', 1.0, lambda: br.cdf(1.0), reference)
+
+    reference = reference_ppf(br, QUANTILE)
+    record('ppf', 'optim', QUANTILE, lambda: br.ppf(QUANTILE), reference)
+    record('ppf', 'simpson', QUANTILE, lambda: br.ppf(QUANTILE, method='simpson'), reference)
+
+    record('map', 'map', None, br.map, reference_mode(br))
+    record('map', 'lt_map', None, br.lt_map, reference_mode(br, log_transformed=True))
+    return records
+
+
+def available_backends():
+    return [name for name, backend in backends.registry.items() if backend.available()]
+
+
+def run(args):
+    sizes, balances = (QUICK_SIZES, QUICK_BALANCES) if args.quick else (SIZES, BALANCES)
+    records = []
+    for table in grid(sizes, balances):
+        if args.verbose:
+            print >> sys.stderr, "Benchmarking", table
+        records += benchmark_table(table, args.repeat)
+    report = dict(
+            betarat=__version__,
+            timestamp=datetime.datetime.utcnow().isoformat(),
+            platform=platform.platform(),
+            python=platform.python_version(),
+            versions=dict(numpy=np.__version__, scipy=scipy.__version__, mpmath=mpmath.__version__),
+            backends=available_backends(),
+            settings=dict(defaults, repeat=args.repeat, quick=args.quick),
+            records=records)
+    json.dump(report, args.output, indent=1, sort_keys=True)
+    args.output.write('\n')
+
+
+def record_key(record):
+    return (tuple(record['table']), record['quantity'], record['method'], record['arg'])
+
+
+def compare(args):
+    """ Report every benchmark which got slower by more than the time factor, or whose error grew by more than the
+    error factor (errors below the error floor are ignored), exiting with status 1 if there are any """
+    old, new = [dict((record_key(r), r) for r in json.load(f)['records']) for f in (args.old, args.new)]
+    regressions = []
+    for key in sorted(set(old) & set(new)):
+        o, n = old[key], new[key]
+        if n['seconds'] > args.time_factor * o['seconds']:
+            regressions.append((key, 'time', o['seconds'], n['seconds']))
+        if o['rel_error'] is None:
+            continue
+        if n['rel_error'] is None:
+            regressions.append((key, 'failed', o['value'], None))
+        elif n['rel_error'] > args.error_factor * max(o['rel_error'], args.error_floor):
+            regressions.append((key, 'error', o['rel_error'], n['rel_error']))
+    for key, kind, before, after in regressions:
+        print "{:>8} {:<60} {!r:>24} -> {!r}".format(kind, key, before, after)
+    missing = set(old) - set(new)
+    if missing:
+        print len(missing), "benchmarks missing from", args.new.name
+    print len(regressions), "regressions in", len(set(old) & set(new)), "benchmarks"
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    run_args = subparsers.add_parser('run', help='Run the benchmarks, writing a JSON report')
+    run_args.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout,
+            help='Report file [default: stdout]')
+    run_args.add_argument('-r', '--repeat', type=int, default=3,
+            help='Time each benchmark as the best of this many runs. [default: %(default)s]')
+    run_args.add_argument('--quick', action='store_true', default=False, help='Use a smaller grid')
+    run_args.add_argument('-v', '--verbose', action='store_true', default=False)
+    run_args.set_defaults(func=run)
+
+    compare_args = subparsers.add_parser('compare', help='Compare two reports, listing regressions')
+    compare_args.add_argument('old', type=argparse.FileType('r'))
+    compare_args.add_argument('new', type=argparse.FileType('r'))
+    compare_args.add_argument('--time-factor', type=float, default=1.5,
+            help='Flag benchmarks which got slower by more than this factor. [default: %(default)s]')
+    compare_args.add_argument('--error-factor', type=float, default=10.0,
+            help='Flag benchmarks whose relative error grew by more than this factor. [default: %(default)s]')
+    compare_args.add_argument('--error-floor', type=float, default=1e-12,
+            help='Relative errors below this are treated as equal. [default: %(default)s]')
+    compare_args.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,3 +2,9 @@
 # Want for the BetaRat constructor to be accessible from the main package directly
 from betarat import BetaRat, VERBOSE, defaults
 
+from batch import BetaRatBatch
+from sweep import TableSweep
+import cache
+import lookup
+import instrument
+import backends
@@ -0,0 +1,160 @@
+"""
+Asymptotic approximations to the BetaRat distribution, for tables with large counts. For X ~ Beta(a, b), log(X)
+has the cumulant generating function K(s) = lnB(a + s, b) - lnB(a, b), so that log(W) = log(X1) - log(X2) has
+
+    K(s) = lnB(a1 + s, b1) - lnB(a1, b1) + lnB(a2 - s, b2) - lnB(a2, b2),    -a1 < s < a2
+
+As the counts grow, log(W) tends to a normal distribution with mean K'(0) and variance K''(0) (the delta method
+normal). Since K is available in closed form, we can do better with a saddlepoint approximation, which is far
+more accurate, particularly in the tails. Each approximation comes with an estimate of its error, taken from the
+magnitude of the next term in its expansion, so that BetaRat can decide when the approximation is good enough to
+use in place of the (much more expensive) numerical computations.
+"""
+
+from __future__ import division
+from scipy.special import gammaln, polygamma, ndtr, ndtri
+from scipy import optimize
+import numpy as np
+import math
+
+
+SQRT_2PI = math.sqrt(2 * math.pi)
+
+def normal_density(x):
+    return math.exp(-x * x / 2) / SQRT_2PI
+
+
+class Asymptotic(object):
+    """ Asymptotic approximations to the BetaRat distribution with parameters a1, a2, b1, b2. The cdf, ppf and
+    mode methods each return a (value, error estimate) pair. """
+    def __init__(self, a1, a2, b1, b2):
+        self.a1, self.a2, self.b1, self.b2 = a1, a2, b1, b2
+        self.mean = self.K(0, 1)
+        self.sd = math.sqrt(self.K(0, 2))
+
+    def K(self, s, order=0):
+        """ The order-th derivative of the cumulant generating function of log(W) at s """
+        a1, a2, b1, b2 = self.a1, self.a2, self.b1, self.b2
+        if order == 0:
+            return (gammaln(a1 + s) - gammaln(a1 + b1 + s) - gammaln(a1) + gammaln(a1 + b1) +
+                    gammaln(a2 - s) - gammaln(a2 + b2 - s) - gammaln(a2) + gammaln(a2 + b2))
+        n = order - 1
+        return (polygamma(n, a1 + s) - polygamma(n, a1 + b1 + s) +
+                (-1) ** order * (polygamma(n, a2 - s) - polygamma(n, a2 + b2 - s)))
+
+    def standardized_cumulant(self, s, order):
+        "lambda_k(s) = K^(k)(s) / K''(s)^(k/2)"
+        return self.K(s, order) / self.K(s, 2) ** (order / 2)
+
+    def correction(self, s):
+        """ Leading relative correction to the saddlepoint density at s, lambda_4/8 - 5 lambda_3^2/24 """
+        return self.standardized_cumulant(s, 4) / 8 - 5 * self.standardized_cumulant(s, 3) ** 2 / 24
+
+    def saddlepoint(self, x):
+        """ Solves K'(s) = x for s. K' is increasing, running from -inf to inf over (-a1, a2), so we expand out from
+        the normal approximation s = (x - mean) / var until we have a bracket. """
+        f = lambda s: self.K(s, 1) - x
+        guess = (x - self.mean) / self.sd ** 2
+        lo, hi = -self.a1, self.a2
+        step = max(abs(guess), 1e-8)
+        s_lo, s_hi = max(guess - step, (lo + guess) / 2), min(guess + step, (hi + guess) / 2)
+        while f(s_lo) > 0:
+            s_lo = (lo + s_lo) / 2
+        while f(s_hi) < 0:
+            s_hi = (hi + s_hi) / 2
+        return optimize.brentq(f, s_lo, s_hi, xtol=1e-14, rtol=1e-14)
+
+    def normal_cdf(self, w):
+        """ Delta method normal approximation to CDF(w). The error estimate is the magnitude of the first
+        Edgeworth correction at w, (skewness/6) He_2(z) phi(z). """
+        z = (math.log(w) - self.mean) / self.sd
+        skewness = self.K(0, 3) / self.sd ** 3
+        return ndtr(z), abs(skewness / 6 * (z * z - 1) * normal_density(z))
+
+    def edgeworth_cdf(self, x):
+        """ Second order Edgeworth approximation to the CDF of log(W) at x, with the magnitude of the third order
+        terms as the error estimate. This is only used near the mean, where it is as accurate as the saddlepoint
+        approximation, but doesn't suffer from its numerical indeterminacy. """
+        z = (x - self.mean) / self.sd
+        g3, g4, g5 = [self.K(0, k) / self.sd ** k for k in (3, 4, 5)]
+        z2 = z * z
+        he2, he3, he4 = z2 - 1, z * (z2 - 3), z2 * (z2 - 6) + 3
+        he5, he6 = z * (z2 * (z2 - 10) + 15), z2 * (z2 * (z2 - 15) + 45) - 15
+        he8 = z2 * (z2 * (z2 * (z2 - 28) + 210) - 420) + 105
+        phi = normal_density(z)
+        value = ndtr(z) - phi * (g3 / 6 * he2 + g4 / 24 * he3 + g3 * g3 / 72 * he5)
+        third_order = phi * (g5 / 120 * he4 + g3 * g4 / 144 * he6 + g3 ** 3 / 1296 * he8)
+        return value, abs(third_order)
+
+    def saddlepoint_cdf(self, x):
+        """ Lugannani-Rice saddlepoint approximation to the CDF of log(W) at x. The error estimate is the
+        magnitude of the second order terms of the expansion (Daniels, 1987), plus an allowance for the rounding
+        error in r, which the 1/r terms amplify as x approaches the mean. """
+        s = self.saddlepoint(x)
+        k2 = self.K(s, 2)
+        r = math.copysign(math.sqrt(max(2 * (s * x - self.K(s)), 0)), s)
+        u = s * math.sqrt(k2)
+        phi = normal_density(r)
+        value = ndtr(r) + phi * (1 / r - 1 / u)
+        second_order = phi * (self.correction(s) / u - self.standardized_cumulant(s, 3) / (2 * u * u) -
+                1 / u ** 3 + 1 / r ** 3)
+        rounding = phi * self.K_rounding(s) * (1 / abs(r) ** 3 + 3 / abs(r) ** 5)
+        return min(max(value, 0.0), 1.0), abs(second_order) + rounding
+
+    def K_rounding(self, s):
+        "Rough bound on the rounding error of K(s), which is a difference of (potentially large) log gammas"
+        return 4 * np.finfo(float).eps * (abs(gammaln(self.a1 + s)) + abs(gammaln(self.a1 + self.b1 + s)) +
+                abs(gammaln(self.a2 - s)) + abs(gammaln(self.a2 + self.b2 - s)) + abs(self.K(s)))
+
+    def log_cdf(self, x):
+        """ Best available approximation to the CDF of log(W) at x: the saddlepoint approximation, or the
+        Edgeworth approximation within half a standard deviation of the mean. """
+        if abs(x - self.mean) < 0.5 * self.sd:
+            return self.edgeworth_cdf(x)
+        return self.saddlepoint_cdf(x)
+
+    def log_density(self, w):
+        "Log of the saddlepoint approximation to the density of W at w"
+        x = math.log(w)
+        s = self.saddlepoint(x)
+        return self.K(s) - s * x - 0.5 * math.log(2 * math.pi * self.K(s, 2)) - x
+
+    def cdf(self, w):
+        "Best available approximation to CDF(w), as a (value, error estimate) pair"
+        if w <= 0:
+            return 0.0, 0.0
+        if math.isinf(w):
+            return 1.0, 0.0
+        return self.log_cdf(math.log(w))
+
+    def ppf(self, q):
+        """ Approximate quantile, found by solving the approximate CDF(w) = q over log(w), starting from the normal
+        approximation. The error estimate is that of the CDF at the solution, divided by the density there. """
+        x0 = self.mean + self.sd * ndtri(q)
+        f = lambda x: self.log_cdf(x)[0] - q
+        lo, hi = x0 - self.sd, x0 + self.sd
+        while f(lo) > 0:
+            lo -= self.sd
+        while f(hi) < 0:
+            hi += self.sd
+        x = optimize.brentq(f, lo, hi, xtol=1e-14, rtol=1e-14)
+        w = math.exp(x)
+        return w, self.log_cdf(x)[1] / math.exp(self.log_density(w))
+
+    def mode(self):
+        """ Mode of the saddlepoint density of W. Setting the derivative of its log to zero gives an equation
+        in the saddlepoint s alone, -s - K'''(s) / (2 K''(s)^2) - 1 = 0, since dx/ds = K''(s). The error estimate
+        is the shift in the mode that the leading correction to the density would produce, found by a first
+        order expansion about the mode. """
+        h = lambda s: -s - self.K(s, 3) / (2 * self.K(s, 2) ** 2) - 1
+        s0 = -1.0
+        lo, hi = max(s0 - 1, (s0 - self.a1) / 2), min(s0 + 1, (s0 + self.a2) / 2)
+        while h(lo) < 0:
+            lo = (lo - self.a1) / 2
+        while h(hi) > 0:
+            hi = (hi + self.a2) / 2
+        s = optimize.brentq(h, lo, hi, xtol=1e-14, rtol=1e-14)
+        w = math.exp(self.K(s, 1))
+        delta = 1e-4 * math.sqrt(1 / self.K(s, 2))
+        shift = (self.correction(s + delta) - self.correction(s - delta)) / (2 * delta)
+        return w, w * abs(shift)
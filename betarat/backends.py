@@ -0,0 +1,229 @@
+"""
+Registry of the implementations ("backends") of the hypergeometric function 2F1(a, b; c; z) used in computing the
+BetaRat density, and a dispatcher which picks one for each evaluation. The registered backends are
+
+    mpmath      mpmath.hyp2f1; valid everywhere, but slow
+    rf_hyp2f1   betarat.rf_hyp2f1 (when it has been built), which has an array kernel; only for integer b <= 0 and
+                0 <= z <= 1, as in the density for integer priors
+    scipy       scipy.special.hyp2f1; only where consecutive terms of the series fall off by at least half, so that
+                neither slow convergence nor cancellation can cost it accuracy (near the tails of the density)
+
+and others (say, new array kernels) can be added with `register`. Each backend is only imported the first time it
+is used, so importing betarat doesn't pull in every numeric library up front.
+
+The "auto" dispatcher sorts evaluations into regimes by which backends are valid for them and by the size of |b|
+(which the costs of the series scale with), and evaluates each regime with the cheapest of its valid backends. Costs
+are measured: the first time a (backend, |b| size) pair comes up, the backend is timed on a few of the evaluations
+at hand. Backends are named by the "hyp2f1" setting of BetaRat methods (see betarat.defaults), and pdf and logpdf
+also accept a plain hyp2f1 function as before.
+"""
+
+from __future__ import division
+from collections import OrderedDict
+import numpy as np
+import threading
+import time
+import math
+import instrument
+
+
+class Backend(object):
+    """ A hyp2f1 implementation. load() imports it, returning a triple (scalar, array, native) where scalar is a
+    function of (a, b, c, z), array evaluates over arrays of z for scalar a, b and c (or is None if there's no such
+    kernel), and native is the library's own function, which users may pass in directly. valid(a, b, c, z) is a
+    mask over the (broadcast) arrays of which evaluations the backend can be trusted with. """
+    def __init__(self, name, load, valid=None):
+        self.name = name
+        self.load = load
+        self.valid = valid or (lambda a, b, c, z: np.ones(np.broadcast(a, b, c, z).shape, dtype=bool))
+        self.functions = None
+        self.error = None
+
+    def __repr__(self):
+        return "Backend({!r})".format(self.name)
+
+    def available(self):
+        "Whether the backend can be imported (importing it if it hasn't been already)"
+        if self.functions is None and self.error is None:
+            try:
+                self.functions = self.load()
+            except ImportError as e:
+                self.error = e
+        return self.functions is not None
+
+    def __call__(self, a, b, c, z):
+        """ Evaluate over (broadcast) arrays of parameters and z, returning an ndarray of floats, or a float for
+        scalar arguments """
+        if not self.available():
+            raise ImportError("hyp2f1 backend {!r} is unavailable: {}".format(self.name, self.error))
+        scalar, array, _ = self.functions
+        if not np.ndim(a) and not np.ndim(b) and not np.ndim(c):
+            if not np.ndim(z):
+                return float(scalar(a, b, c, z))
+            if array is not None:
+                return array(a, b, c, np.asarray(z, dtype=float))
+        return np.frompyfunc(scalar, 4, 1)(a, b, c, z).astype(float)
+
+
+def load_mpmath():
+    import mpmath
+    return mpmath.hyp2f1, None, mpmath.hyp2f1
+
+def load_rf_hyp2f1():
+    import rf_hyp2f1
+    return (lambda a, b, c, z: rf_hyp2f1.hyp2f1(a, int(b), c, z),
+            lambda a, b, c, z: rf_hyp2f1.hyp2f1_array(a, int(b), c, z),
+            rf_hyp2f1.hyp2f1)
+
+def load_scipy():
+    from scipy.special import hyp2f1
+    return hyp2f1, hyp2f1, hyp2f1
+
+def rf_hyp2f1_valid(a, b, c, z):
+    return (b <= 0) & (b % 1 == 0) & (z >= 0) & (z <= 1)
+
+def scipy_valid(a, b, c, z):
+    """ The ratio of consecutive series terms, z (a + k)(b + k) / ((c + k)(k + 1)), is at most
+    z max(|b|, 1) max(a / c, 1) <= z (|b| + 1)(a / c + 1) in absolute value for a, c > 0. (Written with plain
+    operators, which are much quicker than numpy functions on scalars.) """
+    bound = z * (abs(b) + 1) * (a / (c + (c <= 0)) + 1)
+    return (a > 0) & (c > 0) & (z >= 0) & (bound <= 0.5)
+
+
+registry = OrderedDict()
+
+def register(backend):
+    """ Add backend to the registry (replacing any of the same name), making it available to the dispatcher """
+    registry[backend.name] = backend
+    with costs_lock:
+        for key in [key for key in costs if key[0] == backend.name]:
+            del costs[key]
+        choices.clear()
+    return backend
+
+
+# Measured seconds per evaluation, keyed by (backend name, |b| size class), and the backend chosen for each regime,
+# keyed by (names of the valid backends, |b| size class)
+costs = {}
+choices = {}
+costs_lock = threading.Lock()
+
+def size_class(b):
+    "Size class of |b|: 0 for |b| <= 1, then one class per doubling"
+    return np.floor(np.log2(np.maximum(np.abs(b), 1))).astype(int)
+
+def cost(backend, size, a, b, c, z):
+    """ Per evaluation cost of backend in the given size class, measured the first time it's needed on (up to
+    8 of) the evaluations given, as the best of a few runs (the first of which warms the backend up) """
+    key = (backend.name, size)
+    if key not in costs:
+        a, b, c, z = [np.atleast_1d(x)[:8] for x in (a, b, c, z)]
+        times = []
+        for _ in xrange(3):
+            start = time.time()
+            backend(a, b, c, z)
+            times.append(time.time() - start)
+        measured = min(times) / len(z)
+        with costs_lock:
+            costs.setdefault(key, measured)
+    return costs[key]
+
+
+def regime_choice(candidates, size, a, b, c, z):
+    "Name of the cheapest of the candidate backends for |b| size class size, measuring costs on a, b, c, z"
+    key = (tuple(backend.name for backend in candidates), size)
+    if key not in choices:
+        chosen = min(candidates, key=lambda backend: cost(backend, size, a, b, c, z))
+        with costs_lock:
+            choices.setdefault(key, chosen.name)
+    return choices[key]
+
+
+def choose(a, b, c, z):
+    """ Name of the backend the dispatcher would use for each of the (broadcast) evaluations, as an array (None
+    where no backend is valid) """
+    a, b, c, z = [np.asarray(x, dtype=float).ravel() for x in np.broadcast_arrays(a, b, c, z)]
+    names = np.empty(len(z), dtype=object)
+    backends = [backend for backend in registry.values() if backend.available()]
+    if not len(z) or not backends:
+        return names
+    valid = np.column_stack([backend.valid(a, b, c, z) for backend in backends])
+    sizes = size_class(b)
+    # Each regime is a combination of valid backends and size class
+    regimes = np.column_stack([valid, sizes])
+    for regime in np.unique(regimes, axis=0):
+        rows = np.flatnonzero(np.all(regimes == regime, axis=1))
+        candidates = [backend for backend, ok in zip(backends, regime[:-1]) if ok]
+        if candidates:
+            names[rows] = regime_choice(candidates, regime[-1], a[rows], b[rows], c[rows], z[rows])
+    return names
+
+
+def choose_scalar(a, b, c, z):
+    """ choose, for evaluations sharing the scalar parameters a, b and c, returning the name of a backend valid
+    for all of z (which is much quicker than choose), or None if there isn't one """
+    candidates = [backend for backend in registry.values()
+            if backend.available() and np.all(backend.valid(a, b, c, z))]
+    if not candidates:
+        return None
+    return regime_choice(candidates, int(math.floor(math.log(max(abs(b), 1), 2))), a, b, c, z)
+
+
+def auto(a, b, c, z):
+    """ Evaluate 2F1 over (broadcast) arrays of parameters and z, each with the cheapest valid backend. Returns a
+    float for scalar arguments. """
+    if not any(np.ndim(x) for x in (a, b, c)):
+        # A backend valid for every z (as is usual along a quadrature rule) takes them all in one call
+        name = choose_scalar(a, b, c, z)
+        if name is not None or not np.ndim(z):
+            return registry[name](a, b, c, z)
+    shape = np.broadcast(a, b, c, z).shape
+    names = choose(a, b, c, z)
+    a, b, c, z = [np.asarray(x, dtype=float).ravel() for x in np.broadcast_arrays(a, b, c, z)]
+    uniform = all(np.all(x == x[:1]) for x in (a, b, c))
+    result = np.empty(len(z))
+    for name in set(names):
+        rows = names == name
+        if uniform:
+            # Keeps the parameters scalar, so that array kernels can be used
+            result[rows] = registry[name](a[0], b[0], c[0], z[rows])
+        else:
+            result[rows] = registry[name](a[rows], b[rows], c[rows], z[rows])
+    return result.reshape(shape)
+
+
+def resolve(hypf):
+    """ The function of (a, b, c, z) for the hyp2f1 setting hypf: a backend name, "auto" (or None) for the
+    dispatcher, or a hyp2f1 function, which is returned as is """
+    if hypf is None or hypf == 'auto':
+        return auto
+    if callable(hypf):
+        return hypf
+    try:
+        return registry[hypf]
+    except KeyError:
+        raise ValueError("Unknown hyp2f1 backend {!r}; choose from auto, {}".format(hypf, ', '.join(registry)))
+
+
+@instrument.timed('hyp2f1', lambda hypf, a, b, c, z: np.broadcast(a, b, c, z).size)
+def evaluate(hypf, a, b, c, z):
+    """ Evaluate 2F1(a, b; c; z) with the hyp2f1 setting hypf (see resolve) over scalars or arrays, returning a
+    float or an ndarray of floats. Plain functions are called directly for scalars; over arrays, numpy ufuncs are
+    applied directly, and other functions are broadcast. """
+    f = resolve(hypf)
+    if f is auto or isinstance(f, Backend):
+        return f(a, b, c, z)
+    if not any(np.ndim(x) for x in (a, b, c, z)):
+        return f(a, b, c, z)
+    if isinstance(f, np.ufunc):
+        return f(a, b, c, z)
+    for backend in registry.values():
+        # A registered backend's own function, passed in directly, still gets its array kernel
+        if backend.available() and f is backend.functions[2]:
+            return backend(a, b, c, z)
+    return np.frompyfunc(f, 4, 1)(a, b, c, z).astype(float)
+
+
+register(Backend('mpmath', load_mpmath))
+register(Backend('rf_hyp2f1', load_rf_hyp2f1, rf_hyp2f1_valid))
+register(Backend('scipy', load_scipy, scipy_valid))
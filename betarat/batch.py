@@ -0,0 +1,225 @@
+"""
+This module implements BetaRatBatch, for evaluating BetaRat quantities over large numbers of contingency tables
+at once. Tables are folded together when they are duplicates of one another, or when one is the inverse of the
+other (in the sense of BetaRat.invert), so that the amount of actual computation scales with the number of
+distinct tables rather than the number of rows. The distinct pieces of work can optionally be farmed out to a
+multiprocessing pool.
+"""
+
+import numpy as np
+from betarat import BetaRat, defaults, hyp2f1
+from scipy.special import betaln
+import lookup
+import montecarlo
+import mode
+
+
+# Number of tables per pool task when solving for modes in bulk
+MODE_CHUNK_SIZE = 64
+
+
+def _evaluate_table(task):
+    """ Compute a quantity for one distinct table at each of the requested arguments. This lives at the module
+    level so that it can be sent to multiprocessing workers. """
+    params, inverted, quantity, args, kw_args = task
+    if inverted:
+        params = (params[1], params[0], params[3], params[2])
+    br = BetaRat(*params, no_inverting=True, prior=(0, 0))
+    fn = getattr(br, quantity)
+    return [fn(arg, **kw_args) for arg in args]
+
+
+def _find_modes(task):
+    """ Modes of each row of a parameter array, solved for together (see betarat.mode). Module level, so that
+    it can be sent to multiprocessing workers. """
+    params, kw_args = task
+    return mode.find_modes(*params.T, hypf=kw_args.get('hyp2f1', defaults['hyp2f1']),
+            maxiter=kw_args.get('optim_maxiter', defaults['optim_maxiter']))
+
+
+class BetaRatBatch(object):
+    """ Collection of BetaRat distributions, one per row of the a1, a2, b1, b2 arrays (which are counts, as
+    for the BetaRat constructor). The posterior parameters are held as parallel columns rather than as BetaRat
+    objects, and each method returns an ndarray with one value per row. """
+    def __init__(self, a1, a2, b1, b2, no_inverting=False, prior=(1.0, 1.0)):
+        a1, a2, b1, b2 = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (a1, a2, b1, b2)])
+        self.a1, self.a2 = a1.ravel() + prior[0], a2.ravel() + prior[0]
+        self.b1, self.b2 = b1.ravel() + prior[1], b2.ravel() + prior[1]
+        params = np.column_stack([self.a1, self.a2, self.b1, self.b2])
+        if no_inverting:
+            self.inverted = np.zeros(len(params), dtype=bool)
+        else:
+            # Vectorized form of utils.canonical_params
+            cross1, cross2 = self.a1 * self.b2, self.a2 * self.b1
+            self.inverted = (cross1 > cross2) | ((cross1 == cross2) &
+                    ((self.a2 < self.a1) | ((self.a2 == self.a1) & (self.b2 < self.b1))))
+            params[self.inverted] = params[self.inverted][:, [1, 0, 3, 2]]
+        if len(params):
+            self.tables, self.table_index = np.unique(params, axis=0, return_inverse=True)
+        else:
+            self.tables, self.table_index = params, np.zeros(0, dtype=int)
+        self._log_norms = None
+
+    def __len__(self):
+        return len(self.table_index)
+
+    def __repr__(self):
+        return "BetaRatBatch(<{} rows, {} distinct tables>)".format(len(self), len(self.tables))
+
+    def __getitem__(self, i):
+        "The BetaRat of row i"
+        return BetaRat(float(self.a1[i]), float(self.a2[i]), float(self.b1[i]), float(self.b2[i]),
+                no_inverting=not self.inverted[i], prior=(0, 0))
+
+    def __iter__(self):
+        return (self[i] for i in xrange(len(self)))
+
+    @property
+    def log_norms(self):
+        "Columns of the logs of the normalizing constants (A, Blt, Bgt) of each row (see BetaRat.log_norms)"
+        if self._log_norms is None:
+            self._log_norms = (betaln(self.a1, self.b1) + betaln(self.a2, self.b2),
+                    betaln(self.a1 + self.a2, self.b2), betaln(self.a1 + self.a2, self.b1))
+        return self._log_norms
+
+    def logpdf(self, w, hypf=None):
+        """ Log density of each row at w (a scalar, or one value per row), with hyp2f1 computed according to
+        hypf (as for BetaRat.pdf) """
+        w = np.broadcast_to(np.asarray(w, dtype=float), (len(self),))
+        result = np.full(len(self), -np.inf)
+        log_a, log_blt, log_bgt = self.log_norms
+        a = self.a1 + self.a2
+        left = np.flatnonzero((w > 0) & (w <= 1))
+        if len(left):
+            result[left] = (log_blt[left] - log_a[left] + (self.a1[left] - 1) * np.log(w[left]) +
+                    np.log(hyp2f1(hypf, a[left], 1 - self.b1[left], a[left] + self.b2[left], w[left])))
+        right = np.flatnonzero(w > 1)
+        if len(right):
+            result[right] = (log_bgt[right] - log_a[right] - (1 + self.a2[right]) * np.log(w[right]) +
+                    np.log(hyp2f1(hypf, a[right], 1 - self.b2[right], a[right] + self.b1[right], 1 / w[right])))
+        return result
+
+    def pdf(self, w, hypf=None):
+        "Density of each row at w (a scalar, or one value per row)"
+        return np.exp(self.logpdf(w, hypf))
+
+    def _evaluate(self, quantity, args, oriented, pool, kw_args, width=None):
+        """ Evaluate quantity for each row at the corresponding (canonical) argument, doing the work only once
+        per distinct (table, orientation, argument). When oriented is set, the inverted rows are evaluated on
+        the inverted table rather than folded onto the canonical one. For quantities which are tuples of width
+        values (such as intervals), an array with a column per value is returned. """
+        shape = () if width is None else (width,)
+        if not len(self):
+            return np.empty((0,) + shape)
+        orientation = self.inverted if oriented else np.zeros(len(self), dtype=bool)
+        keys = np.column_stack([self.table_index, orientation, args])
+        work, work_index = np.unique(keys, axis=0, return_inverse=True)
+        work_results = np.full((len(work),) + shape, np.nan)
+        todo = np.ones(len(work), dtype=bool)
+
+        params = self.tables[work[:, 0].astype(int)]
+        inverted = work[:, 1].astype(bool)
+        params[inverted] = params[inverted][:, [1, 0, 3, 2]]
+
+        # Answer whatever we can from the loaded lookup table (which is indexed by posterior parameters, so the
+        # prior it was built with doesn't need to match ours)
+        lookup_table = lookup.active()
+        if lookup_table is not None and width is None and kw_args.get('method', 'optim') == 'optim':
+            for arg in np.unique(work[:, 2]):
+                column = lookup_table.column(quantity, arg)
+                if column is not None:
+                    rows = np.flatnonzero(work[:, 2] == arg)
+                    work_results[rows] = lookup_table.query(params[rows], column)
+            todo = np.isnan(work_results)
+
+        mapper = pool.map if pool else map
+        if quantity == 'map':
+            # Modes are solved for in bulk rather than table by table
+            todo_rows = np.flatnonzero(todo)
+            chunks = np.array_split(todo_rows, max(1, len(todo_rows) // MODE_CHUNK_SIZE)) if pool else [todo_rows]
+            for rows, results in zip(chunks, mapper(_find_modes, [(params[rows], kw_args) for rows in chunks])):
+                work_results[rows] = results
+            return work_results[work_index]
+
+        tasks = []
+        task_rows = []
+        # work is sorted by table and orientation, so each group of contiguous rows shares a BetaRat
+        todo_rows = np.flatnonzero(todo)
+        bounds = np.flatnonzero(np.any(np.diff(work[todo_rows, :2], axis=0) != 0, axis=1)) + 1
+        for group in np.split(todo_rows, bounds):
+            if not len(group):
+                continue
+            table, inverted = int(work[group[0], 0]), bool(work[group[0], 1])
+            tasks.append((tuple(self.tables[table]), inverted, quantity, list(work[group, 2]), kw_args))
+            task_rows.append(group)
+        for rows, results in zip(task_rows, mapper(_evaluate_table, tasks)):
+            work_results[rows] = [np.nan if r == 'NA' else r for r in results]
+        return work_results[work_index]
+
+    def cdf(self, w=1.0, pool=None, **kw_args):
+        """ Cumulative Density Function at w (a scalar, or one value per row). Keyword args are passed along to
+        BetaRat.cdf. """
+        w = np.broadcast_to(np.asarray(w, dtype=float), (len(self),))
+        with np.errstate(divide='ignore'):
+            args = np.where(self.inverted, 1.0 / w, w)
+        results = self._evaluate('cdf', args, False, pool, kw_args)
+        return np.where(self.inverted, 1 - results, results)
+
+    def cdf_below(self, w, alpha, pool=None, **kw_args):
+        """ Whether CDF(w) < alpha for each row (w and alpha scalars), as a boolean array, deciding as cheaply as
+        possible (see BetaRat.cdf_below). Keyword args are passed along to BetaRat.cdf_below. """
+        w = np.broadcast_to(np.asarray(w, dtype=float), (len(self),))
+        kw_args['alpha'] = alpha
+        return self._evaluate('cdf_below', w, True, pool, kw_args).astype(bool)
+
+    def ppf(self, q, method="optim", pool=None, **kw_args):
+        """ Quantile function at q (a scalar, or one value per row). Keyword args are passed along to
+        BetaRat.ppf; quantiles which could not be computed (see BetaRat.simpson_ppf) come back as nan. """
+        q = np.broadcast_to(np.asarray(q, dtype=float), (len(self),))
+        args = np.where(self.inverted, 1 - q, q)
+        kw_args['method'] = method
+        results = self._evaluate('ppf', args, False, pool, kw_args)
+        with np.errstate(divide='ignore'):
+            return np.where(self.inverted, 1.0 / results, results)
+
+    def credible_interval(self, level=0.95, pool=None, **kw_args):
+        """ Equal tailed credible interval of each row, as a pair of arrays (lower, upper). Keyword args are
+        passed along to ppf. """
+        return (self.ppf((1 - level) / 2, pool=pool, **kw_args),
+                self.ppf((1 + level) / 2, pool=pool, **kw_args))
+
+    def hpd_interval(self, level=0.95, pool=None, **kw_args):
+        """ Highest posterior density interval of each row (see BetaRat.hpd_interval), as a pair of arrays (lower,
+        upper). Since the interval is not preserved under inversion, only exact duplicates are folded together
+        here. Keyword args are passed along to BetaRat.hpd_interval. """
+        bounds = self._evaluate('hpd_interval', np.full(len(self), level), True, pool, kw_args, width=2)
+        return bounds[:, 0], bounds[:, 1]
+
+    def map(self, pool=None, **kw_args):
+        """ Maximum A Posteriori for each row. Since the mode is not preserved under inversion, only exact
+        duplicates are folded together here. The modes of all of the distinct tables are solved for together
+        (see betarat.mode), in chunks spread over the pool if one is given; optim_maxiter caps the iterations. """
+        return self._evaluate('map', np.zeros(len(self)), True, pool, kw_args)
+
+    def rvs(self, size, seed=0, first_row=0):
+        """ size samples for each row, as an array of shape (rows, size). Each row is drawn from its own stream,
+        seeded by (seed, first_row + row), so that workers handling slices of a larger batch draw independently
+        of one another and reproduce exactly what a single process would (see betarat.montecarlo). """
+        return montecarlo.batch_rvs(self.a1, self.a2, self.b1, self.b2, size, seed, first_row)
+
+    def mc_cdf(self, w=1.0, size=10000, seed=0, first_row=0):
+        """ Monte Carlo estimates of CDF(w) (w a scalar, or one value per row), as a pair of arrays (estimates,
+        standard errors). """
+        return self._monte_carlo('cdf', w, size, seed, first_row)
+
+    def mc_ppf(self, q, size=10000, seed=0, first_row=0):
+        """ Monte Carlo estimates of the q quantile (q a scalar, or one value per row), as a pair of arrays
+        (estimates, standard errors). """
+        return self._monte_carlo('ppf', q, size, seed, first_row)
+
+    def _monte_carlo(self, quantity, args, size, seed, first_row):
+        args = np.broadcast_to(np.asarray(args, dtype=float), (len(self),))
+        estimates, ses = np.empty(len(self)), np.empty(len(self))
+        for i, samples in enumerate(self.rvs(size, seed, first_row)):
+            estimates[i], ses[i] = getattr(montecarlo.MonteCarlo(samples), quantity)(args[i])
+        return estimates, ses
@@ -1,10 +1,23 @@
 #!/usr/bin/env python
 from __future__ import division
-from scipy import integrate, optimize
-from scipy.special import beta
-from simpson_quant import simpson_quant_hp, MaxSumReached
-from utils import plot_fn
-import mpmath
+from scipy import optimize
+from scipy.special import betaln, ndtri
+from simpson_quant import simpson_quant_hp, MaxSumReached, MissingMass
+from utils import plot_fn, canonical_params
+from exact_cdf import exact_cdf, is_integral, n_terms
+from asymptotic import Asymptotic
+from quadrature import legendre_nodes
+import montecarlo
+import mode
+import backends
+import quadrature
+from functools import wraps
+import cache
+import lookup
+import instrument
+import numpy as np
+import threading
+import bisect
 import math
 
 
@@ -14,11 +27,14 @@ VERBOSE = False
 
 
 
-# Specification of underlying scipy optimize and integrate function call maxiter defaults; other stuff might
+# Specification of the optimize and quadrature maxiter defaults, among other settings; other stuff might
 # live here eventually, but for now
 defaults = dict(
         quadr_maxiter=50,
-        optim_maxiter=75)
+        optim_maxiter=75,
+        exact_max_terms=500,
+        approx_tol=1e-8,
+        hyp2f1='auto')
 
 def apply_defaults(func):
     "Decorator for applying defaults to various functions"
@@ -30,6 +46,133 @@ def apply_defaults(func):
     return decorated
 
 
+def reciprocal(w):
+    "1/w, taking every w <= 0 (where the CDF is 0) to inf, and inf to 0"
+    if w <= 0:
+        return float('inf')
+    return 1.0 / w
+
+# How to fold the argument and result of cached quantities onto the inverse distribution: CDF(w) = 1 - CDF'(1/w)
+# and PPF(q) = 1 / PPF'(1 - q). Quantities without an entry here (such as the MAP) aren't preserved by inversion,
+# so they are cached separately for each orientation.
+cache_folding = dict(
+        cdf=(reciprocal, lambda p: 1 - p),
+        optim_ppf=(lambda q: 1 - q, reciprocal))
+
+# Tracks whether we're already inside of a cached computation, so that intermediate results (such as the CDF
+# evaluations made while solving for a quantile) don't flood the cache
+cache_state = threading.local()
+
+def cached(quantity):
+    """ Decorator for answering a method from the loaded lookup table (see betarat.lookup) when the table is
+    in its grid, and otherwise looking up (and storing) its results in the active result cache, if caching has
+    been turned on (see betarat.cache). Should be applied inside of apply_defaults, so that the full set of
+    settings ends up in the cache key. """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kw_args):
+            if len(args) != (quantity in cache_folding) or (args and np.ndim(args[0]) > 0):
+                # Only single results are looked up (not, say, a list of quantiles)
+                return method(self, *args, **kw_args)
+            table = lookup.active()
+            if table is not None:
+                found = table.find(self.a1, self.a2, self.b1, self.b2, quantity, *args)
+                if found is not None:
+                    return found
+            result_cache = cache.active()
+            if result_cache is None or getattr(cache_state, 'busy', False):
+                return method(self, *args, **kw_args)
+            params, inverted = canonical_params(self.a1, self.a2, self.b1, self.b2)
+            if quantity in cache_folding:
+                fold, unfold = cache_folding[quantity]
+                key = cache.make_key(params, quantity, fold(args[0]) if inverted else args[0], kw_args)
+            else:
+                key = cache.make_key(params, quantity + ('~' if inverted else ''), None, kw_args)
+            found = result_cache.get(key)
+            if found is not None:
+                value, stored_inverted = found
+                return value if stored_inverted == inverted else unfold(value)
+            cache_state.busy = True
+            try:
+                result = method(self, *args, **kw_args)
+            finally:
+                cache_state.busy = False
+            if result != 'NA':
+                result_cache.put(key, (float(result), inverted))
+            return result
+        return wrapper
+    return decorator
+
+
+# Largest Gauss-Legendre order tried by cdf_below before falling back on cdf, the factor by which the difference
+# between successive orders is inflated to bound the error of the larger one, and the least error bound (so that
+# ties within rounding error are left to cdf)
+SCREEN_MAX_ORDER = 64
+SCREEN_SAFETY = 10.0
+SCREEN_MIN_ERROR = 1e-10
+
+def hyp2f1(hypf, a, b, c, z):
+    """ 2F1(a, b; c; z) over a scalar or array of z, by the hyp2f1 setting hypf: a backend name, 'auto' or a
+    hyp2f1 function (see betarat.backends), with None meaning defaults['hyp2f1'] """
+    return backends.evaluate(defaults['hyp2f1'] if hypf is None else hypf, a, b, c, z)
+
+
+class CdfSweep(object):
+    """ Keeps track of the CDF values found at each point probed while solving for quantiles, so that the CDF
+    at each new point only requires integrating the increment from the nearest probed point below it (or, where
+    the CDF is computed exactly, only the CDF at the new point), and so that several quantiles can be bracketed
+    from the same set of points. """
+    def __init__(self, beta_rat, **kw_args):
+        """ kw_args are passed along to BetaRat.mass """
+        self.beta_rat = beta_rat
+        self.kw_args = kw_args
+        self.points = [0.0]
+        self.values = [0.0]
+
+    def __call__(self, x):
+        i = bisect.bisect_right(self.points, x) - 1
+        if self.points[i] == x:
+            return self.values[i]
+        br = self.beta_rat
+        if br.exact_cdf_applies(x, self.kw_args.get('exact_max_terms', defaults['exact_max_terms'])):
+            value = exact_cdf(br.a1, br.a2, br.b1, br.b2, x)
+        else:
+            value = self.values[i] + br.mass(self.points[i], x, **self.kw_args)
+        self.points.insert(i + 1, x)
+        self.values.insert(i + 1, value)
+        return value
+
+    def extend_to(self, q):
+        """ Double the largest probed point (starting from 1) until the CDF there exceeds q """
+        x = max(self.points[-1], 1.0)
+        while self(x) <= q:
+            x *= 2
+            instrument.count('bracket_doublings')
+        return x
+
+    def bracket(self, q):
+        """ Tightest pair of probed points (lo, hi) with CDF(lo) <= q < CDF(hi) """
+        self.extend_to(q)
+        i = bisect.bisect_right(self.values, q)
+        return self.points[i - 1], self.points[i]
+
+    def bracket_near(self, q, guess):
+        """ bracket, searching outwards from a guess at the quantile (such as that of a neighbouring table; see
+        BetaRat.update) rather than doubling from 1. A Newton step from the guess gives the centre of the search,
+        and steps out from there start at a quarter of the Newton step and double until the CDF crosses q. """
+        x = guess
+        density = self.beta_rat.pdf(x, hypf=self.kw_args.get('hyp2f1'))
+        if density > 0:
+            x = min(max(x - (self(guess) - q) / density, guess / 2), 2 * guess)
+        step = max(abs(x - guess) / 4, 1e-6 * x)
+        direction = 1 if self(x) <= q else -1
+        while (self(x) <= q) == (direction > 0):
+            x = max(x + direction * step, 0.0)
+            step *= 2
+            instrument.count('bracket_doublings')
+        return self.bracket(q)
+
+
 def invert_ppf_if_needed(orig_ppf):
     """ This decorator clean up the logic of evaluating the ppf using the inverse ratio x2/x1 when we would
     estimate that it is > 1. This speeds up some computations using the simpson_quant_hp. """
@@ -45,149 +188,469 @@ def invert_ppf_if_needed(orig_ppf):
 
 
 class BetaRat(object):
-    """ BetaRat class - representation of the Beta Ratio distribution. """
+    """ BetaRat class - representation of the Beta Ratio distribution. Instances are immutable and slotted, so
+    that large populations of them stay compact: the inverse distribution and the normalizing constants are
+    only computed when first needed. """
+    __slots__ = ('a1', 'a2', 'b1', 'b2', '_invertible', '_inverse', '_log_norms', '_solutions', '_hints')
+
     def __init__(self, a1, a2, b1, b2, no_inverting=False, prior=(1.0, 1.0)):
         """ Arguments a1, a2, b1, b2 are the beta parameters for distributions X1 and X2. Now can specify a
         prior which will be tacked on to (a1, b1) and (a2, b2). """
-        # See invert_pdf_if_needed for explanation of this madness
-        self.a1, self.a2, self.b1, self.b2 = a1 + prior[0], a2 + prior[0], b1 + prior[1], b2 + prior[1]
-        if a1*b2 > a2*b1 and not no_inverting:
-            self.inverted = self.invert()
-        else:
-            self.inverted = False
+        self._set(a1 + prior[0], a2 + prior[0], b1 + prior[1], b2 + prior[1], a1*b2 > a2*b1 and not no_inverting)
+
+    def _set(self, a1, a2, b1, b2, invertible):
+        for name, value in zip(self.__slots__, (a1, a2, b1, b2, invertible, None, None, None, None)):
+            object.__setattr__(self, name, value)
 
-        self.A = beta(self.a1, self.b1) * beta(self.a2, self.b2)
-        self.Blt = beta(self.a1 + self.a2, self.b2) 
-        self.Bgt = beta(self.a1 + self.a2, self.b1)
+    def __setattr__(self, name, value):
+        raise AttributeError("BetaRat objects are immutable")
+
+    def __getstate__(self):
+        return self.a1, self.a2, self.b1, self.b2, self._invertible
+
+    def __setstate__(self, state):
+        self._set(*state)
 
     def __repr__(self):
         rep = "BetaRat({}, {}, {}, {})".format(self.a1, self.a2, self.b1, self.b2)
-        if self.inverted:
+        if self._invertible:
             rep += "<inv>"
         return rep
 
+    @property
+    def inverted(self):
+        """ The inverse distribution (see invert), which some quantities are computed from when the ratio is
+        likely to be > 1, or False if this one isn't to be inverted. Built on first access. """
+        if not self._invertible:
+            return False
+        if self._inverse is None:
+            object.__setattr__(self, '_inverse', self.invert())
+        return self._inverse
+
+    def update(self, da=0, db=0, dc=0, dd=0):
+        """ The posterior after da more successes and dc more failures are observed in X1, and db and dd in X2.
+        The MAP and quantiles already solved for on this posterior (or carried over to it) are carried over to
+        the new one as starting points, so that solving for them again usually takes only a few solver steps.
+        Whether it may be inverted is carried over as well (so that no_inverting sticks). """
+        updated = BetaRat.__new__(BetaRat)
+        updated._set(self.a1 + da, self.a2 + db, self.b1 + dc, self.b2 + dd, self._invertible)
+        hints = dict(self._hints or {})
+        hints.update(self._solutions or {})
+        object.__setattr__(updated, '_hints', hints)
+        return updated
+
+    def solved(self, key, value):
+        "Record value as the solution for key (('map',), ('lt_map',) or ('ppf', q)), as a hint for update"
+        if self._solutions is None:
+            object.__setattr__(self, '_solutions', {})
+        self._solutions[key] = value
+        return value
+
+    def hint(self, key):
+        "Solution for key carried over by update, if any"
+        return self._hints.get(key) if self._hints else None
+
+    @property
+    def log_norms(self):
+        """ Logs of the normalizing constants (A, Blt, Bgt) of the density, computed on first access. Kept in log
+        space, since the Beta functions underflow for large counts. """
+        if self._log_norms is None:
+            object.__setattr__(self, '_log_norms', (
+                    float(betaln(self.a1, self.b1) + betaln(self.a2, self.b2)),
+                    float(betaln(self.a1 + self.a2, self.b2)),
+                    float(betaln(self.a1 + self.a2, self.b1))))
+        return self._log_norms
+
+    @property
+    def A(self):
+        return math.exp(self.log_norms[0])
+
+    @property
+    def Blt(self):
+        return math.exp(self.log_norms[1])
+
+    @property
+    def Bgt(self):
+        return math.exp(self.log_norms[2])
+
     def invert(self):
         """ Return inverted version of this beta ratio... """
         return BetaRat(self.a2, self.a1, self.b2, self.b1, prior=(0,0))
 
-    def h2f1_l(self, w, hypf=mpmath.hyp2f1):
+    def h2f1_l(self, w, hypf=None):
         """ Application of the hypergeometric function for computing the pdf varies depending on whether w < 1
         or not. Left hand side of the function. """
-        return hypf(self.a1 + self.a2, 1 - self.b1, self.a1 + self.a2 + self.b2, w)
+        return hyp2f1(hypf, self.a1 + self.a2, 1 - self.b1, self.a1 + self.a2 + self.b2, w)
 
-    def h2f1_r(self, w, hypf=mpmath.hyp2f1):
+    def h2f1_r(self, w, hypf=None):
         """ Right hand side of the function. """
-        return hypf(self.a1 + self.a2, 1 - self.b2, self.a1 + self.a2 + self.b1, 1.0/w)
+        return hyp2f1(hypf, self.a1 + self.a2, 1 - self.b2, self.a1 + self.a2 + self.b1, 1.0/w)
 
-    def pdf(self, w, hypf=mpmath.hyp2f1):
+    @instrument.timed('pdf', lambda self, w, **kw_args: np.size(w))
+    def pdf(self, w, hypf=None):
         """
         Probability Density Function.
-        hypf argument points to the function to be used for computation of the H2F1 function. This defaults to
-        `mpmath.hyp2f1`. There is also an implementation which relies on the recursively factored form of the
-        function, accessible as `betarat.rf_hyp2f1`. This function can be faster in cases of moderate failure
-        counts, but not generally, and only works when the b_{1,2} are integers. As such, this function only
-        works with priors Beta(a', b') where a' is an integer.
+        hypf chooses how the H2F1 function is computed: by one of the backends registered in betarat.backends
+        ('mpmath', 'rf_hyp2f1' or 'scipy'), by 'auto', which picks the cheapest backend valid for each
+        evaluation, or by a hyp2f1 function such as `mpmath.hyp2f1`, which is called directly. None (the default)
+        means defaults['hyp2f1'], which is 'auto'; the other BetaRat methods take the same setting as their
+        hyp2f1 keyword arg.
+        If w is an array (or list), the density is evaluated over all of it at once and an ndarray is returned.
         """
+        if np.ndim(w) > 0:
+            return np.exp(self.logpdf(w, hypf=hypf))
         if w == 0:
             return 0
-        elif w <= 1:
-            return (self.Blt *
-                (w ** (self.a1 -1)) * 
-                self.h2f1_l(w, hypf=hypf) /
-                self.A)
-
+        log_a, log_blt, log_bgt = self.log_norms
+        if w <= 1:
+            return (float(np.exp(log_blt - log_a + (self.a1 - 1) * math.log(w))) *
+                self.h2f1_l(w, hypf=hypf))
         else:
-            return (self.Bgt *
-                (w ** -(1+self.a2)) *
-                self.h2f1_r(w, hypf=hypf) /
-                self.A)
+            return (float(np.exp(log_bgt - log_a - (1 + self.a2) * math.log(w))) *
+                self.h2f1_r(w, hypf=hypf))
 
-    def pdfs(self, ws):
+    @instrument.timed('pdf', lambda self, w, **kw_args: np.size(w))
+    def logpdf(self, w, hypf=None):
+        """ Log of the Probability Density Function. Accepts either a scalar or an array of w; for arrays, the
+        w <= 1 and w > 1 branches are each evaluated in bulk and an ndarray is returned. The normalizing
+        constants are applied in log space, so this stays finite for large counts where `pdf` underflows. """
+        ws = np.asarray(w, dtype=float)
+        result = np.full(ws.shape, -np.inf)
+        log_a, log_blt, log_bgt = self.log_norms
+        left = (ws > 0) & (ws <= 1)
+        right = ws > 1
+        if left.any():
+            wl = ws[left]
+            result[left] = (log_blt - log_a +
+                    (self.a1 - 1) * np.log(wl) +
+                    np.log(hyp2f1(hypf, self.a1 + self.a2, 1 - self.b1, self.a1 + self.a2 + self.b2, wl)))
+        if right.any():
+            wr = ws[right]
+            result[right] = (log_bgt - log_a -
+                    (1 + self.a2) * np.log(wr) +
+                    np.log(hyp2f1(hypf, self.a1 + self.a2, 1 - self.b2, self.a1 + self.a2 + self.b1, 1.0/wr)))
+        if result.ndim == 0:
+            return float(result)
+        return result
+
+    def pdfs(self, ws, hypf=None):
         """ PDF of list - enables easier application of scipy.integrate for CDF. """
-        return [self.pdf(w) for w in ws]
+        return self.pdf(np.asarray(ws, dtype=float), hypf=hypf)
 
     @apply_defaults
+    @cached('cdf')
     def cdf(self, w, **kw_args):
-        """ Cumulative Density Function. """
-        return integrate.quadrature(self.pdfs, 0, w, maxiter=kw_args['quadr_maxiter'])[0]
+        """
+        Cumulative Density Function.
+        When the saddlepoint approximation (see betarat.asymptotic) has an estimated absolute error within
+        approx_tol, as happens for large counts, it is used directly. Failing that, when the parameters are all
+        integers and the exact finite sum (see betarat.exact_cdf) has no more than exact_max_terms terms, the CDF
+        is computed exactly. Otherwise, the pdf is integrated numerically (see integrate_pdf), with at most
+        quadr_maxiter rounds of refinement. Setting exact_max_terms=0 and approx_tol=0 forces the latter; `engine`
+        tells which of these will be used.
+        """
+        approx = self.asymptotic('cdf', w, kw_args['approx_tol'])
+        if approx is not None:
+            return approx
+        if self.exact_cdf_applies(w, kw_args['exact_max_terms']):
+            return exact_cdf(self.a1, self.a2, self.b1, self.b2, w)
+        return self.integrate_pdf(0, w, kw_args['quadr_maxiter'], kw_args['hyp2f1'])
+
+    @apply_defaults
+    def cdf_below(self, w, alpha, **kw_args):
+        """
+        Whether CDF(w) < alpha, for screening many tables against a significance level (say, CDF(1.0) < 0.05)
+        without computing each CDF to full accuracy. Where the CDF can be computed exactly, it is. Otherwise, the
+        tail mass is estimated by Gauss-Legendre rules of doubling order, starting from one fine enough to resolve
+        the spread of the distribution, and the decision is made as soon as alpha lies outside of the latest
+        estimate plus or minus its error bound (SCREEN_SAFETY times its difference from the previous estimate).
+        Only borderline tables go on to the full accuracy `cdf`. Results from a loaded lookup table, or a
+        saddlepoint approximation further than approx_tol from alpha, are used as they are. Keyword args are as
+        for cdf.
+        """
+        table = lookup.active()
+        if table is not None:
+            found = table.find(self.a1, self.a2, self.b1, self.b2, 'cdf', w)
+            if found is not None:
+                return found < alpha
+        approx = self.asymptotic('cdf', w, kw_args['approx_tol'])
+        if approx is not None and abs(approx - alpha) > kw_args['approx_tol']:
+            return approx < alpha
+        if w <= 0:
+            return 0 < alpha
+        if self.exact_cdf_applies(w, kw_args['exact_max_terms']):
+            # Cheaper than even a low order rule, each of whose nodes costs a hyp2f1 series as long as the sum
+            return exact_cdf(self.a1, self.a2, self.b1, self.b2, w) < alpha
+        # For w > 1, integrate the lower tail of the inverse ratio instead: CDF(w) = 1 - CDF'(1/w)
+        lower = w <= 1
+        dist, x = (self, w) if lower else (self.invert(), 1 / w)
+        n = 4
+        while n < x / dist.spread():
+            n *= 2
+        previous = None
+        while n <= SCREEN_MAX_ORDER:
+            nodes, weights = legendre_nodes(n)
+            with instrument.span('quadrature'):
+                estimate = x / 2 * np.dot(weights, dist.pdfs(x / 2 * (nodes + 1), kw_args['hyp2f1']))
+            instrument.count('quadrature_rounds')
+            if not lower:
+                estimate = 1 - estimate
+            if previous is not None:
+                error = max(SCREEN_SAFETY * abs(estimate - previous), SCREEN_MIN_ERROR)
+                if abs(estimate - alpha) > error:
+                    instrument.count('screen_decided')
+                    return estimate < alpha
+            previous = estimate
+            n *= 2
+        instrument.count('screen_fallbacks')
+        return self.cdf(w, **kw_args) < alpha
+
+    def spread(self):
+        """ Rough standard deviation of the ratio, from the delta method applied to the moments of the two Beta
+        distributions """
+        m1, m2 = self.a1 / (self.a1 + self.b1), self.a2 / (self.a2 + self.b2)
+        v1 = m1 * (1 - m1) / (self.a1 + self.b1 + 1)
+        v2 = m2 * (1 - m2) / (self.a2 + self.b2 + 1)
+        return m1 / m2 * math.sqrt(v1 / m1 ** 2 + v2 / m2 ** 2)
+
+    def exact_cdf_applies(self, w, exact_max_terms):
+        "Whether CDF(w) can be computed exactly with at most exact_max_terms terms (see betarat.exact_cdf)"
+        return (is_integral(self.a1, self.a2, self.b1, self.b2) and
+                n_terms(self.a1, self.a2, self.b1, self.b2, w) <= exact_max_terms)
+
+    def asymptotic(self, quantity, arg=None, approx_tol=defaults['approx_tol']):
+        """ The asymptotic approximation to quantity ('cdf', 'map' or 'ppf') at arg, if its estimated error is
+        within approx_tol, and None otherwise. The error is absolute for the CDF, and relative for the MAP and
+        quantiles. Tables whose leading saddlepoint correction is too large for the approximation to have any
+        chance of meeting approx_tol (roughly, those with a small count) are screened out cheaply up front. """
+        if not approx_tol:
+            return None
+        approx = Asymptotic(self.a1, self.a2, self.b1, self.b2)
+        if 1e-3 * approx.correction(0) ** 2 > approx_tol:
+            return None
+        try:
+            if quantity == 'cdf':
+                value, error = approx.cdf(arg)
+            elif quantity == 'map':
+                value, error = approx.mode()
+                error /= value
+            else:
+                value, error = approx.ppf(arg)
+                error /= value
+        except (ValueError, ZeroDivisionError, OverflowError, RuntimeError):
+            return None
+        return value if error <= approx_tol else None
 
     @apply_defaults
+    def engine(self, quantity, arg=None, **kw_args):
+        """ Name of the method by which quantity ('cdf', 'map' or 'ppf') would be computed at arg with the given
+        settings: 'asymptotic', or else 'exact' or 'quadrature' for the CDF, 'newton' for the MAP and 'optim' for
+        quantiles. Lookup tables and the result cache (which are consulted first) aren't taken into account. """
+        if self.asymptotic(quantity, arg, kw_args['approx_tol']) is not None:
+            return 'asymptotic'
+        if quantity == 'cdf':
+            return 'exact' if self.exact_cdf_applies(arg, kw_args['exact_max_terms']) else 'quadrature'
+        return dict(map='newton', ppf='optim')[quantity]
+
+    @apply_defaults
+    def mass(self, a, b, **kw_args):
+        """ Probability mass between a and b, CDF(b) - CDF(a). This takes the same keyword args as cdf, but
+        only integrates the pdf over (a, b) when the CDF can't be computed exactly. """
+        if self.exact_cdf_applies(a, kw_args['exact_max_terms']) and \
+                self.exact_cdf_applies(b, kw_args['exact_max_terms']):
+            return (exact_cdf(self.a1, self.a2, self.b1, self.b2, b) -
+                    exact_cdf(self.a1, self.a2, self.b1, self.b2, a))
+        return self.integrate_pdf(a, b, kw_args['quadr_maxiter'], kw_args['hyp2f1'])
+
+    def integrate_pdf(self, a, b, maxiter, hypf=None, full_output=False):
+        """ Integral of the pdf over (a, b), for 0 <= a <= b <= inf, by adaptive Gauss-Legendre quadrature of the
+        log transformed density (see betarat.quadrature), which evaluates the pdf at the nodes of all of the
+        panels still being refined in one vectorized call per round, for at most maxiter rounds. If full_output,
+        returns the pair (integral, error estimate). """
+        value, error = quadrature.pdf_mass(self, a, b, maxiter, hypf)
+        return (value, error) if full_output else value
+
+    @apply_defaults
+    @cached('map')
     def map(self, **kw_args):
         """
         Maximum A Posteriori: compute the mode of the posterior distribution. This can be more robust than the
         median (ppf(0.5)) as an estimate of the most likely ratio in cases where one of the counts of
         negatives is zero, as this situation can lead to a long tail and very high median values. In
         situations where this is not a problem, the median and MAP tend to agree fairly well.
+        For large counts, the mode of the saddlepoint density is used when its estimated relative error is
+        within approx_tol (see `asymptotic`). Otherwise the root of the derivative of the log density is found
+        by safeguarded Newton iterations (see betarat.mode), of which there are at most optim_maxiter.
         """
-        return optimize.brent(lambda w: - self.pdf(w), maxiter=kw_args['optim_maxiter'])
+        approx = self.asymptotic('map', approx_tol=kw_args['approx_tol'])
+        if approx is not None:
+            return approx
+        with instrument.span('mode_finding'):
+            return self.solved(('map',), mode.find_mode(self.a1, self.a2, self.b1, self.b2,
+                    hypf=kw_args['hyp2f1'], maxiter=kw_args['optim_maxiter'], start=self.hint(('map',))))
 
     def lt_pdf(self, t):
         "Log transformed posterior density function"
+        if np.ndim(t) > 0:
+            return np.exp(t) * self.pdf(np.exp(t))
         return math.exp(t) * self.pdf(math.exp(t))
 
     @apply_defaults
     def lt_map(self, **kw_args):
         """Exponential of the MAP of the log transformed PDF: This estimator more equally treats relative
         probability ratios less more equally than those greater than oen. However, this comes at the expense
-        of a higher mean square error as an estimator."""
-        return math.exp(optimize.brent(lambda t: - self.lt_pdf(t), maxiter=kw_args['optim_maxiter']))
+        of a higher mean square error as an estimator. Found in the same way as the MAP (see betarat.mode)."""
+        with instrument.span('mode_finding'):
+            return self.solved(('lt_map',), mode.find_mode(self.a1, self.a2, self.b1, self.b2,
+                    log_transformed=True, hypf=kw_args['hyp2f1'], maxiter=kw_args['optim_maxiter'],
+                    start=self.hint(('lt_map',))))
     
-    def simpson_ppf(self, q, max_sum=10, **kw_args):
+    def simpson_ppf(self, q, max_sum=10, hyp2f1=None, **kw_args):
         """
         Quantile function (AKA Percentile Point Function).
         This implementation uses the simpson_quantile method in betarat.simpson_quant.
-        Keyword args are the same as for simpson_quant_hp.
+        hyp2f1 is as for pdf, and the other keyword args are the same as for simpson_quant_hp. If q is a sequence of quantiles, a list is returned,
+        and the quantiles share their pdf evaluations. Quantiles which can't be computed (see MaxSumReached and
+        MissingMass) are returned as "NA".
         """
         try:
-            return simpson_quant_hp(self.pdf, q, max_sum=max_sum, **kw_args)
-        except MaxSumReached:
-            return "NA"
+            return simpson_quant_hp(lambda w: self.pdf(w, hypf=hyp2f1), q, max_sum=max_sum, **kw_args)
+        except (MaxSumReached, MissingMass):
+            return ["NA"] * len(q) if np.ndim(q) else "NA"
 
     @apply_defaults
+    @cached('optim_ppf')
     def optim_ppf(self, q, **kw_args):
         """
         Quantile function (AKA Percentile Point Function).
         This implementation uses scipy.optimize to solve for CDF(x) = Q. While in some cases, the
         simpson_quantile implementation ends up being faster, there are also cases where it is WAY slower, and
         in general it seems to be less accurate as well. As such, we generally advocate using this
-        implementation. The optim_maxiter and quadr_maxiter keyword args are passed as maxiter to optimize.brenth
-        and integrate.brenth respectively; all other kw_args are passed to optimize.brenth.
+        implementation. The optim_maxiter keyword arg is passed as maxiter to optimize.brenth, and the other
+        defaults (such as quadr_maxiter) are passed along to cdf; all other kw_args are passed to optimize.brenth.
+        q may also be a sequence of quantiles, in which case a list is returned. All of the CDF evaluations
+        are shared through a CdfSweep, so each only integrates the mass beyond the nearest point already
+        evaluated, and k quantiles cost little more than one. Quantiles whose saddlepoint approximation has
+        an estimated relative error within approx_tol are taken from it directly (see `asymptotic`).
         """
         optim_maxiter = kw_args.pop('optim_maxiter')
-        quadr_maxiter = kw_args.pop('quadr_maxiter')
-        def find_outer(b=1):
-            if self.cdf(b) > q:
-                return b
-            else:
-                return find_outer(b*2)
-        return optimize.brenth(lambda x: self.cdf(x, quadr_maxiter=quadr_maxiter) - q, 0, find_outer(), maxiter=optim_maxiter, **kw_args)
+        cdf_kw_args = dict((k, kw_args.pop(k)) for k in defaults if k in kw_args)
+        qs = list(q) if np.ndim(q) else [q]
+        results = {}
+        for qi in set(qs):
+            approx = self.asymptotic('ppf', qi, cdf_kw_args['approx_tol'])
+            if approx is not None:
+                results[qi] = approx
+        remaining = sorted(set(qs) - set(results))
+        sweep = CdfSweep(self, **cdf_kw_args)
+        cold = [qi for qi in remaining if not self.hint(('ppf', qi))]
+        if cold:
+            sweep.extend_to(max(cold))
+        for qi in remaining:
+            hint = self.hint(('ppf', qi))
+            lo, hi = sweep.bracket_near(qi, hint) if hint else sweep.bracket(qi)
+            with instrument.span('root_finding'):
+                results[qi], r = optimize.brenth(lambda x: sweep(x) - qi, lo, hi, maxiter=optim_maxiter,
+                        full_output=True, **kw_args)
+            instrument.count('root_iterations', r.iterations)
+            self.solved(('ppf', qi), results[qi])
+        return [results[qi] for qi in qs] if np.ndim(q) else results[q]
 
     def ppf(self, q, method="optim", **kw_args):
         """
         Quantile function (AKA Percentile Point Function).
         This convenience function calls optim_ppf or simpson ppf, as specifying  by `method` argument ("optim
         for optim_ppf (default) or "simpson" for simpson_pdf (not recommended, but faster in some cases))
-        Any keyword args are passed along to the appropriate function.
+        Any keyword args are passed along to the appropriate function. If q is a sequence of quantiles, a list
+        of results is returned.
         """
         if method == 'optim':
-            fn = self.optim_ppf
+            return self.optim_ppf(q, **kw_args)
         elif method == 'simpson':
-            fn = self.simpson_ppf
+            return self.simpson_ppf(q, **kw_args)
         else:
             raise ValueError, "Unrecognized method. Valid method options are optim and simpson."
-        return fn(q, **kw_args)
+
+    def credible_interval(self, level=0.95, **kw_args):
+        """ Equal tailed credible interval containing level of the posterior mass, as a (lower, upper) tuple.
+        Keyword args are passed along to ppf. """
+        return tuple(self.ppf([(1 - level) / 2, (1 + level) / 2], **kw_args))
+
+    @apply_defaults
+    def hpd_interval(self, level=0.95, **kw_args):
+        """
+        Highest posterior density interval: the shortest interval containing level of the posterior mass, on
+        which the density is everywhere higher than it is outside, as a (lower, upper) tuple. For skewed
+        posteriors (say, with a zero failure count) this is a better summary than the equal tailed
+        credible_interval, for the same reasons that the MAP is better than the median.
+        Rather than searching over equal tailed intervals, the endpoints are solved for together by Newton's
+        method on pdf(lower) = pdf(upper) and CDF(upper) - CDF(lower) = level, starting from the MAP plus or
+        minus a normal quantile of the spread. The slopes of the log density come from the derivative relations
+        used for the MAP (see betarat.mode), and the enclosed mass is integrated once, then kept up to date by
+        integrating only over each step of the endpoints. Where the density at 0 is at least that at ppf(level),
+        the interval is (0, ppf(level)). Keyword args are as for cdf; optim_maxiter caps the Newton iterations.
+        """
+        peak = self.map(**kw_args)
+        hypf = kw_args['hyp2f1']
+        if self.a1 <= 1:
+            # The density at 0 is infinite, or K = Blt / A, and the interval starts at 0 if that is as high as the
+            # density at ppf(level) (as it is when the density is flat up to the MAP)
+            upper = self.optim_ppf(level, **kw_args)
+            log_a, log_blt, _ = self.log_norms
+            if peak == 0 or log_blt - log_a >= self.logpdf(upper, hypf=hypf):
+                return 0.0, upper
+        half_width = ndtri((1 + level) / 2) * self.spread()
+        lower, upper = max(peak - half_width, peak / 8), peak + half_width
+        mass = self.mass(lower, upper, **kw_args)
+        params = [np.full(2, x) for x in (self.a1, self.a2, self.b1, self.b2)]
+        for _ in xrange(kw_args['optim_maxiter']):
+            instrument.count('hpd_iterations')
+            ends = np.array([lower, upper])
+            log_p = self.logpdf(ends, hypf=hypf)
+            # Slopes of the log density in t = log(w), so divided by w for the slopes in w
+            g, _ = mode.slope(*params, t=np.log(ends), hypf=hypf)
+            f1, f2 = mass - level, log_p[0] - log_p[1]
+            j11, j12 = -math.exp(log_p[0]), math.exp(log_p[1])
+            j21, j22 = g[0] / lower, -g[1] / upper
+            det = j11 * j22 - j12 * j21
+            if not det or not np.isfinite(det):
+                break
+            # Steps are kept on their own side of the MAP, and from going more than halfway to it (or to 0)
+            new_lower = min(max(lower - (f1 * j22 - f2 * j12) / det, lower / 2), (lower + peak) / 2)
+            new_upper = max(min(upper - (f2 * j11 - f1 * j21) / det, 2 * upper), (upper + peak) / 2)
+            mass += self.signed_mass(new_lower, lower, **kw_args) + self.signed_mass(upper, new_upper, **kw_args)
+            converged = abs(new_lower - lower) <= 1e-10 * lower and abs(new_upper - upper) <= 1e-10 * upper
+            lower, upper = new_lower, new_upper
+            if converged:
+                break
+        return lower, upper
+
+    def signed_mass(self, a, b, **kw_args):
+        "mass(a, b), negated if b < a"
+        return self.mass(a, b, **kw_args) if a <= b else -self.mass(b, a, **kw_args)
+
+    def rvs(self, size=None, random_state=None):
+        """ Random samples of the ratio, drawn as X1/X2 from the two Beta distributions. random_state may be
+        None, an integer seed or a numpy RandomState. """
+        return montecarlo.rvs(self.a1, self.a2, self.b1, self.b2, size=size, random_state=random_state)
+
+    def monte_carlo(self, size=100000, random_state=None):
+        """ A betarat.montecarlo.MonteCarlo estimator built from size samples, whose cdf, ppf and interval
+        methods return (estimate, standard error) pairs. Much faster than cdf or ppf when a couple of digits of
+        accuracy will do. """
+        return montecarlo.MonteCarlo(self.rvs(size, random_state))
 
     def plot_pdf(self, a=0, b=5, points=100):
         """ Convenience function for plotting a BetaRat using pylab over the range (a, b) with points
         points. As one might expect, this requires the pylab library, and it is suggested that the ipython
         library be used for this. For example, running `ipython --pylab` and importing this module should
         allow you to use this function. """
-        plot_fn(self.pdf, a, b, points=points, label=self.__repr__())
+        plot_fn(self.pdf, a, b, points=points, label=self.__repr__(), vectorized=True)
 
     def plot_ltpdf(self, a=-5, b=5, points=100):
         """ Convenience function for plotting a BetaRat using pylab over the range (a, b) with points
         points. As one might expect, this requires the pylab library, and it is suggested that the ipython
         library be used for this. For example, running `ipython --pylab` and importing this module should
         allow you to use this function. """
-        plot_fn(self.lt_pdf, a, b, points=points, label=self.__repr__())
+        plot_fn(self.lt_pdf, a, b, points=points, label=self.__repr__(), vectorized=True)
 
@@ -0,0 +1,146 @@
+"""
+Opt-in caching of BetaRat results. Once enabled (see `enable`), the results of BetaRat.cdf, BetaRat.map and
+BetaRat.optim_ppf are keyed on the posterior parameters of the distribution (folded together with those of its
+inverse, see utils.canonical_params), the quantity computed, its argument, and the accuracy settings used. An
+in-memory LRU level is always used, and an on-disk SQLite level can be added which persists across processes and
+runs.
+
+    from betarat import cache
+    cache.enable(maxsize=100000, path='betarat_cache.sqlite')
+    ...
+    print cache.stats()
+"""
+
+from collections import OrderedDict
+import threading
+import sqlite3
+import os
+
+
+def make_key(params, quantity, arg, settings):
+    """ Build the string cache key for quantity at arg of the distribution with (canonical) params, computed
+    with the settings dict of keyword args. Floating point arguments are rounded to 12 significant digits so
+    that folded arguments such as 1/(1/w) still match. """
+    if arg is not None:
+        arg = float('%.12g' % arg)
+    return repr((tuple(float(x) for x in params), quantity, arg, tuple(sorted(settings.items()))))
+
+
+class ResultCache(object):
+    """ Two level result cache: an in-memory LRU of at most maxsize entries, backed by an optional SQLite
+    database at path holding at most max_disk_entries entries (least recently used entries are evicted first).
+    Values are (result, inverted) pairs, where inverted records which orientation of the table result was
+    computed for. """
+    def __init__(self, maxsize=10000, path=None, max_disk_entries=1000000):
+        self.maxsize = maxsize
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = dict(memory_hits=0, disk_hits=0, misses=0, memory_evictions=0, disk_evictions=0)
+        self._db = None
+        self._db_pid = None
+        self._clock = 0
+
+    def _connection(self):
+        """ SQLite connections can't be shared across a fork, so (re)connect whenever we find ourselves in a new
+        process. """
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS results
+                    (key TEXT PRIMARY KEY, value REAL, inverted INTEGER, last_used INTEGER)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._db.commit()
+            self._db_pid = os.getpid()
+            self._clock = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM results").fetchone()[0]
+        return self._db
+
+    def _remember(self, key, value):
+        self.memory.pop(key, None)
+        self.memory[key] = value
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+            self.counts['memory_evictions'] += 1
+
+    def get(self, key):
+        """ Returns the (result, inverted) pair stored for key, or None if there isn't one """
+        with self.lock:
+            if key in self.memory:
+                value = self.memory.pop(key)
+                self.memory[key] = value
+                self.counts['memory_hits'] += 1
+                return value
+            if self.path:
+                db = self._connection()
+                row = db.execute("SELECT value, inverted FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._clock += 1
+                    db.execute("UPDATE results SET last_used = ? WHERE key = ?", (self._clock, key))
+                    db.commit()
+                    value = (row[0], bool(row[1]))
+                    self._remember(key, value)
+                    self.counts['disk_hits'] += 1
+                    return value
+            self.counts['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        """ Store the (result, inverted) pair value under key at all levels """
+        with self.lock:
+            self._remember(key, value)
+            if self.path:
+                db = self._connection()
+                self._clock += 1
+                db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                        (key, float(value[0]), int(value[1]), self._clock))
+                size = db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                if size > self.max_disk_entries:
+                    # Evict down to 90% of capacity, so that we aren't doing this on every put
+                    evict = size - int(self.max_disk_entries * 0.9)
+                    db.execute("""DELETE FROM results WHERE key IN
+                            (SELECT key FROM results ORDER BY last_used LIMIT ?)""", (evict,))
+                    self.counts['disk_evictions'] += evict
+                db.commit()
+
+    def stats(self):
+        """ Dictionary of hit/miss/eviction counts and current sizes of each level """
+        stats = dict(self.counts, memory_size=len(self.memory))
+        if self.path:
+            with self.lock:
+                stats['disk_size'] = self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return stats
+
+    def clear(self):
+        """ Remove all entries from all levels """
+        with self.lock:
+            self.memory.clear()
+            if self.path:
+                db = self._connection()
+                db.execute("DELETE FROM results")
+                db.commit()
+
+
+# The cache consulted by BetaRat; None when caching is disabled
+_active = None
+
+def enable(maxsize=10000, path=None, max_disk_entries=1000000):
+    """ Turn on result caching for BetaRat computations, returning the new ResultCache. See ResultCache for the
+    meaning of the arguments. """
+    global _active
+    _active = ResultCache(maxsize=maxsize, path=path, max_disk_entries=max_disk_entries)
+    return _active
+
+def disable():
+    "Turn off result caching"
+    global _active
+    _active = None
+
+def active():
+    "The currently enabled ResultCache, or None"
+    return _active
+
+def stats():
+    "Statistics for the currently enabled ResultCache (empty if caching is disabled)"
+    return _active.stats() if _active else {}
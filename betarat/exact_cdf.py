@@ -0,0 +1,91 @@
+"""
+Exact computation of the BetaRat CDF when the posterior parameters are integers (as they are for integer counts
+with integer priors, such as the default (1.0, 1.0)). For integer a1 and b1, the CDF of X1 is a finite binomial
+sum, and taking its expectation over X2 gives, for w <= 1,
+
+    CDF(w) = sum_{m=a1}^{n} (-1)^(m-a1) C(n, m) C(m-1, a1-1) w^m (a2)_m / (a2+b2)_m,    n = a1 + b1 - 1
+
+where (x)_m is the rising factorial. For w > 1 we use CDF(w) = 1 - CDF'(1/w), where CDF' is the CDF of the
+inverse ratio X2/X1. The sum alternates in sign and cancels heavily, so (much as rf_hyp2f1 does with GMP), it is
+accumulated exactly, here using python's arbitrary precision integers with w taken as the exact rational value of
+its floating point representation.
+
+Factoring w^a1 (a2)_a1 / (a2+b2)_a1 out of every term leaves a sum of b1 terms, built by a term ratio recurrence,
+so the cost is driven by b1 (see n_terms) and by the size of w's denominator, which the j-th term carries to the
+j-th power. The common factor involves no cancellation, so it is computed with mpmath at a working precision of
+128 bits, at a cost independent of a1; the result is then accurate to well beyond double precision.
+"""
+
+from __future__ import division
+from fractions import Fraction
+from scipy.special import comb
+import math
+
+
+# Private mpmath context for the common factor, so as not to disturb (or be disturbed by) the global precision;
+# created on first use, so that mpmath is only imported when it's needed
+_mp = None
+
+def _mp_context():
+    global _mp
+    if _mp is None:
+        import mpmath
+        _mp = mpmath.MPContext()
+        _mp.prec = 128
+    return _mp
+
+
+def is_integral(*params):
+    "True if all of params are positive integers (as floats or ints)"
+    return all(x > 0 and float(x).is_integer() for x in params)
+
+
+def n_terms(a1, a2, b1, b2, w):
+    """ Number of terms in the sum exact_cdf would compute for CDF(w). The j-th term holds about j times as many
+    bits as w's denominator, so non-dyadic w costs more per term than, say, w = 1. """
+    return int(b1) if w <= 1 else int(b2)
+
+
+def _lower_cdf(a1, a2, b1, b2, w):
+    """ CDF(w) for w <= 1 with integer a1, a2, b1, b2, as a pair (factor, (numerator, denominator)) of the common
+    factor w^a1 (a2)_a1 / (a2+b2)_a1 as an mpf, and the exact sum of the remaining terms as a pair of integers.
+    The m = a1 + j term of the sum is the common factor times
+
+        t_j = (-1)^j C(n, a1+j) C(a1+j-1, j) w^j (a1+a2)_j / (a1+a2+b2)_j,    j = 0, ..., b1 - 1
+
+    and the t_j are put over the common denominator q^(b1-1) (a1+a2+b2)_(b1-1), with w = p/q. """
+    w = Fraction(w)
+    p, q = w.numerator, w.denominator
+    n = a1 + b1 - 1
+    # falling[j] = (a1+a2+b2+j)_(b1-1-j), the part of the common denominator not cancelled by term j
+    falling = [1] * b1
+    for j in xrange(b1 - 2, -1, -1):
+        falling[j] = falling[j + 1] * (a1 + a2 + b2 + j)
+    binomials = comb(n, a1, exact=True)      # C(n, a1+j) C(a1+j-1, j)
+    rising = 1                               # (a1+a2)_j
+    numerator = 0
+    for j in xrange(b1):
+        term = binomials * rising * p ** j * q ** (b1 - 1 - j) * falling[j]
+        numerator += -term if j % 2 else term
+        m = a1 + j
+        binomials = binomials * (n - m) * m // ((m + 1) * (j + 1))
+        rising *= a1 + a2 + j
+    mp = _mp_context()
+    factor = mp.mpf(float(w)) ** a1 * mp.rf(a2, a1) / mp.rf(a2 + b2, a1)
+    return factor, (numerator, q ** (b1 - 1) * falling[0])
+
+
+def exact_cdf(a1, a2, b1, b2, w):
+    """ Exact CDF(w) of the ratio X1/X2 with X1 ~ Beta(a1, b1), X2 ~ Beta(a2, b2), for positive integer
+    parameters (see is_integral). """
+    a1, a2, b1, b2 = int(a1), int(a2), int(b1), int(b2)
+    if w <= 0:
+        return 0.0
+    elif math.isinf(w):
+        return 1.0
+    elif w <= 1:
+        factor, (numerator, denominator) = _lower_cdf(a1, a2, b1, b2, w)
+        return float(factor * _mp_context().mpf(numerator) / denominator)
+    else:
+        factor, (numerator, denominator) = _lower_cdf(a2, a1, b2, b1, 1 / Fraction(w))
+        return float(1 - factor * _mp_context().mpf(numerator) / denominator)
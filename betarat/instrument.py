@@ -0,0 +1,196 @@
+"""
+Opt-in instrumentation of the hot paths of BetaRat computations, for finding out where the time goes in a slow
+call. While recording, the following are counted
+
+    pdf                   points at which the density was evaluated
+    hyp2f1                hypergeometric function evaluations made for the density
+    quadrature            integrations of the pdf
+    quadrature_rounds     rounds of quadrature refinement (each one a vectorized pdf evaluation)
+    quadrature_capped     integrations which ran all the way up to quadr_maxiter
+    bracket_doublings     doublings of the upper bracket while solving for quantiles (see CdfSweep)
+    root_iterations       optimize.brenth iterations while solving CDF(x) = q
+    mode_iterations       Newton iterations while finding the MAP (see betarat.mode)
+    hpd_iterations        Newton iterations while solving for the endpoints of HPD intervals
+    simpson_levels        refinement levels of the simpson quantile engine
+    simpson_restarts      refinements forced because the grid didn't hold the requested mass
+    screen_decided        cdf_below decisions settled by the error bounds of its low order estimates
+    screen_fallbacks      cdf_below decisions which were too close to call, and went on to the full cdf
+    sweep_recurrences     hyp2f1 values found by recurrence from neighbouring tables (see betarat.sweep)
+    sweep_reseeds         points at which a block of a sweep failed its check, and was evaluated directly
+
+along with the wall time spent in the pdf, hyp2f1, quadrature, root_finding, mode_finding and simpson spans. Spans
+are inclusive (the pdf time includes the hyp2f1 time, and so on), and a span re-entered from within itself is only
+counted once.
+
+    from betarat import instrument
+    with instrument.recording() as stats:
+        br.ppf(0.05)
+    print stats.as_dict()
+
+When nothing is being recorded, each instrumented call costs a single check of the module level `current`.
+
+The same counts serve to cap the work done on a single computation: within `with instrument.budget(max_seconds,
+max_evaluations)`, the first counted operation after max_seconds have passed, or after more than max_evaluations
+pdf (or hyp2f1) evaluations, raises BudgetExceeded. This is how `betarat batch` quarantines pathological tables
+rather than stalling on them; note that the budget can't interrupt a single long running hyp2f1 evaluation.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+
+
+# The Stats being recorded into, if any
+current = None
+
+
+class Stats(object):
+    """ Counts and timings of instrumented operations. Counts may be updated from several threads at once; spans
+    are tracked per thread. """
+    def __init__(self):
+        self.counts = {}
+        self.seconds = {}
+        self.lock = threading.Lock()
+        self.open_spans = threading.local()
+
+    def __repr__(self):
+        return "Stats({!r})".format(self.counts)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def enter(self, name):
+        """ Mark the span name as open in this thread, returning False if it already was (in which case the
+        enclosing span accounts for this one) """
+        spans = self.open_spans.__dict__.setdefault('names', set())
+        if name in spans:
+            return False
+        spans.add(name)
+        return True
+
+    def leave(self, name):
+        self.open_spans.names.discard(name)
+
+    def merge(self, other):
+        """ Add in the counts and timings of other, a Stats or a dict as returned by as_dict (say, from a worker
+        process) """
+        if isinstance(other, Stats):
+            other = other.as_dict()
+        for name, n in other['counts'].items():
+            self.count(name, n)
+        for name, seconds in other['seconds'].items():
+            self.add_time(name, seconds)
+
+    def as_dict(self):
+        "Plain dict of the counts and seconds, suitable for dumping as JSON"
+        with self.lock:
+            return dict(counts=dict(self.counts), seconds=dict(self.seconds))
+
+
+class BudgetExceeded(Exception):
+    "Raised when a computation runs over the time or evaluation budget it was given (see budget)"
+    pass
+
+
+class Budget(Stats):
+    """ Stats which raise BudgetExceeded from the first operation counted once max_seconds have passed since it
+    was created, or once more than max_evaluations pdf evaluations have been counted (either may be None). The
+    MAP's Newton iterations evaluate hyp2f1 without the pdf, so hyp2f1 evaluations count towards it as well. """
+    def __init__(self, max_seconds=None, max_evaluations=None):
+        Stats.__init__(self)
+        self.max_seconds, self.max_evaluations = max_seconds, max_evaluations
+        self.start = time.time()
+
+    def count(self, name, n=1):
+        Stats.count(self, name, n)
+        evaluations = max(self.counts.get('pdf', 0), self.counts.get('hyp2f1', 0))
+        if self.max_evaluations is not None and evaluations > self.max_evaluations:
+            raise BudgetExceeded("More than {} pdf evaluations".format(self.max_evaluations))
+        if self.max_seconds is not None and time.time() - self.start > self.max_seconds:
+            raise BudgetExceeded("More than {} seconds".format(self.max_seconds))
+
+
+@contextmanager
+def recording(stats=None):
+    """ Record into stats (a new Stats by default) for the duration of the with block, yielding it. Recordings
+    may be nested, in which case whatever is recorded by the inner one is added to the outer one as well when it
+    ends. """
+    global current
+    outer, current = current, stats or Stats()
+    stats = current
+    try:
+        yield stats
+    finally:
+        current = outer
+        if outer is not None:
+            outer.merge(stats)
+
+
+def budget(max_seconds=None, max_evaluations=None):
+    """ Record into a new Budget for the duration of the with block (see recording), so that the enclosed
+    computation raises BudgetExceeded once it runs over max_seconds or max_evaluations """
+    return recording(Budget(max_seconds, max_evaluations))
+
+
+def count(name, n=1):
+    "Count n operations of the given name, if recording"
+    stats = current
+    if stats is not None:
+        stats.count(name, n)
+
+
+class NullSpan(object):
+    "Span used when nothing is being recorded"
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+null_span = NullSpan()
+
+
+class Span(object):
+    def __init__(self, stats, name, n):
+        self.stats, self.name, self.n = stats, name, n
+
+    def __enter__(self):
+        self.outermost = self.stats.enter(self.name)
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        if self.outermost:
+            self.stats.add_time(self.name, time.time() - self.start)
+            self.stats.leave(self.name)
+            if self.n:
+                self.stats.count(self.name, self.n)
+
+
+def span(name, n=0):
+    """ Context manager timing the enclosed block as a span of the given name, and counting n operations of that
+    name, if recording """
+    stats = current
+    if stats is None:
+        return null_span
+    return Span(stats, name, n)
+
+
+def timed(name, evaluations=lambda *args, **kw_args: 1):
+    """ Decorator timing each call of the decorated function as a span of the given name, and counting the
+    number of operations given by evaluations (called with the function's arguments), if recording """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kw_args):
+            stats = current
+            if stats is None:
+                return func(*args, **kw_args)
+            with Span(stats, name, evaluations(*args, **kw_args)):
+                return func(*args, **kw_args)
+        return wrapper
+    return decorator
@@ -0,0 +1,146 @@
+"""
+Precomputed lookup tables of BetaRat results for small count tables. For all tables (a, b, c, d) with counts at
+or below some n, under a given prior, `build` computes CDF(1.0), the MAP and a set of quantiles, and writes them
+to a flat binary file: a fixed size header followed by a C-ordered array of shape ((n+1)**4, 2 + len(quantiles)).
+A LookupTable memory-maps this file, so that loading it doesn't require reading or parsing the data, and each
+result is found in O(1) by indexing on the counts. Once a table is loaded with `load`, BetaRat, BetaRatBatch and
+the CLI answer from it whenever a table falls inside the grid.
+
+    from betarat import lookup
+    lookup.build('lookup.brl', 20, pool=multiprocessing.Pool(8))
+    lookup.load('lookup.brl')
+"""
+
+import numpy as np
+import struct
+
+
+MAGIC = 'BETARAT\0'
+VERSION = 1
+# magic, version, n, number of quantiles, itemsize of data, prior
+HEADER_FORMAT = '<8sIIII2d'
+DATA_ALIGNMENT = 64
+
+DEFAULT_QUANTILES = (0.025, 0.05, 0.25, 0.5, 0.75, 0.95, 0.975)
+
+# Column layout: CDF(1.0), MAP and then one column per quantile
+CDF_COLUMN, MAP_COLUMN, PPF_COLUMN = 0, 1, 2
+
+
+def data_offset(n_quantiles):
+    "Offset of the data array in the file, after the header and quantile list"
+    header_size = struct.calcsize(HEADER_FORMAT) + 8 * n_quantiles
+    return -(-header_size // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def grid_index(a, b, c, d, n):
+    "Row of the data array holding table (a, b, c, d); works elementwise on arrays of counts"
+    return ((a * (n + 1) + b) * (n + 1) + c) * (n + 1) + d
+
+
+def build(path, n, prior=(1.0, 1.0), quantiles=DEFAULT_QUANTILES, dtype=np.float64, pool=None, **kw_args):
+    """ Compute results for every table with counts <= n under prior and write them to path. Quantiles are
+    given as a tuple; the default set is symmetric so that it is closed under the folding of inverse tables.
+    The work is done one slice of the grid (fixed a) at a time using BetaRatBatch, optionally using a
+    multiprocessing pool; keyword args are passed along to the BetaRatBatch methods. Results which could not
+    be computed are stored as nan. """
+    # Imported here, since BetaRat itself consults this module
+    from batch import BetaRatBatch
+    dtype = np.dtype(dtype)
+    offset = data_offset(len(quantiles))
+    with open(path, 'wb') as handle:
+        handle.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, n, len(quantiles), dtype.itemsize, *prior))
+        handle.write(struct.pack('<{}d'.format(len(quantiles)), *quantiles))
+        handle.write('\0' * (offset - handle.tell()))
+    data = np.memmap(path, dtype=dtype.newbyteorder('<'), mode='r+', offset=offset,
+            shape=((n + 1) ** 4, PPF_COLUMN + len(quantiles)))
+    counts = np.arange(n + 1)
+    b, c, d = [x.ravel() for x in np.meshgrid(counts, counts, counts, indexing='ij')]
+    slice_size = (n + 1) ** 3
+    for a in counts:
+        batch = BetaRatBatch(np.full(slice_size, a), b, c, d, prior=prior)
+        rows = slice(a * slice_size, (a + 1) * slice_size)
+        data[rows, CDF_COLUMN] = batch.cdf(1.0, pool=pool, **kw_args)
+        data[rows, MAP_COLUMN] = batch.map(pool=pool, **kw_args)
+        for i, q in enumerate(quantiles):
+            data[rows, PPF_COLUMN + i] = batch.ppf(q, pool=pool, **kw_args)
+    data.flush()
+    del data
+
+
+class LookupTable(object):
+    """ Memory-mapped view of a lookup table file written by `build`. """
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            header = handle.read(struct.calcsize(HEADER_FORMAT))
+            magic, version, n, n_quantiles, itemsize, prior0, prior1 = struct.unpack(HEADER_FORMAT, header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} is not a betarat lookup table (version {})".format(path, VERSION))
+            self.quantiles = struct.unpack('<{}d'.format(n_quantiles), handle.read(8 * n_quantiles))
+        self.path = path
+        self.n = n
+        self.prior = (prior0, prior1)
+        dtype = np.dtype('<f{}'.format(itemsize))
+        self.data = np.memmap(path, dtype=dtype, mode='r', offset=data_offset(n_quantiles),
+                shape=((n + 1) ** 4, PPF_COLUMN + n_quantiles))
+
+    def __repr__(self):
+        return "LookupTable({!r}, n={}, prior={})".format(self.path, self.n, self.prior)
+
+    def column(self, quantity, arg=None):
+        """ Column holding quantity ('cdf', 'map' or 'ppf') at arg, or None if it isn't in the table """
+        if quantity == 'cdf':
+            return CDF_COLUMN if arg == 1.0 else None
+        elif quantity == 'map':
+            return MAP_COLUMN
+        elif quantity in ('ppf', 'optim_ppf'):
+            for i, q in enumerate(self.quantiles):
+                if abs(q - arg) < 1e-12:
+                    return PPF_COLUMN + i
+        return None
+
+    def counts(self, params):
+        """ Convert an (m, 4) array of posterior parameters (a1, a2, b1, b2) back to the counts (a, b, c, d)
+        of the tables, along with a mask of which of them fall within the grid of this table. """
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        counts = params - np.array([self.prior[0], self.prior[0], self.prior[1], self.prior[1]])
+        int_counts = np.rint(counts).astype(np.int64)
+        inside = np.all((np.abs(counts - int_counts) < 1e-9) & (int_counts >= 0) & (int_counts <= self.n), axis=1)
+        return int_counts, inside
+
+    def query(self, params, column):
+        """ Look up column for each row of an (m, 4) array of posterior parameters; rows outside of the grid
+        come back as nan. """
+        counts, inside = self.counts(params)
+        results = np.full(len(counts), np.nan)
+        index = grid_index(*(counts[inside].T), n=self.n)
+        results[inside] = self.data[index, column]
+        return results
+
+    def find(self, a1, a2, b1, b2, quantity, arg=None):
+        """ Result for the single distribution with posterior parameters (a1, a2, b1, b2), or None if it isn't
+        in the table """
+        column = self.column(quantity, arg)
+        if column is None:
+            return None
+        result = self.query([(a1, a2, b1, b2)], column)[0]
+        return None if np.isnan(result) else float(result)
+
+
+# The table consulted by BetaRat and BetaRatBatch; None when no table is loaded
+_active = None
+
+def load(path):
+    "Memory-map the lookup table at path and start answering from it, returning the LookupTable"
+    global _active
+    _active = LookupTable(path)
+    return _active
+
+def unload():
+    "Stop answering from the loaded lookup table"
+    global _active
+    _active = None
+
+def active():
+    "The currently loaded LookupTable, or None"
+    return _active
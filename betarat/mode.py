@@ -0,0 +1,132 @@
+"""
+Modes of BetaRat densities (the MAP, and the mode of the log transformed density used by lt_map), found from the
+analytic derivative of the log density rather than by searching over the density itself.
+
+In terms of t = log(w), the slope of the log density on the w <= 1 branch is
+
+    G(t) = (a1 - 1) + z F'(z) / F(z),        F = 2F1(a1 + a2, 1 - b1; a1 + a2 + b2; z),  z = w
+
+and on the w > 1 branch
+
+    G(t) = -(1 + a2) - z F'(z) / F(z),       F = 2F1(a1 + a2, 1 - b2; a1 + a2 + b1; z),  z = 1/w
+
+with G'(t) = z R + z^2 R' on either branch, where R = F'/F. The derivatives of 2F1 come from the derivative
+relation F'(a, b; c; z) = (a b / c) F(a + 1, b + 1; c + 1; z). The mode is where G(t) = 0 (or G(t) = -1 for the log
+transformed density, which carries an extra factor of w), and is found by Newton's method safeguarded with a
+bracket: steps which would leave the bracket, or fail to halve, fall back on bisection (or on an expansion step,
+doubling in length each time, while the bracket is still open on that side). Starting from the ratio of the
+modes of the two Beta distributions, this typically converges within a handful of iterations of three hyp2f1 calls
+each. When G(t) <= 0 all the way down to w = 0 (a1 < 1, or a1 = 1 and b1 > 1, for the density itself), the mode
+is at 0, and no iterations are needed. When c - a - b = b1 + b2 - 1 <= 0, both 2F1 terms diverge at z = 1, so that
+the density is unbounded at w = 1, which is then taken as the mode (again without iterating); otherwise iterates
+are kept off t = 0 itself, where the hyp2f1 series converge slowest.
+
+Everything is vectorized over arrays of parameters, so that the modes of many tables are solved for together.
+"""
+
+from __future__ import division
+import numpy as np
+import backends
+import instrument
+
+
+# Largest Newton step taken in t while the bracket is open on that side, and the first expansion step
+MAX_STEP = 2.0
+# Beyond this |t|, the mode is taken to be at 0 (or inf)
+MAX_T = 50.0
+
+
+def log_ratios(hypf, a, b, c, z):
+    """ F'/F and F''/F for F = 2F1(a, b; c; z), skipping the evaluations whose derivative relation factor is 0
+    (as when b is 0 or -1, and F is a polynomial of lower degree) """
+    F = backends.evaluate(hypf, a, b, c, z)
+    first, second = np.zeros_like(z), np.zeros_like(z)
+    factor1 = a * b / c
+    factor2 = factor1 * (a + 1) * (b + 1) / (c + 1)
+    rows = factor1 != 0
+    first[rows] = factor1[rows] * backends.evaluate(hypf, a[rows] + 1, b[rows] + 1, c[rows] + 1, z[rows]) / F[rows]
+    rows = factor2 != 0
+    second[rows] = factor2[rows] * backends.evaluate(hypf, a[rows] + 2, b[rows] + 2, c[rows] + 2, z[rows]) / F[rows]
+    return first, second
+
+
+def slope(a1, a2, b1, b2, t, hypf='auto'):
+    """ G(t) and G'(t), the first two derivatives of the log density with respect to t = log(w), elementwise over
+    arrays of parameters and t, with hyp2f1 computed according to hypf (see betarat.backends) """
+    left = t <= 0
+    w = np.exp(t)
+    z = np.where(left, w, 1 / w)
+    a = a1 + a2
+    b = np.where(left, 1 - b1, 1 - b2)
+    c = a + np.where(left, b2, b1)
+    first, second = log_ratios(hypf, a, b, c, z)
+    zr = z * first
+    return np.where(left, (a1 - 1) + zr, -(1 + a2) - zr), zr + z ** 2 * (second - first ** 2)
+
+
+def initial_guess(a1, a2, b1, b2, log_transformed=False):
+    """ Ratio of the modes of the two Beta distributions (or of the modes of their log transformed densities),
+    falling back on their means where the mode is at 0 or 1 """
+    k = 1 if log_transformed else 0
+    def beta_mode(a, b):
+        proper = (a - 1 + k > 0) & (b > 1)
+        return np.where(proper, (a - 1 + k) / np.where(proper, a + b - 2 + k, 1), a / (a + b))
+    return beta_mode(a1, b1) / beta_mode(a2, b2)
+
+
+def find_modes(a1, a2, b1, b2, log_transformed=False, hypf='auto', xtol=1e-10, maxiter=75, start=None):
+    """ Modes of the BetaRat densities with parameters given by the (broadcast) arrays a1, a2, b1, b2, or of their
+    log transformed densities. xtol is the tolerance on log(w), that is, relative to w; elements which haven't
+    converged after maxiter iterations are returned as they stand. start optionally gives the starting points
+    (say, the modes of neighbouring tables; see BetaRat.update) in place of initial_guess. """
+    a1, a2, b1, b2 = [np.asarray(x, dtype=float).ravel() for x in np.broadcast_arrays(a1, a2, b1, b2)]
+    target = -1.0 if log_transformed else 0.0
+    guess = initial_guess(a1, a2, b1, b2, log_transformed)
+    if start is not None:
+        start = np.broadcast_to(np.asarray(start, dtype=float), guess.shape)
+        guess = np.where((start > 0) & np.isfinite(start), start, guess)
+    t = np.log(guess)
+    lo, hi = np.full_like(t, -np.inf), np.full_like(t, np.inf)
+    last_step = np.full_like(t, np.inf)
+    # The density is unbounded at w = 1, where the 2F1 terms have c - a - b = b1 + b2 - 1 <= 0
+    at_one = b1 + b2 <= 1
+    # G(-inf) = a1 - 1, and G starts out decreasing from there unless b1 < 1
+    at_zero = ((a1 - 1 - target < 0) | ((a1 - 1 - target == 0) & (b1 > 1))) & ~at_one
+    t[at_zero] = -np.inf
+    t[at_one] = 0.0
+    active = ~(at_zero | at_one)
+    t[active & (t == 0)] = xtol / 4
+    for _ in xrange(maxiter):
+        if not active.any():
+            break
+        instrument.count('mode_iterations')
+        rows = np.flatnonzero(active)
+        g, dg = slope(a1[rows], a2[rows], b1[rows], b2[rows], t[rows], hypf=hypf)
+        g -= target
+        # G is decreasing through the mode, so the sign of G tells which side of it we're on
+        lo[rows] = np.where(g > 0, t[rows], lo[rows])
+        hi[rows] = np.where(g > 0, hi[rows], t[rows])
+        closed = np.isfinite(lo[rows]) & np.isfinite(hi[rows])
+        # While the bracket is open, expansion steps double in length
+        expansion = np.maximum(np.where(np.isfinite(last_step[rows]), 2 * np.abs(last_step[rows]), 0), MAX_STEP)
+        fallback = np.where(closed, (lo[rows] + hi[rows]) / 2 - t[rows], np.sign(g) * expansion)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = -g / dg
+            proposed = t[rows] + newton
+            good = ((dg < 0) & (proposed > lo[rows]) & (proposed < hi[rows]) &
+                    (np.abs(newton) <= np.where(closed, np.abs(last_step[rows]) / 2, MAX_STEP)))
+        step = np.where(good, newton, fallback)
+        step[g == 0] = 0
+        t[rows] += step
+        # Steps landing on t = 0 are pulled back a little towards where they came from, which stays in the bracket
+        landed = rows[t[rows] == 0]
+        t[landed] = -np.sign(step[t[rows] == 0]) * xtol / 4
+        last_step[rows] = step
+        converged = (np.abs(step) < xtol) | (closed & (hi[rows] - lo[rows] < xtol)) | (np.abs(t[rows]) > MAX_T)
+        active[rows[converged]] = False
+    return np.where(t < -MAX_T, 0.0, np.where(t > MAX_T, np.inf, np.exp(t)))
+
+
+def find_mode(a1, a2, b1, b2, log_transformed=False, **kw_args):
+    "find_modes for a single table, returning a float"
+    return float(find_modes(a1, a2, b1, b2, log_transformed, **kw_args)[0])
@@ -0,0 +1,81 @@
+"""
+Monte Carlo estimates of BetaRat quantities, for quick screening where speed matters more than exactness. Samples
+of W = X1/X2 are drawn directly from the two Beta distributions, and the CDF, quantiles and intervals are estimated
+from them, each along with its standard error.
+
+For batches of tables, each row gets its own random stream, seeded by the pair (seed, row index). The draws for a
+row therefore don't depend on how the rows are split up into chunks or spread across worker processes (so long as
+each worker is told the index of its first row), and streams are never shared between workers.
+"""
+
+from __future__ import division
+import numpy as np
+import math
+
+
+def check_random_state(random_state):
+    """ A numpy RandomState from random_state, which may be None (numpy's global RandomState), an integer seed,
+    or a RandomState, which is returned as is. """
+    if random_state is None:
+        return np.random.mtrand._rand
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    return np.random.RandomState(random_state)
+
+
+def row_stream(seed, row):
+    "The independent random stream for the given row of a batch seeded with seed"
+    return np.random.RandomState([seed, row])
+
+
+def rvs(a1, a2, b1, b2, size=None, random_state=None):
+    "Draw samples of X1/X2, with X1 ~ Beta(a1, b1) and X2 ~ Beta(a2, b2)"
+    random_state = check_random_state(random_state)
+    return random_state.beta(a1, b1, size) / random_state.beta(a2, b2, size)
+
+
+def batch_rvs(a1, a2, b1, b2, size, seed, first_row=0):
+    """ Draw size samples for each row of the parameter arrays, returning an array of shape (rows, size). Row i
+    is drawn from row_stream(seed, first_row + i), so a worker handling rows first_row, first_row + 1, ... of a
+    larger batch draws exactly what a single process handling the whole batch would. """
+    samples = np.empty((len(a1), size))
+    for i, params in enumerate(zip(a1, a2, b1, b2)):
+        samples[i] = rvs(*params, size=size, random_state=row_stream(seed, first_row + i))
+    return samples
+
+
+class MonteCarlo(object):
+    """ Estimates of BetaRat quantities from an array of samples of W. Each method returns a pair (estimate,
+    standard error), and accepts either scalar or array arguments. """
+    def __init__(self, samples):
+        self.samples = np.sort(np.asarray(samples, dtype=float).ravel())
+        self.n = len(self.samples)
+
+    def __repr__(self):
+        return "MonteCarlo(<{} samples>)".format(self.n)
+
+    def cdf(self, w):
+        "Fraction of samples <= w, with its binomial standard error"
+        p = np.searchsorted(self.samples, w, side='right') / self.n
+        return p, np.sqrt(p * (1 - p) / self.n)
+
+    def order_statistic(self, k):
+        "The k-th smallest sample (0 based), with k clipped to the sample"
+        return self.samples[np.clip(np.asarray(k), 0, self.n - 1).astype(int)]
+
+    def ppf(self, q):
+        """ Sample quantile. The standard error comes from the spread of the order statistics one binomial
+        standard deviation, sqrt(n q (1 - q)), either side of it, which avoids having to estimate the density. """
+        q = np.asarray(q, dtype=float)
+        k = q * self.n
+        spread = np.sqrt(self.n * q * (1 - q))
+        estimate = self.order_statistic(np.ceil(k) - 1)
+        se = (self.order_statistic(np.ceil(k + spread) - 1) - self.order_statistic(np.ceil(k - spread) - 1)) / 2
+        if estimate.ndim == 0:
+            return float(estimate), float(se)
+        return estimate, se
+
+    def interval(self, level=0.95):
+        """ Equal tailed interval containing level of the samples, as ((lower, upper), (lower se, upper se)) """
+        estimates, ses = self.ppf([(1 - level) / 2, (1 + level) / 2])
+        return tuple(estimates), tuple(ses)
@@ -0,0 +1,184 @@
+"""
+Numerical integration of the BetaRat density, for the CDFs and masses which can't be computed exactly (see
+BetaRat.integrate_pdf). The density is integrated in t = log(w), as the log transformed density w pdf(w) (see
+BetaRat.lt_pdf), which is smooth and far closer to symmetric than the density itself, by adaptive Gauss-Legendre
+quadrature:
+
+  * the interval is first split into panels at multiples of the rough spread of log(w) about its centre, so
+    that even the sharp peaks of large count tables are resolved from the first round
+  * each panel is integrated by the ORDER point rule over the whole panel and over each of its halves; where the
+    two estimates differ by more than the panel's share of TOL, the panel is split in half, and the halves go on
+    to the next round (whose whole panel estimates are then already known) with half of its share each. The
+    first panels have equal shares, whatever their widths, so that the narrow panels around sharp features
+    aren't held to a tolerance they can't meet
+  * each round evaluates the density at the nodes of all of its panels in a single vectorized call, and the
+    nodes and weights are computed once per order and cached
+
+so that the cost of an integral is a few vectorized pdf calls, and at most maxiter of them. The sum of the
+differences of the accepted panels is returned as an error estimate, which is conservative, since the finer of
+the two estimates is the one kept.
+
+Integrals from w = 0, where t runs off to -inf, take the piece below some small eps from the leading term of the
+density at 0, K w^(a1 - 1) with K = Blt / A, as K eps^a1 / a1, with eps small enough that the next term of the
+expansion contributes less than HEAD_TOL. Integrals from 0 beyond w = 1 are computed from the inverse
+distribution (see BetaRat.invert), as CDF(w) = 1 - CDF'(1/w), so that the integral itself never runs past w = 1.
+
+Where b1 + b2 <= 1, both 2F1 terms of the density diverge at w = 1 (t = 0), which bisection alone would chase
+for every one of its rounds. The panel boundaries are then graded geometrically towards t = 0, by factors of
+GRADING down to SINGULAR_EDGE, and the pieces within SINGULAR_EDGE of it are taken from the leading term of the
+density there, which goes as |t|^(s - 1) with s = b1 + b2 (or as log|t| for s = 1), as eps f(+-eps) / s.
+"""
+
+from __future__ import division
+import numpy as np
+import math
+import instrument
+
+
+# Points per Gauss-Legendre rule, the absolute error allowed over the whole integral, and the most panels
+# carried into a round, beyond which the remaining panels are accepted as they stand
+ORDER = 8
+TOL = 1e-10
+MAX_PANELS = 1024
+
+# Panel boundaries, in multiples of the spread of log(w) about its centre
+SPLITS = (-8, -4, -2, -1, 0, 1, 2, 4, 8)
+
+# Largest contribution allowed from the terms of the density at 0 beyond the leading one
+HEAD_TOL = 1e-14
+
+# Ratio of successive panel boundaries graded towards t = 0 where the density is unbounded at w = 1, and the
+# distance from t = 0 within which the integral is taken from the leading term
+GRADING = 8.0
+SINGULAR_EDGE = 1e-15
+
+legendre_cache = {}
+
+def legendre_nodes(n):
+    "Nodes and weights of the n point Gauss-Legendre rule on [-1, 1], computed once per n"
+    if n not in legendre_cache:
+        legendre_cache[n] = np.polynomial.legendre.leggauss(n)
+    return legendre_cache[n]
+
+
+def rule(f, lo, hi, order):
+    "Gauss-Legendre estimates of the integral of f over each of the panels (lo, hi), from a single call of f"
+    nodes, weights = legendre_nodes(order)
+    half = (hi - lo) / 2
+    x = (lo + half)[:, None] + half[:, None] * nodes
+    return half * f(x.ravel()).reshape(x.shape).dot(weights)
+
+
+def integrate(f, breakpoints, maxiter, tol=TOL, order=ORDER, gap=None):
+    """ Integral of the vectorized function f from breakpoints[0] to breakpoints[-1], starting from a panel
+    between each pair of successive (increasing) breakpoints, and refining for at most maxiter rounds. gap
+    optionally gives a pair of the breakpoints, the panels between which are left out. Returns the pair
+    (integral, error estimate). """
+    lo, hi = np.asarray(breakpoints[:-1], dtype=float), np.asarray(breakpoints[1:], dtype=float)
+    if gap is not None:
+        keep = (hi <= gap[0]) | (lo >= gap[1])
+        lo, hi = lo[keep], hi[keep]
+    allowed = np.full(len(lo), tol / max(len(lo), 1))
+    value = error = 0.0
+    whole = None
+    rounds = 0
+    capped = False
+    with instrument.span('quadrature', 1):
+        while len(lo):
+            rounds += 1
+            mid = (lo + hi) / 2
+            if whole is None:
+                estimates = rule(f, np.concatenate([lo, mid, lo]), np.concatenate([mid, hi, hi]), order)
+                whole = estimates[2 * len(lo):]
+            else:
+                estimates = rule(f, np.concatenate([lo, mid]), np.concatenate([mid, hi]), order)
+            left, right = estimates[:len(lo)], estimates[len(lo):2 * len(lo)]
+            fine = left + right
+            differences = np.abs(fine - whole)
+            accepted = differences <= allowed
+            if rounds >= maxiter or 4 * np.count_nonzero(~accepted) > MAX_PANELS:
+                capped = capped or not accepted.all()
+                accepted[:] = True
+            value += fine[accepted].sum()
+            error += differences[accepted].sum()
+            split = ~accepted
+            lo, hi = np.concatenate([lo[split], mid[split]]), np.concatenate([mid[split], hi[split]])
+            whole = np.concatenate([left[split], right[split]])
+            allowed = np.tile(allowed[split] / 2, 2)
+    instrument.count('quadrature_rounds', rounds)
+    if capped:
+        instrument.count('quadrature_capped')
+    return value, error
+
+
+def breakpoints(br, lo, hi):
+    """ Panel boundaries over (lo, hi) in t = log(w): SPLITS times the spread of log(w) (by the delta method)
+    about the log of the ratio of the means of the two Beta distributions, along with t = 0, where the two
+    branches of the density meet """
+    m1, m2 = br.a1 / (br.a1 + br.b1), br.a2 / (br.a2 + br.b2)
+    spread = math.sqrt((1 - m1) / (m1 * (br.a1 + br.b1 + 1)) + (1 - m2) / (m2 * (br.a2 + br.b2 + 1)))
+    splits = np.union1d(math.log(m1 / m2) + spread * np.array(SPLITS), [0.0])
+    return np.concatenate([[lo], splits[(splits > lo) & (splits < hi)], [hi]])
+
+
+def integrate_t(br, lo, hi, maxiter, hypf=None):
+    """ Integral of the density of t = log(w), w pdf(w), over lo <= t <= hi, and its error estimate, grading the
+    panels towards t = 0 where the density is unbounded at w = 1 """
+    f = lambda t: np.exp(t + br.logpdf(np.exp(t), hypf=hypf))
+    points = breakpoints(br, lo, hi)
+    s = br.b1 + br.b2
+    if s > 1 or lo > 0 or hi < 0:
+        return integrate(f, points, maxiter)
+    edges = np.array([max(lo, -SINGULAR_EDGE), min(hi, SINGULAR_EDGE)])
+    grades = GRADING ** -np.arange(int(math.log(1 / SINGULAR_EDGE) / math.log(GRADING)) + 1)
+    points = reduce(np.union1d, [points, edges, -grades, grades])
+    value = error = 0.0
+    if lo < edges[0] or hi > edges[1]:
+        value, error = integrate(f, points[(points >= lo) & (points <= hi)], maxiter, gap=edges)
+    # The pieces next to t = 0 from the leading term, with all of each counted towards the error
+    edges = edges[edges != 0]
+    tail = (np.abs(edges) * f(edges)).sum() / s
+    return value + tail, error + tail
+
+
+def head(br, x):
+    """ The point eps <= x below which the density is taken to be K w^(a1 - 1), along with K eps^a1 / a1, its
+    integral from 0, and a bound on the contribution of the next term, K r eps^(a1 + 1) / (a1 + 1), where
+    r = |(a1 + a2)(1 - b1) / (a1 + a2 + b2)| is the coefficient of w in the 2F1 term """
+    log_a, log_blt, _ = br.log_norms
+    log_k = log_blt - log_a
+    r = abs((br.a1 + br.a2) * (1 - br.b1) / (br.a1 + br.a2 + br.b2))
+    log_eps = math.log(x)
+    if r > 0:
+        # Also keeps r eps small, so that the terms beyond the next are smaller still
+        log_eps = min(log_eps, math.log(0.01 / r),
+                (math.log(HEAD_TOL * (br.a1 + 1) / r) - log_k) / (br.a1 + 1))
+    value = math.exp(log_k + br.a1 * log_eps - math.log(br.a1))
+    bound = math.exp(log_k + (br.a1 + 1) * log_eps + math.log(r / (br.a1 + 1))) if r > 0 else 0.0
+    return math.exp(log_eps), value, bound
+
+
+def lower_mass(br, x, maxiter, hypf=None):
+    "Integral of the density of br from 0 to x <= 1, and its error estimate"
+    if x <= 0:
+        return 0.0, 0.0
+    eps, value, error = head(br, x)
+    if eps < x:
+        mass, mass_error = integrate_t(br, math.log(eps), math.log(x), maxiter, hypf)
+        value, error = value + mass, error + mass_error
+    return value, error
+
+
+def pdf_mass(br, a, b, maxiter, hypf=None):
+    """ Integral of the density of br over (a, b), where 0 <= a <= b <= inf, and its error estimate, with at most
+    maxiter rounds of refinement for each integral """
+    if a >= b:
+        return 0.0, 0.0
+    if a <= 0:
+        if b <= 1:
+            return lower_mass(br, b, maxiter, hypf)
+        value, error = lower_mass(br.invert(), 1 / b, maxiter, hypf)
+        return 1 - value, error
+    if math.isinf(b):
+        return lower_mass(br.invert(), 1 / a, maxiter, hypf)
+    return integrate_t(br, math.log(a), math.log(b), maxiter, hypf)
@@ -4,4 +4,4 @@ function, as seen in Grahm, Knuth, Patashnik's Concrete Mathematics, section 5.5
 # This makes the function we want accessible via:
 #     from betrat import rf_hyp2f1
 #     rf_hyp2f1.hyp2f1(...)
-from rf_hyp2f1 import hyp2f1
+from rf_hyp2f1 import hyp2f1, hyp2f1_array, path_stats, reset_path_stats, MAX_PREC
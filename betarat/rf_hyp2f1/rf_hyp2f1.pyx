@@ -1,9 +1,82 @@
+import numpy
 
 cdef extern from "rf_hyp2f1_core.h":
-    double rf_hyp2f1_core(double a, int b, double c, double w, int mpf_prec)
+    int RF_HYP2F1_MAX_PREC
+    double rf_hyp2f1_core(double a, int b, double c, double w, int mpf_prec) nogil
+    void rf_hyp2f1_core_array(double a, int b, double c, const double *w, double *out, int n, int mpf_prec) nogil
+    double rf_hyp2f1_adaptive(double a, int b, double c, double w, int max_prec, int *prec_used) nogil
+    void rf_hyp2f1_adaptive_array(double a, int b, double c, const double *w, double *out, int n, int max_prec,
+            int *prec_used) nogil
 
-def hyp2f1(double a, int b, double c, double w, int mpf_prec=300):
+MAX_PREC = RF_HYP2F1_MAX_PREC
+
+# Running counts of which path adaptive evaluations took; see path_stats
+cdef long long n_double = 0, n_mpf = 0, mpf_bits = 0
+
+cdef inline void record_path(int prec_used):
+    global n_double, n_mpf, mpf_bits
+    if prec_used == 0:
+        n_double += 1
+    else:
+        n_mpf += 1
+        mpf_bits += prec_used
+
+cdef record_paths(int[::1] prec_used):
+    cdef int i
+    for i in range(prec_used.shape[0]):
+        record_path(prec_used[i])
+
+def path_stats():
+    """ Counts of adaptive evaluations (mpf_prec=0) which took the double precision path and which needed GMP,
+    along with the total number of bits of precision used by the latter. """
+    return dict(double=n_double, mpf=n_mpf, mpf_bits=mpf_bits)
+
+def reset_path_stats():
+    "Reset the counts reported by path_stats"
+    global n_double, n_mpf, mpf_bits
+    n_double = n_mpf = mpf_bits = 0
+
+def hyp2f1(double a, int b, double c, double w, int mpf_prec=0, return_precision=False):
     """ Computes the hypergeometric function 2F1(a, b; c; z) using a finitely terminating, recursively
-    factored form of the function, as seen in Concrete Mathematics (Graham, Knuth, Patashnik - section 5.5). """
+    factored form of the function, as seen in Concrete Mathematics (Graham, Knuth, Patashnik - section 5.5).
+    By default (mpf_prec=0), the precision is chosen adaptively: the sum is evaluated in double precision along
+    with an estimate of how much precision its cancellation costs, and only evaluated with GMP (at a precision
+    chosen from that estimate) when doubles won't do. A positive mpf_prec instead always uses GMP at that
+    precision. If return_precision is set, a (value, precision) tuple is returned, where a precision of 0
+    means double precision was used. """
     assert b <= 0 and isinstance(b, (int, long))
-    return rf_hyp2f1_core(a, b, c, w, mpf_prec)
+    cdef int precision = mpf_prec
+    cdef double value
+    if mpf_prec > 0:
+        value = rf_hyp2f1_core(a, b, c, w, mpf_prec)
+    else:
+        value = rf_hyp2f1_adaptive(a, b, c, w, RF_HYP2F1_MAX_PREC, &precision)
+        record_path(precision)
+    if return_precision:
+        return value, precision
+    return value
+
+def hyp2f1_array(double a, int b, double c, w, int mpf_prec=0, return_precision=False):
+    """ Array version of hyp2f1, computing 2F1(a, b; c; w) for each value in the array w and returning an
+    ndarray (or with return_precision, a pair of ndarrays of values and precisions used). The high precision
+    temporaries are shared across the whole array, and the GIL is released while computing, so separate threads
+    can evaluate separate arrays in parallel. """
+    assert b <= 0
+    cdef double[::1] ws = numpy.ascontiguousarray(w, dtype=numpy.double).ravel()
+    out = numpy.empty(ws.shape[0])
+    precisions = numpy.full(ws.shape[0], mpf_prec, dtype=numpy.intc)
+    cdef double[::1] out_view = out
+    cdef int[::1] prec_view = precisions
+    cdef int n = ws.shape[0]
+    if n:
+        if mpf_prec > 0:
+            with nogil:
+                rf_hyp2f1_core_array(a, b, c, &ws[0], &out_view[0], n, mpf_prec)
+        else:
+            with nogil:
+                rf_hyp2f1_adaptive_array(a, b, c, &ws[0], &out_view[0], n, RF_HYP2F1_MAX_PREC, &prec_view[0])
+            record_paths(prec_view)
+    out = out.reshape(numpy.shape(w))
+    if return_precision:
+        return out, precisions.reshape(numpy.shape(w))
+    return out
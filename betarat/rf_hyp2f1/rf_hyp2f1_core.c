@@ -1,4 +1,5 @@
 #include <gmp.h>
+#include <math.h>
 #include <stdio.h>
 #include "rf_hyp2f1_core.h"
 
@@ -7,30 +8,26 @@
  * Patashnik. This recursively factored form terminates finitely when b is an integer. However, we do need to
  * use high precision arithmetic here, as there are significant parts of the domain where rounding errors lead
  * to numerically unstable solutions. */
-double rf_hyp2f1_core(double a, int b, double c, double w, int mpf_prec)
-{
-  double d_result;
-  mpf_t ma, mb, mc, mw;
-  mpf_t result;
 
+/* Evaluation for a single w, using temporaries which have already been initialized by the caller, so that they
+ * can be reused across many evaluations. */
+static double rf_hyp2f1_eval(double a, int b, double c, double w, mpf_t ma, mpf_t mb, mpf_t mc, mpf_t mw,
+    mpf_t result)
+{
   /* i = actual iterator; start_iter - the start iter. We go backwards! */  
   int i;
   int start_iter = -(b+1);
 
   /* This one will stay the same throughout */
-  mpf_init_set_d(mw, w);
+  mpf_set_d(mw, w);
 
   /* Init value for the fold is 1 */
-  mp_bitcnt_t prec = mpf_prec;
-  mpf_init2(result, prec);
   mpf_set_si(result, 1);
-  /*int p = mpf_get_prec(result);*/
-  /*printf("Current is %u\n", p);*/
 
   /* Going to be using and decrementing these in place... */
-  mpf_init_set_d(ma, a + start_iter);
-  mpf_init_set_si(mb, b + start_iter);
-  mpf_init_set_d(mc, c + start_iter);
+  mpf_set_d(ma, a + start_iter);
+  mpf_set_si(mb, b + start_iter);
+  mpf_set_d(mc, c + start_iter);
 
   /* Let the games begin */ 
   for (i = -(b+1); i >= 0; i--)
@@ -49,15 +46,146 @@ double rf_hyp2f1_core(double a, int b, double c, double w, int mpf_prec)
     mpf_sub_ui(mc, mc, 1);
   }
   /* extract as double */
-  d_result = mpf_get_d(result);
-  
-  /* Cleaning up shop */
+  return mpf_get_d(result);
+}
+
+/* The same recursion carried out in double precision. Alongside, we carry out the recursion on the absolute
+ * values of each factor, which gives the sum of the absolute values of the terms of the series. The ratio of
+ * this to the absolute value of the result measures how much cancellation there is in the sum, and hence how
+ * many bits of precision are lost when summing it. */
+static double rf_hyp2f1_double(double a, int b, double c, double w, double *abs_sum)
+{
+  int i;
+  int start_iter = -(b+1);
+  double result = 1, abs_result = 1, factor;
+  double da = a + start_iter, db = b + start_iter, dc = c + start_iter;
+
+  for (i = start_iter; i >= 0; i--)
+  {
+    factor = w * da * db / ((i + 1) * dc);
+    result = 1 + result * factor;
+    abs_result = 1 + abs_result * fabs(factor);
+    da -= 1;
+    db -= 1;
+    dc -= 1;
+  }
+  *abs_sum = abs_result;
+  return result;
+}
+
+/* Bits of precision needed for the sum to come out accurate to double precision, given the sum of absolute
+ * values of its terms and (an estimate of) its value, with n_terms terms. Returns 0 if the double precision
+ * evaluation is already accurate enough, and a value larger than any sensible precision if the estimate
+ * isn't usable. */
+static int needed_precision(double abs_sum, double value, int n_terms)
+{
+  double lost_bits, rounding_bits;
+  if (!isfinite(abs_sum) || !isfinite(value) || value == 0)
+    return RF_HYP2F1_MAX_PREC + 1;
+  /* Taking logs first, as the ratio itself can overflow */
+  lost_bits = log2(abs_sum) - log2(fabs(value));
+  /* Rounding errors in each of the terms may accumulate */
+  rounding_bits = log2(n_terms + 1.0);
+  if (lost_bits + rounding_bits <= RF_HYP2F1_DOUBLE_LOSS)
+    return 0;
+  if (lost_bits > RF_HYP2F1_MAX_PREC)
+    return RF_HYP2F1_MAX_PREC + 1;
+  /* Full double precision, the bits lost to cancellation and rounding, and a safety margin, rounded up to a
+   * multiple of 64 */
+  return ((int) ceil((53 + lost_bits + rounding_bits + 16) / 64)) * 64;
+}
+
+/* Evaluates at each of the n values in w with adaptively chosen precision, writing the results to out, and the
+ * precision used for each value to prec_used (0 meaning that double precision was used). The double precision
+ * evaluation is done first, and used if it shows little enough cancellation; otherwise we evaluate with GMP at
+ * the precision it suggests, increasing it (up to max_prec) if the GMP result shows even more cancellation than
+ * the double precision estimate did. The GMP temporaries are allocated once at max_prec. */
+void rf_hyp2f1_adaptive_array(double a, int b, double c, const double *w, double *out, int n, int max_prec,
+    int *prec_used)
+{
+  int k, prec, needed;
+  double value, abs_sum;
+  mpf_t ma, mb, mc, mw;
+  mpf_t result;
+
+  mpf_init2(result, max_prec);
+  mpf_init(ma);
+  mpf_init(mb);
+  mpf_init(mc);
+  mpf_init(mw);
+
+  for (k = 0; k < n; k++)
+  {
+    value = rf_hyp2f1_double(a, b, c, w[k], &abs_sum);
+    prec = needed_precision(abs_sum, value, -b);
+    while (prec > 0)
+    {
+      if (prec > max_prec)
+        prec = max_prec;
+      mpf_set_prec_raw(result, prec);
+      value = rf_hyp2f1_eval(a, b, c, w[k], ma, mb, mc, mw, result);
+      needed = needed_precision(abs_sum, value, -b);
+      if (needed <= prec || prec == max_prec)
+        break;
+      prec = needed;
+    }
+    out[k] = value;
+    prec_used[k] = prec;
+  }
+
+  /* The precision has to be restored to what was allocated before clearing */
+  mpf_set_prec_raw(result, max_prec);
   mpf_clear(result);
   mpf_clear(ma);
   mpf_clear(mb);
   mpf_clear(mc);
   mpf_clear(mw);
+}
+
+/* Scalar version of rf_hyp2f1_adaptive_array, writing the precision used to prec_used. When double precision
+ * suffices, as it usually does, no GMP temporaries are allocated at all. */
+double rf_hyp2f1_adaptive(double a, int b, double c, double w, int max_prec, int *prec_used)
+{
+  double value, abs_sum;
+  value = rf_hyp2f1_double(a, b, c, w, &abs_sum);
+  if (needed_precision(abs_sum, value, -b) == 0)
+  {
+    *prec_used = 0;
+    return value;
+  }
+  rf_hyp2f1_adaptive_array(a, b, c, &w, &value, 1, max_prec, prec_used);
+  return value;
+}
 
+double rf_hyp2f1_core(double a, int b, double c, double w, int mpf_prec)
+{
+  double d_result;
+  rf_hyp2f1_core_array(a, b, c, &w, &d_result, 1, mpf_prec);
   return d_result;
 }
 
+/* Evaluates at each of the n values in w, writing the results to out. The GMP temporaries are initialized once
+ * and shared by all of the evaluations. Since no python objects are touched, this can be run without the GIL. */
+void rf_hyp2f1_core_array(double a, int b, double c, const double *w, double *out, int n, int mpf_prec)
+{
+  int k;
+  mpf_t ma, mb, mc, mw;
+  mpf_t result;
+
+  mp_bitcnt_t prec = mpf_prec;
+  mpf_init2(result, prec);
+  mpf_init(ma);
+  mpf_init(mb);
+  mpf_init(mc);
+  mpf_init(mw);
+
+  for (k = 0; k < n; k++)
+    out[k] = rf_hyp2f1_eval(a, b, c, w[k], ma, mb, mc, mw, result);
+
+  /* Cleaning up shop */
+  mpf_clear(result);
+  mpf_clear(ma);
+  mpf_clear(mb);
+  mpf_clear(mc);
+  mpf_clear(mw);
+}
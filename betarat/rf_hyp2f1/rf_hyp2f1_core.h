@@ -1,6 +1,15 @@
 #ifndef RF_HYP2F1_CORE
 #define RF_HYP2F1_CORE
 
+/* Maximum number of bits of precision used by the adaptive evaluation */
+#define RF_HYP2F1_MAX_PREC 8192
+/* Number of bits which can be lost to cancellation before the double precision evaluation is abandoned */
+#define RF_HYP2F1_DOUBLE_LOSS 8
+
 double rf_hyp2f1_core(double a, int b, double c, double w, int mpf_prec);
+void rf_hyp2f1_core_array(double a, int b, double c, const double *w, double *out, int n, int mpf_prec);
+double rf_hyp2f1_adaptive(double a, int b, double c, double w, int max_prec, int *prec_used);
+void rf_hyp2f1_adaptive_array(double a, int b, double c, const double *w, double *out, int n, int max_prec,
+    int *prec_used);
 
 #endif /* _HYP2F1_ */
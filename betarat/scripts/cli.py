@@ -1,7 +1,15 @@
 
-from betarat import BetaRat, VERBOSE, defaults
+from betarat import BetaRat, BetaRatBatch, VERBOSE, defaults, cache, lookup, instrument, backends
+import betarat.betarat
 from betarat.version import __version__
+from collections import deque
+from itertools import islice
+import multiprocessing
 import argparse
+import csv
+import json
+import sys
+import os
 import time 
 
 
@@ -12,12 +20,13 @@ table_string = """
          fail   c    d
          """
 
-def setup_common_args(subparser):
+def setup_common_args(subparser, table=True):
     # Hmm... just discovered the parents attribute. Might want to try using this
-    subparser.add_argument('a', type=int, help='# sucesses in X1')
-    subparser.add_argument('b', type=int, help='# sucesses in X2')
-    subparser.add_argument('c', type=int, help='# failures in X1')
-    subparser.add_argument('d', type=int, help='# failures in X2')
+    if table:
+        subparser.add_argument('a', type=int, help='# sucesses in X1')
+        subparser.add_argument('b', type=int, help='# sucesses in X2')
+        subparser.add_argument('c', type=int, help='# failures in X1')
+        subparser.add_argument('d', type=int, help='# failures in X2')
 
     def cs_arg(arg_string):
         return arg_string.split(',')
@@ -31,15 +40,40 @@ def setup_common_args(subparser):
             action='store_const', dest='prior', const=(0.5, 1.0))
 
     subparser.add_argument('-m', '--quadr-maxiter', type=int, default=defaults['quadr_maxiter'],
-            help="Value of maxiter passed to the scipy.integrate.quadrature function for CDF computation.")
+            help="Most rounds of quadrature refinement for each numerically integrated CDF.")
     subparser.add_argument('-M', '--optim-maxiter', type=int, default=defaults['optim_maxiter'],
-            help="Value of maxiter passed to scipy.optimize.brenth for MAP and PPF computation.")
+            help="""Value of maxiter passed to scipy.optimize.brenth for PPF computation, and the maximum number of
+            Newton iterations for MAP computation.""")
+    subparser.add_argument('--exact-max-terms', type=int, default=defaults['exact_max_terms'],
+            help="""For integer parameters, compute the CDF exactly when the finite sum has at most this many
+            terms; 0 always integrates numerically. [default: %(default)s]""")
+    subparser.add_argument('--approx-tol', type=float, default=defaults['approx_tol'],
+            help="""Use the asymptotic (saddlepoint) approximation whenever its estimated error is within this
+            tolerance (absolute for CDFs, relative for MAP and PPFs), as it is for tables with large counts;
+            0 never approximates. [default: %(default)s]""")
+    subparser.add_argument('--hyp2f1', choices=['auto'] + list(backends.registry), default=defaults['hyp2f1'],
+            help="""How to compute the hypergeometric function in the density: auto picks the cheapest backend
+            which is valid for each evaluation (see betarat.backends). [default: %(default)s]""")
     subparser.add_argument('--no-inverting', action='store_true', default=False,
             help="""Unless this flag is specified, betarat may compute the desired metrics by transforming the
             values computed from the inverse BetaRatio distribution.""" )
+    subparser.add_argument('--cache', metavar='PATH',
+            help="""Cache results in an SQLite database at PATH, so that tables computed in previous runs (with
+            the same prior and settings) are not recomputed.""")
+    subparser.add_argument('--lookup', metavar='PATH',
+            help="""Answer from the precomputed lookup table at PATH (see the build-lookup subcommand) whenever
+            a table falls within its grid.""")
+    subparser.add_argument('--stats', metavar='PATH', nargs='?', const='-',
+            help="""Write counts and timings of the pdf and hyp2f1 evaluations, quadrature rounds, root finder
+            iterations and so on (see betarat.instrument) as JSON to PATH, or to stderr if no PATH is given.""")
     subparser.add_argument('-v', '--verbose', action='store_true', default=False)
 
 
+def settings(args):
+    "Keyword args for BetaRat methods, from the settings given on the command line"
+    return dict((k, getattr(args, k)) for k in defaults)
+
+
 def setup_cli_br(args):
     br_params = [getattr(args, x) for x in ['a', 'b', 'c', 'd']]
     beta_rat = BetaRat(*br_params, no_inverting=args.no_inverting, prior=args.prior)
@@ -66,9 +100,9 @@ def setup_ppf_args(subparsers):
     def func(args):
         br = setup_cli_br(args)
         if args.simpson:
-            result = br.ppf(args.q, method="simpson", h_init=args.h_init)
+            result = br.ppf(args.q, method="simpson", h_init=args.h_init, hyp2f1=args.hyp2f1)
         else:
-            result = br.ppf(args.q, quadr_maxiter=args.quadr_maxiter, optim_maxiter=args.optim_maxiter)
+            result = br.ppf(args.q, **settings(args))
 
         print "\nPPF({}) = {}\n".format(args.q, result)
         
@@ -82,10 +116,17 @@ def setup_cdf_args(subparsers):
     setup_common_args(cdf_args)
     cdf_args.add_argument('w', type=float, help='integrate ppf from 0 to w [default: %(default)s]', nargs="?",
             default=1.0)
+    cdf_args.add_argument('--alpha', type=float,
+            help="""Only decide whether CDF(w) < ALPHA, which for most tables takes far less work than computing
+            the CDF to full accuracy.""")
 
     def func(args):
         br = setup_cli_br(args)
-        result = br.cdf(args.w, quadr_maxiter=args.quadr_maxiter)
+        if args.alpha is not None:
+            result = br.cdf_below(args.w, args.alpha, **settings(args))
+            print "\nCDF({}) < {}: {}\n".format(args.w, args.alpha, result)
+            return
+        result = br.cdf(args.w, **settings(args))
 
         print "\nCDF({}) = {}\n".format(args.w, result)
 
@@ -99,14 +140,331 @@ def setup_map_args(subparsers):
 
     def func(args):
         br = setup_cli_br(args)
-        result = br.map(quadr_maxiter=args.quadr_maxiter, optim_maxiter=args.quadr_maxiter)
+        result = br.map(**settings(args))
 
         print "\nMAP = {}\n".format(result)
 
     map_args.set_defaults(func=func)
 
 
-def main():
+def batch_columns(args):
+    "List of (name, quantity, argument) for the output columns requested of the batch subcommand"
+    columns = [('cdf_{}'.format(w), 'cdf', w) for w in (args.cdf or [])]
+    if args.map:
+        columns.append(('map', 'map', None))
+    columns += [('ppf_{}'.format(q), 'ppf', q) for q in (args.ppf or [])]
+    columns = columns or [('cdf_1.0', 'cdf', 1.0)]
+    if args.alpha is not None:
+        # Each CDF column becomes a 0/1 column of whether it's below alpha
+        columns = [('{}<{}'.format(name, args.alpha), 'cdf_below', (arg, args.alpha)) if quantity == 'cdf'
+                else (name, quantity, arg) for name, quantity, arg in columns]
+    if args.monte_carlo:
+        # Each Monte Carlo estimate is followed by its standard error
+        with_se = []
+        for name, quantity, arg in columns:
+            with_se.append((name, quantity, arg))
+            if quantity != 'map':
+                with_se.append((name + '_se', quantity + '_se', arg))
+        columns = with_se
+    return columns
+
+
+def read_tables(infile, sep, skip_header):
+    "Lazily parse (a, b, c, d) tables from a TSV/CSV stream"
+    lines = iter(infile)
+    if skip_header:
+        next(lines, None)
+    for line_no, line in enumerate(lines, 2 if skip_header else 1):
+        line = line.strip()
+        if not line:
+            continue
+        if sep is None:
+            sep = ',' if ',' in line else '\t'
+        fields = line.split(sep)
+        try:
+            a, b, c, d = [int(x) for x in fields]
+        except ValueError:
+            raise ValueError("Line {}: expected 4 integer counts a,b,c,d but got {!r}".format(line_no, line))
+        yield a, b, c, d
+
+
+def compute_chunk(tables, columns, prior, no_inverting, kw_args, monte_carlo=None, budget=None):
+    """ Compute the output rows for a chunk of tables; module level so that it can run in pool workers. If
+    monte_carlo is given, as (samples, seed, index of the chunk's first row), the cdf and ppf columns are Monte
+    Carlo estimates (see BetaRatBatch.mc_cdf), drawn from per-row streams. If budget is given, as (max_seconds,
+    max_evaluations), each table is computed on its own within that budget (see instrument.budget), and each row
+    ends with a status column: 'ok', or 'over_budget' for tables which ran over it, whose columns are left as nan. """
+    if budget is not None:
+        rows = []
+        for i, table in enumerate(tables):
+            row_monte_carlo = monte_carlo and monte_carlo[:2] + (monte_carlo[2] + i,)
+            try:
+                with instrument.budget(*budget):
+                    row, = compute_chunk([table], columns, prior, no_inverting, kw_args, row_monte_carlo)
+                rows.append(row + ['ok'])
+            except instrument.BudgetExceeded:
+                rows.append(list(table) + ['nan'] * len(columns) + ['over_budget'])
+        return rows
+    batch = BetaRatBatch(*zip(*tables), no_inverting=no_inverting, prior=prior)
+    results = []
+    for name, quantity, arg in columns:
+        if monte_carlo and quantity.endswith('_se'):
+            # batch_columns puts each standard error column straight after its estimate
+            results.append(estimates[1])
+        elif monte_carlo and quantity != 'map':
+            size, seed, first_row = monte_carlo
+            estimator = batch.mc_cdf if quantity == 'cdf' else batch.mc_ppf
+            estimates = estimator(arg, size=size, seed=seed, first_row=first_row)
+            results.append(estimates[0])
+        elif quantity == 'cdf':
+            results.append(batch.cdf(arg, **kw_args))
+        elif quantity == 'cdf_below':
+            results.append(batch.cdf_below(*arg, **kw_args).astype(int))
+        elif quantity == 'map':
+            results.append(batch.map(**kw_args))
+        else:
+            results.append(batch.ppf(arg, **kw_args))
+    return [list(table) + [repr(col[i].item()) for col in results] for i, table in enumerate(tables)]
+
+
+def compute_chunk_with_stats(*chunk_args):
+    """ compute_chunk, also returning the instrumentation stats recorded while computing it (as a dict), so
+    that they can be collected from pool workers """
+    with instrument.recording() as stats:
+        rows = compute_chunk(*chunk_args)
+    return rows, stats.as_dict()
+
+
+def completed_rows(path, header):
+    """ Whether path already starts with the given header, and the number of result rows written after it, by an
+    earlier run of the batch subcommand, truncating any partly written last line, so that the run can be resumed
+    after them """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False, 0
+    with open(path, 'r+') as outfile:
+        lines = outfile.readlines()
+        if not lines[0].endswith('\n'):
+            # Not even the header made it
+            outfile.truncate(0)
+            return False, 0
+        if lines[0].rstrip('\n').split('\t') != header:
+            raise ValueError("Can't resume {}, which was written with different columns".format(path))
+        complete = lines if lines[-1].endswith('\n') else lines[:-1]
+        outfile.truncate(sum(len(line) for line in complete))
+    return True, len(complete) - 1
+
+
+def setup_batch_args(subparsers):
+    batch_args = subparsers.add_parser('batch',
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            description="""Compute cdf/map/ppf columns of the beta ratio (X1/X2) distribution for a stream of
+tables, one per line as a,b,c,d (tab or comma separated), where each table is
+{}
+Results are written as tab separated rows, in input order, with a header line.""".format(table_string))
+    batch_args.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin,
+            help='File of tables [default: stdin]')
+    batch_args.add_argument('-o', '--output', help='Output file [default: stdout]')
+    batch_args.add_argument('--cdf', type=float, action='append', metavar='W',
+            help='Add a CDF(W) column; may be repeated. [default: CDF(1.0) if no columns are specified]')
+    batch_args.add_argument('--map', action='store_true', default=False, help='Add a MAP column.')
+    batch_args.add_argument('--ppf', type=float, action='append', metavar='Q',
+            help='Add a PPF(Q) column; may be repeated.')
+    batch_args.add_argument('--alpha', type=float,
+            help="""Instead of each CDF column, output 1 where the CDF is below ALPHA and 0 otherwise, which for
+            most tables takes far less work than computing the CDF to full accuracy.""")
+    batch_args.add_argument('--sep', help='Input field separator [default: detected from the first line]')
+    batch_args.add_argument('--header', action='store_true', default=False,
+            help='Skip the first line of input')
+    batch_args.add_argument('-j', '--jobs', type=int, default=1,
+            help='Number of worker processes. [default: %(default)s]')
+    batch_args.add_argument('--chunk-size', type=int, default=1000,
+            help="""Number of tables handed to a worker at a time; at most 2 chunks per worker are held in
+            memory. [default: %(default)s]""")
+    batch_args.add_argument('--monte-carlo', type=int, metavar='N',
+            help="""Estimate the cdf and ppf columns from N samples of each table instead of computing them,
+            adding a standard error column after each. Much faster, but only accurate to a few digits.""")
+    batch_args.add_argument('--seed', type=int, default=0,
+            help="""Seed for --monte-carlo. Each row is sampled from its own stream, seeded by the seed and the
+            row's position in the input, so results don't depend on -j or --chunk-size. [default: %(default)s]""")
+    batch_args.add_argument('--resume', action='store_true', default=False,
+            help="""Carry on from the rows already in the output file, left by an earlier run with the same input
+            and columns, rather than starting over. Each chunk is flushed to disk as it is written, so a killed
+            run loses at most the chunks it was computing.""")
+    batch_args.add_argument('--max-seconds', type=float,
+            help="""Give up on any table taking longer than this, marking it over_budget in a status column
+            rather than stalling the run.""")
+    batch_args.add_argument('--max-evals', type=int,
+            help="""Give up on any table taking more than this many pdf evaluations, marking it over_budget in a
+            status column.""")
+    setup_common_args(batch_args, table=False)
+
+    def func(args):
+        if args.alpha is not None and args.monte_carlo:
+            batch_args.error("--alpha can't be used with --monte-carlo")
+        if args.output == '-':
+            args.output = None
+        if args.resume and not args.output:
+            batch_args.error("--resume needs an output file")
+        columns = batch_columns(args)
+        kw_args = settings(args)
+        budget = None
+        header = ['a', 'b', 'c', 'd'] + [name for name, _, _ in columns]
+        if args.max_seconds is not None or args.max_evals is not None:
+            budget = (args.max_seconds, args.max_evals)
+            header.append('status')
+
+        try:
+            has_header, done = completed_rows(args.output, header) if args.resume else (False, 0)
+        except ValueError as e:
+            sys.exit("betarat batch: {}".format(e))
+        tables = islice(read_tables(args.input, args.sep, args.header), done, None)
+        chunks = iter(lambda: list(islice(tables, args.chunk_size)), [])
+        def chunk_args(chunk_index, chunk):
+            first_row = done + chunk_index * args.chunk_size
+            monte_carlo = args.monte_carlo and (args.monte_carlo, args.seed, first_row)
+            return chunk, columns, tuple(args.prior), args.no_inverting, kw_args, monte_carlo, budget
+
+        if not args.output:
+            outfile = sys.stdout
+        else:
+            outfile = open(args.output, 'a' if args.resume else 'w')
+        writer = csv.writer(outfile, delimiter='\t', lineterminator='\n')
+        if not has_header:
+            writer.writerow(header)
+
+        def write_rows(rows):
+            # Each chunk is a checkpoint, so it goes all the way to disk before the next one is written
+            writer.writerows(rows)
+            outfile.flush()
+            if outfile is not sys.stdout:
+                os.fsync(outfile.fileno())
+
+        def write_worker_rows(result):
+            if args.stats:
+                rows, stats = result
+                instrument.current.merge(stats)
+            else:
+                rows = result
+            write_rows(rows)
+
+        try:
+            if args.jobs > 1:
+                pool = multiprocessing.Pool(args.jobs)
+                task = compute_chunk_with_stats if args.stats else compute_chunk
+                try:
+                    pending = deque()
+                    for chunk_index, chunk in enumerate(chunks):
+                        pending.append(pool.apply_async(task, chunk_args(chunk_index, chunk)))
+                        if len(pending) >= 2 * args.jobs:
+                            write_worker_rows(pending.popleft().get())
+                    while pending:
+                        write_worker_rows(pending.popleft().get())
+                    pool.close()
+                finally:
+                    # Doesn't leave workers behind if reading or computing a chunk fails
+                    pool.terminate()
+                    pool.join()
+            else:
+                for chunk_index, chunk in enumerate(chunks):
+                    write_rows(compute_chunk(*chunk_args(chunk_index, chunk)))
+        except ValueError as e:
+            sys.exit("betarat batch: {}".format(e))
+        finally:
+            if outfile is not sys.stdout:
+                outfile.close()
+
+    batch_args.set_defaults(func=func)
+
+
+def setup_build_lookup_args(subparsers):
+    lookup_args = subparsers.add_parser('build-lookup',
+            description="""Precompute CDF(1.0), MAP and a set of quantiles for every table with all counts <= N,
+            writing them to a binary lookup table which can then be used with --lookup.""")
+    lookup_args.add_argument('output', help='Path of the lookup table to write')
+    lookup_args.add_argument('-n', type=int, default=20, help='Maximum count in the grid. [default: %(default)s]')
+    lookup_args.add_argument('--quantiles', type=lambda s: tuple(float(q) for q in s.split(',')),
+            default=lookup.DEFAULT_QUANTILES,
+            help='Comma separated list of quantiles to store. [default: %(default)s]')
+    lookup_args.add_argument('--float32', action='store_true', default=False,
+            help='Store results in single precision, halving the size of the table.')
+    lookup_args.add_argument('-j', '--jobs', type=int, default=1,
+            help='Number of worker processes. [default: %(default)s]')
+    setup_common_args(lookup_args, table=False)
+
+    def func(args):
+        pool = multiprocessing.Pool(args.jobs) if args.jobs > 1 else None
+        try:
+            lookup.build(args.output, args.n, prior=tuple(args.prior), quantiles=args.quantiles,
+                    dtype='float32' if args.float32 else 'float64', pool=pool, **settings(args))
+            if pool:
+                pool.close()
+        finally:
+            # Doesn't leave workers behind if the build fails
+            if pool:
+                pool.terminate()
+                pool.join()
+
+    lookup_args.set_defaults(func=func)
+
+
+def setup_serve_args(subparsers):
+    serve_args = subparsers.add_parser('serve',
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            description="""Serve cdf/map/ppf requests over a local socket, keeping the library loaded between
+them. Each request is a line of JSON, such as
+
+    {"id": 1, "op": "cdf", "table": [5, 7, 20, 19], "w": 1.2}
+
+and is answered by a line {"id": 1, "result": ...} (see betarat.server for the details). The prior and settings
+given here are the defaults for requests which don't specify their own.""")
+    address_group = serve_args.add_mutually_exclusive_group()
+    address_group.add_argument('--socket', metavar='PATH', help='Listen on a Unix socket at PATH.')
+    address_group.add_argument('--port', type=int, default=7681,
+            help='Listen on this TCP port of --host. [default: %(default)s]')
+    serve_args.add_argument('--host', default='127.0.0.1', help='[default: %(default)s]')
+    serve_args.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+            help="""Number of worker processes; 0 computes in the server's connection threads.
+            [default: %(default)s]""")
+    serve_args.add_argument('--max-pending', type=int, default=64,
+            help="""Maximum number of computations queued or running at once; further requests wait for
+            room. [default: %(default)s]""")
+    setup_common_args(serve_args, table=False)
+
+    def func(args):
+        # Imported here, so that the other subcommands don't pay for loading the socket server machinery
+        from betarat import server
+        address = args.socket or (args.host, args.port)
+        service = server.Service(jobs=args.jobs, max_pending=args.max_pending, prior=args.prior,
+                settings=settings(args))
+        try:
+            socket_server = server.make_server(address, service)
+            print >> sys.stderr, "betarat serve: listening on", socket_server.server_address
+            try:
+                socket_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                socket_server.server_close()
+                if args.socket and os.path.exists(args.socket):
+                    os.remove(args.socket)
+        finally:
+            service.close()
+
+    serve_args.set_defaults(func=func)
+
+
+def write_stats(stats, path):
+    "Dump stats as JSON to path, or to stderr if path is '-'"
+    outfile = sys.stderr if path == '-' else open(path, 'w')
+    try:
+        json.dump(stats.as_dict(), outfile, indent=1, sort_keys=True)
+        outfile.write('\n')
+    finally:
+        if outfile is not sys.stderr:
+            outfile.close()
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
             description="""
     Beta Rat (v {})!!! Awesome Bayesian contingency table stats!
@@ -120,16 +478,31 @@ def main():
     setup_ppf_args(subparsers)
     setup_cdf_args(subparsers)
     setup_map_args(subparsers)
+    setup_batch_args(subparsers)
+    setup_build_lookup_args(subparsers)
+    setup_serve_args(subparsers)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     global VERBOSE
-    VERBOSE = args.verbose
+    # The library reads its own module global, so that needs setting as well as ours
+    VERBOSE = betarat.betarat.VERBOSE = args.verbose
 
     if VERBOSE:
         t0 = time.time()
 
-    args.func(args)
+    if args.cache:
+        cache.enable(path=args.cache)
+    if args.lookup:
+        lookup.load(args.lookup)
+
+    if args.stats:
+        with instrument.recording() as stats:
+            with instrument.span('total'):
+                args.func(args)
+        write_stats(stats, args.stats)
+    else:
+        args.func(args)
 
     if VERBOSE:
         t1 = time.time()
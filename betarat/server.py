@@ -0,0 +1,232 @@
+"""
+A long lived server answering BetaRat cdf, map and ppf requests over a local socket, so that callers don't pay for
+starting an interpreter and importing scipy on every computation (see `betarat serve`). The protocol is line
+delimited JSON: each request is a line such as
+
+    {"id": 1, "op": "cdf", "table": [5, 7, 20, 19], "w": 1.2}
+    {"id": 2, "op": "ppf", "table": [5, 7, 20, 19], "q": 0.05, "prior": [0.5, 0.5]}
+    {"id": 3, "op": "map", "table": [5, 7, 20, 19], "settings": {"optim_maxiter": 100}}
+
+and is answered by a line {"id": ..., "result": ...}, or {"id": ..., "error": "..."} if it couldn't be computed.
+w and q default to 1.0 and 0.05, as on the command line, and prior and settings (see betarat.defaults) to those
+the server was started with. {"op": "stats"} returns counts of the requests served so far.
+
+Requests on a connection are answered in order; for concurrency, open several connections, each of which is
+served by its own thread. Requests for the same quantity of the same canonical table (folding tables together
+with their inverses, as for the result cache) which arrive while it's still being computed wait on that
+computation rather than starting another. The computations themselves run in a pool of worker processes, and at
+most max_pending of them are queued or running at once: beyond that, requests wait before being submitted, so
+that a burst of requests slows the clients down rather than growing the queue without bound.
+"""
+
+from __future__ import division
+import SocketServer
+import multiprocessing
+import threading
+import signal
+import json
+import os
+from betarat import BetaRat, defaults, cache_folding
+from utils import canonical_params
+import cache
+
+
+# Default argument for each op, and the name its results are cached (and folded) under
+OPS = dict(
+        cdf=('w', 1.0, 'cdf'),
+        ppf=('q', 0.05, 'optim_ppf'),
+        map=(None, None, 'map'))
+
+
+def compute(task):
+    """ Compute a quantity for a table given by its posterior params, returning (True, result) or (False,
+    error message). Module level, so that it can be sent to pool workers. """
+    params, quantity, arg, settings = task
+    try:
+        br = BetaRat(*params, no_inverting=True, prior=(0, 0))
+        method = getattr(br, quantity)
+        result = method(**settings) if arg is None else method(arg, **settings)
+        return True, result if result == 'NA' else float(result)
+    except Exception as e:
+        return False, "{}: {}".format(type(e).__name__, e)
+
+
+def ignore_interrupts():
+    "Pool worker initializer, leaving Ctrl-C to the server process, which shuts the pool down"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class RequestError(Exception):
+    "A request which can't be understood"
+    pass
+
+
+class Pending(object):
+    "A computation in flight, which any number of requests may wait on"
+    def __init__(self):
+        self.done = threading.Event()
+        self.outcome = None
+
+    def finish(self, outcome):
+        self.outcome = outcome
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        return self.outcome
+
+
+class Service(object):
+    """ Answers requests (as dicts), coalescing those for the same computation. Computations go to a pool of
+    jobs worker processes, or are run in the requesting thread if jobs is 0. prior and settings are the defaults
+    for requests which don't give their own. """
+    def __init__(self, jobs=None, max_pending=64, prior=(1.0, 1.0), settings=None):
+        self.pool = multiprocessing.Pool(jobs, ignore_interrupts) if jobs != 0 else None
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.prior = tuple(prior)
+        self.settings = dict(defaults, **(settings or {}))
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.counts = dict(requests=0, computed=0, coalesced=0, errors=0)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def parse(self, request):
+        """ The cache key of a request's computation, the task computing it, and a function taking the task's
+        result to the request's. Tables are computed in their canonical orientation wherever the quantity can
+        be folded over (see betarat.cache_folding). """
+        if not isinstance(request, dict):
+            raise RequestError("Requests must be JSON objects")
+        op = request.get('op')
+        if op not in OPS:
+            raise RequestError("Unknown op {!r}; choose from {}".format(op, ', '.join(sorted(OPS) + ['stats'])))
+        arg_name, arg_default, quantity = OPS[op]
+        try:
+            a, b, c, d = [float(x) for x in request['table']]
+            prior = [float(x) for x in request.get('prior', self.prior)]
+            arg = float(request.get(arg_name, arg_default)) if arg_name else None
+        except (KeyError, TypeError, ValueError):
+            raise RequestError("Requests need a table of 4 counts, and numeric priors and arguments")
+        if len(prior) != 2:
+            raise RequestError("prior must be a pair")
+        settings = dict(self.settings)
+        for name, value in (request.get('settings') or {}).items():
+            if name not in defaults:
+                raise RequestError("Unknown setting {!r}".format(name))
+            settings[str(name)] = str(value) if isinstance(value, unicode) else value
+        params, inverted = canonical_params(a + prior[0], b + prior[0], c + prior[1], d + prior[1])
+        if quantity in cache_folding:
+            fold, unfold = cache_folding[quantity]
+            if inverted:
+                arg = fold(arg)
+            else:
+                unfold = lambda result: result
+            key = cache.make_key(params, quantity, arg, settings)
+        else:
+            if inverted:
+                params = (params[1], params[0], params[3], params[2])
+            key = cache.make_key(params, quantity, None, settings)
+            unfold = lambda result: result
+        return key, (params, quantity, arg, settings), unfold
+
+    def run(self, task):
+        "Compute task, in the pool if there is one, blocking until it's done"
+        if self.pool is None:
+            return compute(task)
+        return self.pool.apply_async(compute, (task,)).get()
+
+    def submit(self, key, task):
+        """ The outcome of task, either computing it or waiting on the computation already in flight for key """
+        with self.lock:
+            pending = self.in_flight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.in_flight[key] = Pending()
+                self.counts['computed'] += 1
+            else:
+                self.counts['coalesced'] += 1
+        if owner:
+            # Waits here for room when max_pending computations are already underway
+            self.slots.acquire()
+            try:
+                outcome = self.run(task)
+            except Exception as e:
+                outcome = False, "{}: {}".format(type(e).__name__, e)
+            finally:
+                self.slots.release()
+                with self.lock:
+                    del self.in_flight[key]
+            pending.finish(outcome)
+        return pending.wait()
+
+    def handle(self, request):
+        "The response dict for a request dict"
+        self.count('requests')
+        response = dict(id=request.get('id')) if isinstance(request, dict) else dict(id=None)
+        if isinstance(request, dict) and request.get('op') == 'stats':
+            with self.lock:
+                response['result'] = dict(self.counts, in_flight=len(self.in_flight))
+            return response
+        try:
+            key, task, unfold = self.parse(request)
+        except RequestError as e:
+            self.count('errors')
+            response['error'] = str(e)
+            return response
+        ok, result = self.submit(key, task)
+        if ok:
+            response['result'] = result if result == 'NA' else unfold(result)
+        else:
+            self.count('errors')
+            response['error'] = result
+        return response
+
+    def handle_line(self, line):
+        "The response line for a request line"
+        try:
+            request = json.loads(line)
+        except ValueError:
+            self.count('requests')
+            self.count('errors')
+            response = dict(id=None, error="Requests must be JSON")
+        else:
+            response = self.handle(request)
+        return json.dumps(response) + '\n'
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    "Answers each line read from a connection in turn"
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if line.strip():
+                self.wfile.write(self.server.service.handle_line(line))
+                self.wfile.flush()
+
+
+class ThreadingTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadingUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(address, service):
+    """ Socket server answering requests with service, listening on address: a (host, port) pair for TCP, or
+    the path of a Unix socket (replacing any stale socket file there). Call serve_forever on the result. """
+    if isinstance(address, basestring):
+        if os.path.exists(address):
+            os.remove(address)
+        server = ThreadingUnixServer(address, RequestHandler)
+    else:
+        server = ThreadingTCPServer(tuple(address), RequestHandler)
+    server.service = service
+    return server
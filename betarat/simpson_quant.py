@@ -4,42 +4,28 @@ functions by integrating along the domain until it reaches the point x where the
 obtained. It repeats this process for smaller and smaller step sizes until x has converged within some
 tolerance.
 
+The evaluations are kept on a single uniform grid which only ever grows: it is extended to the right in vectorized
+blocks as more of the domain is needed, and refined by evaluating the midpoints of the existing points (again in one
+block) when the step size is halved. The grid at twice the step size is just every other point, so successive
+levels never need to be evaluated separately, and a refinement, or a second quantile, only costs the new points.
+
 Currently, this implemementation is limited in that the primary function it provides, simpson_quant_hp, only
 works on a half plain. The underlying machinery could be made to work in general using a different transform,
 but only the half plain is needed here.
 """
 
+from __future__ import division
+import numpy as np
 import betarat
-
-class EvalSet(object):
-    """ This class keeps track of evaluations of a function under question and enables us to fetch the x
-    values from the evaluations arose """
-    def __init__(self, f, a, h):
-        """ f = function to evaluate; a = initial f input; h = incremement between succesive value of x """
-        self.f = f
-        self.a, self.h = a, h
-        self.evaluations = []
-
-    def __getitem__(self, index):
-        """ Fetch correponding index item, or create it if doesn't exist (just appends, so don't want to use
-        this if the index is not len(self.evaluations) """
-        try:
-            return self.evaluations[index]
-        except IndexError:
-            y = self.f(self.a + self.h*index)
-            self.evaluations.append(y)
-            return y
-
-    def x_at(self, index):
-        """ Computes the value of x which produced the f evaluation at a given index in evaluations list """
-        return self.a + index * self.h
+import instrument
 
 
 class MissingMass(Exception):
     """MissingMass - if you expect that it should be possible to integrate up to a certain value (for
     example, if you have a probability distribution, it should be possible to construct an integral with any
     value 0 < x < 1), but after reaching the end of the domain this mass has not been obtained, this is an
-    indication that your step size is too large, and that it needs to be greatly decreased."""
+    indication that your step size is too large, and that it needs to be greatly decreased. SimpsonQuantiles
+    refines its grid when this happens, and only raises this once it has been refined max_levels times."""
     pass
 
 class MaxSumReached(Exception):
@@ -50,110 +36,116 @@ class MaxSumReached(Exception):
     pass
 
 
-def determine_eval_set(i, n):
-    """ Awesome Aaron G. Magic Sauce - operation that find the least significant digit in the
-    bitwise and operation, as this will be the index of the eval set that we will need when n
-    is the depth of our eval_set_list (init dept==0)."""
-    i %= 2 ** n
-    for e in xrange(n, -1, -1):
-        if i & 1:
-            return e
-        i >>= 1
-    return 0
-
-def inner_index(i, n, j):
-    """ The 'inner_index', returned from this function for figuring out from the outer index (i), the depth
-    (n) and the eval_set_index (j), is the current index of the value in the corresponding eval_set's
-    evaluation list. The conditional on the exponent is to account for the distance between the first level
-    being the same as the second """
-    lower_exp = (n - j) if j == 0 else (n - j) + 1
-    return int((i - 2 ** (n - j)) / 2 ** lower_exp)
-
-def navigate(eval_sets, max_iter):
-    """ This is how we iterate through the eval sets and their evaluations """
-    depth = len(eval_sets) - 1
-    for outer_index in xrange(1, max_iter):
-        es_index = determine_eval_set(outer_index, depth)
-        yield outer_index, eval_sets[es_index], inner_index(outer_index, depth, es_index)
-
-
-def simpson_quant_hp(f, q, a=0, tolerance=5e-4, h_init=0.005, max_sum=None):
+class SimpsonQuantiles(object):
+    """ Quantiles of the density f over [a, inf), computed by Simpson integration after the half infinite
+    interval transform x = a + t / (1 - t), which takes [a, inf) to [0, 1). Evaluations are shared between all
+    of the quantiles asked of the same instance. """
+    def __init__(self, f, a=0, h_init=0.005, max_sum=None, max_levels=12):
+        """ f = density, which must accept arrays of x; h_init = initial step size in t; max_sum and max_levels
+        as for simpson_quant_hp """
+        self.f = f
+        self.a = a
+        self.max_sum = max_sum
+        self.max_levels = max_levels
+        # The grid points are t_i = i / n, of which the first len(values) have been evaluated; t = 1 (x = inf)
+        # is never evaluated
+        self.n = max(2, int(round(1 / h_init)))
+        self.values = np.empty(0)
+        self.levels = 0
+
+    def g(self, t):
+        "Transform from t in [0, 1) back to x in [a, inf)"
+        return self.a + t / (1 - t)
+
+    def transformed(self, t):
+        "The density in t coordinates: f(g(t)) g'(t)"
+        return self.f(self.g(t)) / (1 - t) ** 2
+
+    def extend(self):
+        """ Evaluate the next block of grid points, doubling the number evaluated (at least 16 more) but stopping
+        short of t = 1. Returns False if the grid was already complete. """
+        start = len(self.values)
+        stop = min(max(2 * start, start + 16), self.n)
+        if start >= stop:
+            return False
+        if not self.levels:
+            self.levels = 1
+            instrument.count('simpson_levels')
+        self.values = np.concatenate([self.values, self.transformed(np.arange(start, stop) / self.n)])
+        return True
+
+    def refine(self):
+        """ Halve the step size, evaluating the midpoints between the points evaluated so far in one block """
+        if self.levels >= self.max_levels:
+            raise MissingMass
+        midpoints = self.transformed((2 * np.arange(len(self.values) - 1) + 1) / (2 * self.n))
+        values = np.empty(2 * len(self.values) - 1)
+        values[::2] = self.values
+        values[1::2] = midpoints
+        self.values = values
+        self.n *= 2
+        self.levels += 1
+        instrument.count('simpson_levels')
+        if betarat.VERBOSE:
+            print "Depth level:", self.levels, "   h:", 1 / self.n
+
+    def cumulative(self, stride):
+        """ Composite Simpson integrals over [0, t] at every other point of the grid with step stride / n (that
+        is, using every stride-th evaluation), along with the step between those points """
+        v = self.values[::stride]
+        pairs = max((len(v) - 1) // 2, 0)
+        h = stride / self.n
+        sums = (v[0:2 * pairs:2] + 4 * v[1:2 * pairs:2] + v[2:2 * pairs + 1:2]) * (h / 3)
+        masses = np.concatenate([[0.0], np.cumsum(sums)])
+        if self.max_sum and masses[-1] > self.max_sum:
+            raise MaxSumReached
+        return masses, 2 * h
+
+    def locate(self, q, stride):
+        """ The t at which the integral reaches q on the grid with step stride / n, interpolating linearly
+        between the points bracketing it, or None if the whole grid holds less than q """
+        while True:
+            masses, step = self.cumulative(stride)
+            if masses[-1] > q:
+                break
+            if not self.extend():
+                return None
+        i = np.searchsorted(masses, q, side='right')
+        return step * (i - 1 + (q - masses[i - 1]) / (masses[i] - masses[i - 1]))
+
+    def quantile(self, q, tolerance=5e-4):
+        """ The x at which the integral of f from a reaches q, refining the grid until the estimates at the
+        finest step and at twice that step agree to within a relative tolerance """
+        with instrument.span('simpson'):
+            while True:
+                fine = self.locate(q, 1)
+                if fine is None:
+                    # The mass we're looking for is all lumped up in between the grid points somewhere
+                    instrument.count('simpson_restarts')
+                    if betarat.VERBOSE:
+                        print "Missing mass - refining grid"
+                    self.refine()
+                    continue
+                coarse = self.locate(q, 2)
+                if coarse is not None and abs(self.g(fine) - self.g(coarse)) <= tolerance * self.g(fine):
+                    return self.g(fine)
+                self.refine()
+
+
+def simpson_quant_hp(f, q, a=0, tolerance=5e-4, h_init=0.005, max_sum=None, max_levels=12):
     """ Simpson Half Plane Quantiles - uses a half infinite interval transform to give finite bounds for
-    integration of pdf (all that is needed for the beta_rat distribution since D = [0, \inf)).
-    
+    integration of pdf (all that is needed for the beta_rat distribution since D = [0, \inf)). f must accept
+    arrays of x. q may be a single quantile or a sequence of them, in which case a list is returned, and all of
+    the quantiles are computed from the same set of evaluations.
+
     max_sum: If the summation exceeds this value, the assumption will be that something has gone wrong (useful
     if you know, for example, that your integration should never exceed 1.0 - allows you to catch numerical
     instabilities, as found in compoutation of the hypergeometric).
-    tolerance: Convergence criteria
+    tolerance: Convergence criteria, on the relative change in x from halving the step size
     h_init: initial incremement for Simpson integration
+    max_levels: Number of times the step size may be halved before giving up with MissingMass
     """
-
-    # XXX - Should still really put something in as we were doing that flips the function around the x-axis. Wouldn't
-    # be hard and would likely save us a lot of hassle
-    
-    g = lambda t: a + t / (1 - t)
-    g_ = lambda t: 1 / (1 - t) ** 2
-    f_ = lambda t: f(g(t)) * g_(t)
-
-    def next_level(eval_sets, h):
-        # This handles the next eval_set down
-        stop_at = q * (3/h)
-        cur_sum = f_(0)
-        # Depth is 0-based, so we set this before we've added the latest EvalSet
-        depth = len(eval_sets)
-        if betarat.VERBOSE:
-            print "Depth level:", depth,
-        es_h = h if depth == 0 else h * 2.0
-        es_a = h / 2 ** (depth)
-        eval_sets.append(EvalSet(f_, es_a, es_h))
-        # Don't want to have a ZeroDivisionError
-        max_iter = int(1.0/h)
-        for outer_index, eval_set, inner_index in navigate(eval_sets, max_iter):
-            val = eval_set[inner_index]
-            odd = outer_index % 2
-            if odd:
-                cur_sum += val * 4
-            else:
-                if cur_sum + val > stop_at:
-                    return cur_sum + val, eval_set.x_at(inner_index)
-                cur_sum += val * 2
-        # The asumption here is that if we haven't found the mass we are looking for at this point, then we
-        # are probably missing mass that is all lumped up by itself somewhere, and need to greatly decrease
-        # our incremement size
-        raise MissingMass
-
-    def still_converging(sums):
-        def not_within_tol(s1, s2):
-            return abs(1 - s1 / s2) > tolerance
-
-        if len(sums) < 3:
-            return True
-        return not_within_tol(sums[-1], sums[-2]) and not_within_tol(sums[-2], sums[-3])
-
-    eval_sets = []
-    x = None
-    sums = []
-
-    h = h_init
-    while still_converging(sums):
-        try:
-            cur_sum, x = next_level(eval_sets, h)
-            cur_sum *= (h/3)
-        except MissingMass:
-            print "Missing mass - decreasing h_init"
-            return simpson_quant_hp(f, q, a=a, max_sum=max_sum, tolerance=tolerance, h_init=h_init*(0.1))
-        if betarat.VERBOSE:
-            print "   Val:", cur_sum,
-            print "   x:", x,
-            print "   g(x):", g(x)
-        if max_sum:
-            if cur_sum > max_sum:
-                raise MaxSumReached
-        sums.append(cur_sum)
-        h /= 2.0
-
-    # This is required to transform the limit of integration back into the original unbounded coordinates
-    return g(x)
-
-
-
+    quantiles = SimpsonQuantiles(f, a=a, h_init=h_init, max_sum=max_sum, max_levels=max_levels)
+    if np.ndim(q):
+        return [quantiles.quantile(qi, tolerance) for qi in q]
+    return quantiles.quantile(q, tolerance)
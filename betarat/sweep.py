@@ -0,0 +1,262 @@
+"""
+Sweeps over lines of neighbouring tables, such as a1 = 0, ..., n with the other counts fixed, for power and
+sensitivity analyses. The density of each table is a product of Beta normalizers and a 2F1 term on either side of
+w = 1 (see BetaRat.pdf), and a unit step in a count shifts the parameters of F = 2F1(a, b; c; z) by
+
+    count       w <= 1 (z = w)     w > 1 (z = 1/w)
+    a1 or a2    a + 1, c + 1       a + 1, c + 1
+    b1          b - 1              c + 1
+    b2          c + 1              b - 1
+
+while moving a count between a1 and a2 (keeping a1 + a2 fixed) leaves F as it is. F at neighbouring parameters is
+related by Gauss' contiguous relations, so along a line of tables, F only needs to be evaluated directly at a
+couple of tables, and follows at the others from three term recurrences:
+
+    (a, c)  (c - b) z a F(a + 1, c + 1) = ((c - a) c (1 - z) + c (a - 1) + (c - b) z c) F - c (c - 1) F(a - 1, c - 1)
+    b       (c - b) F(b - 1) = (c - 2 b - (a - b) z) F - b (z - 1) F(b + 1)
+    c       (c - a) (c - b) z F(c + 1) = c ((2 c - a - b - 1) z - (c - 1)) F - c (c - 1) (z - 1) F(c - 1)
+
+Each recurrence is only numerically stable in one direction: the (a, c) one downwards, the b one downwards (that
+is, forwards in b - 1), and the c one upwards for z >= 1/2 and downwards below. So the line is split into blocks
+of at most BLOCK_SIZE tables, each of which is seeded by two direct evaluations at its stable end and run towards
+the other end, where a third direct evaluation checks it; at any z where the two disagree by more than RTOL, the
+block is evaluated directly. Lines along other directions (say, moving a success to a failure, which shifts all
+of a, b and c) are evaluated directly, table by table.
+"""
+
+from __future__ import division
+import numpy as np
+from scipy.special import betaln
+from betarat import BetaRat, apply_defaults, hyp2f1
+from quadrature import legendre_nodes
+from exact_cdf import exact_cdf
+import instrument
+
+
+# Tables per recurrence block, each block costing three direct evaluations, and the relative discrepancy allowed
+# between the end of a block's recurrence and its direct check
+BLOCK_SIZE = 64
+RTOL = 1e-10
+
+# Largest Gauss-Legendre order tried by TableSweep.cdf before falling back on BetaRat.cdf, and the difference
+# between successive orders within which the larger is accepted
+CDF_MAX_ORDER = 128
+CDF_TOL = 1e-10
+
+# Recurrence for each unit shift of (a, b, c) (see coefficients and forwards)
+RECURRENCES = {(1, 0, 1): 'ac', (0, -1, 0): 'b', (0, 0, 1): 'c'}
+
+
+def coefficients(kind, a, b, c, z):
+    """ (A, B, C) of the recurrence A F(p + s) = B F(p) - C F(p - s) for F = 2F1(a, b; c; z) at p = (a, b, c),
+    where s is the shift of the given kind of recurrence (see RECURRENCES), as arrays over z """
+    one = np.ones_like(z)
+    if kind == 'ac':
+        return (c - b) * z * a, (c - a) * c * (1 - z) + c * (a - 1) + (c - b) * z * c, c * (c - 1) * one
+    if kind == 'b':
+        return (c - b) * one, c - 2 * b - (a - b) * z, b * (z - 1)
+    return (c - a) * (c - b) * z, c * ((2 * c - a - b - 1) * z - (c - 1)), c * (c - 1) * (z - 1)
+
+
+def forwards(kind, z):
+    "Mask over z of where the recurrence of the given kind is stable run along its shift"
+    if kind == 'ac':
+        return np.zeros(len(z), dtype=bool)
+    if kind == 'b':
+        return np.ones(len(z), dtype=bool)
+    return z >= 0.5
+
+
+def recur_block(hypf, kind, a, b, c, shift, length, z):
+    """ F at p + n s for n = 0, ..., length - 1 (see line_hyp2f1), where s is the kind's shift, by recurrence from
+    direct evaluations at the stable end, checked against a direct evaluation at the other """
+    da, db, dc = shift
+    direct = lambda n, zs: hyp2f1(hypf, a + n * da, b + n * db, c + n * dc, zs)
+    if length < 4:
+        return np.array([direct(n, z) for n in xrange(length)]).reshape(length, len(z))
+    result = np.empty((length, len(z)))
+    result[0] = direct(0, z)
+    result[-1] = direct(length - 1, z)
+    fwd = forwards(kind, z)
+    bwd = ~fwd
+    checks = np.empty(len(z))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if fwd.any():
+            zs = z[fwd]
+            rows = result[:, fwd]
+            rows[1] = direct(1, zs)
+            for n in xrange(1, length - 1):
+                A, B, C = coefficients(kind, a + n * da, b + n * db, c + n * dc, zs)
+                rows[n + 1] = (B * rows[n] - C * rows[n - 1]) / A
+            checks[fwd] = rows[-1]
+            rows[-1] = result[-1, fwd]
+            result[:, fwd] = rows
+        if bwd.any():
+            zs = z[bwd]
+            rows = result[:, bwd]
+            rows[-2] = direct(length - 2, zs)
+            for n in xrange(length - 2, 0, -1):
+                A, B, C = coefficients(kind, a + n * da, b + n * db, c + n * dc, zs)
+                rows[n - 1] = (B * rows[n] - A * rows[n + 1]) / C
+            checks[bwd] = rows[0]
+            rows[0] = result[0, bwd]
+            result[:, bwd] = rows
+        ends = np.where(fwd, result[-1], result[0])
+        failed = ~(np.abs(checks - ends) <= RTOL * np.abs(ends))
+    instrument.count('sweep_recurrences', (length - 3) * len(z))
+    if failed.any():
+        instrument.count('sweep_reseeds', failed.sum())
+        for n in xrange(1, length - 1):
+            result[n, failed] = direct(n, z[failed])
+    return result
+
+
+def line_hyp2f1(hypf, a, b, c, shift, length, z):
+    """ 2F1(a + n s_a, b + n s_b; c + n s_c; z) for n = 0, ..., length - 1 and a unit shift s = (s_a, s_b, s_c),
+    as a (length, len(z)) array, evaluated with the hyp2f1 setting hypf (see betarat.backends) where it isn't
+    found by recurrence """
+    z = np.atleast_1d(np.asarray(z, dtype=float))
+    shift = tuple(int(x) for x in shift)
+    if shift == (0, 0, 0):
+        return np.tile(hyp2f1(hypf, a, b, c, z), (length, 1))
+    backwards = tuple(-x for x in shift)
+    if backwards in RECURRENCES:
+        # Run the line from its far end, along the recurrence's own shift
+        last = length - 1
+        return line_hyp2f1(hypf, a + last * shift[0], b + last * shift[1], c + last * shift[2], backwards,
+                length, z)[::-1]
+    kind = RECURRENCES.get(shift)
+    if kind is None:
+        return np.array([hyp2f1(hypf, a + n * shift[0], b + n * shift[1], c + n * shift[2], z)
+            for n in xrange(length)]).reshape(length, len(z))
+    result = np.empty((length, len(z)))
+    for start in xrange(0, length, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, length)
+        result[start:stop] = recur_block(hypf, kind, a + start * shift[0], b + start * shift[1],
+                c + start * shift[2], shift, stop - start, z)
+    return result
+
+
+class TableSweep(object):
+    """ The line of tables (a1, a2, b1, b2) + n * step for n = 0, ..., length - 1, where the counts and prior are
+    as for the BetaRat constructor, and step gives the increment of each count from one table to the next: say
+    (1, 0, 0, 0) to sweep a1 with the other counts fixed, or (1, -1, 0, 0) to sweep over the split of a fixed
+    number of successes between the two arms. Methods return an array with one row per table, in order, and
+    indexing gives each table's BetaRat. """
+    def __init__(self, a1, a2, b1, b2, step, length, prior=(1.0, 1.0)):
+        self.step = tuple(int(x) for x in step)
+        self.length = length
+        n = np.arange(length)
+        self.a1, self.a2 = a1 + prior[0] + n * self.step[0], a2 + prior[0] + n * self.step[1]
+        self.b1, self.b2 = b1 + prior[1] + n * self.step[2], b2 + prior[1] + n * self.step[3]
+        if length and min(x.min() for x in (self.a1, self.a2, self.b1, self.b2)) <= 0:
+            raise ValueError("Every table of the sweep needs positive posterior parameters")
+        self._log_norms = None
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "TableSweep(<{} tables from {} by {}>)".format(self.length,
+                (self.a1[0], self.a2[0], self.b1[0], self.b2[0]) if self.length else (), self.step)
+
+    def __getitem__(self, i):
+        "The BetaRat of table i"
+        return BetaRat(float(self.a1[i]), float(self.a2[i]), float(self.b1[i]), float(self.b2[i]), prior=(0, 0))
+
+    def __iter__(self):
+        return (self[i] for i in xrange(len(self)))
+
+    @property
+    def log_norms(self):
+        "Columns of the logs of the normalizing constants (A, Blt, Bgt) of each table (see BetaRat.log_norms)"
+        if self._log_norms is None:
+            self._log_norms = (betaln(self.a1, self.b1) + betaln(self.a2, self.b2),
+                    betaln(self.a1 + self.a2, self.b2), betaln(self.a1 + self.a2, self.b1))
+        return self._log_norms
+
+    def h2f1(self, z, right=False, hypf=None):
+        """ The 2F1 term of the density of each table over the array z, F(a1 + a2, 1 - b1; a1 + a2 + b2; z) of the
+        w <= 1 branch with z = w, or if right, F(a1 + a2, 1 - b2; a1 + a2 + b1; z) of the w > 1 branch with
+        z = 1/w, as a (tables, len(z)) array """
+        if not self.length:
+            return np.empty((0, np.size(z)))
+        da1, da2, db1, db2 = self.step
+        a = self.a1[0] + self.a2[0]
+        if right:
+            return line_hyp2f1(hypf, a, 1 - self.b2[0], a + self.b1[0], (da1 + da2, -db2, da1 + da2 + db1),
+                    self.length, z)
+        return line_hyp2f1(hypf, a, 1 - self.b1[0], a + self.b2[0], (da1 + da2, -db1, da1 + da2 + db2),
+                self.length, z)
+
+    def lower_logpdf(self, x, right=False, hypf=None):
+        """ Log density of each table over the array x in (0, 1], or if right, that of each inverse table (see
+        BetaRat.invert), whose lower tail is the upper tail of the table, as a (tables, len(x)) array """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        log_a, log_blt, log_bgt = self.log_norms
+        log_b, a = (log_bgt, self.a2) if right else (log_blt, self.a1)
+        return ((log_b - log_a)[:, None] + (a - 1)[:, None] * np.log(x) +
+                np.log(self.h2f1(x, right, hypf)))
+
+    def logpdf(self, w, hypf=None):
+        """ Log density of each table at each of w (a scalar or array), as a (tables, len(w)) array, with hyp2f1
+        computed according to hypf (as for BetaRat.pdf) """
+        w = np.atleast_1d(np.asarray(w, dtype=float))
+        result = np.full((self.length, len(w)), -np.inf)
+        left = (w > 0) & (w <= 1)
+        if left.any():
+            result[:, left] = self.lower_logpdf(w[left], False, hypf)
+        right = w > 1
+        if right.any():
+            result[:, right] = self.lower_logpdf(1 / w[right], True, hypf) - 2 * np.log(w[right])
+        return result
+
+    def pdf(self, w, hypf=None):
+        "Density of each table at each of w, as a (tables, len(w)) array"
+        return np.exp(self.logpdf(w, hypf))
+
+    @apply_defaults
+    def cdf(self, w, **kw_args):
+        """ CDF of each table at w (a scalar), as an array. Tables whose CDF can be computed exactly are (see
+        BetaRat.exact_cdf_applies). The others share Gauss-Legendre rules over (0, w), or over (0, 1/w) of the
+        inverse tables for w > 1, whose densities at the nodes are found along the sweep. The order is doubled
+        until successive orders agree within CDF_TOL, and tables on which they still disagree at CDF_MAX_ORDER
+        (such as those too sharply peaked for rules of that order) go on to BetaRat.cdf. Keyword args are as for
+        BetaRat.cdf. """
+        result = np.full(self.length, np.nan)
+        if w <= 0 or not self.length:
+            result[:] = 0.0
+            return result
+        todo = np.ones(self.length, dtype=bool)
+        for i, br in enumerate(self):
+            if br.exact_cdf_applies(w, kw_args['exact_max_terms']):
+                result[i] = exact_cdf(br.a1, br.a2, br.b1, br.b2, w)
+                todo[i] = False
+        if not todo.any():
+            return result
+        lower = w <= 1
+        x = w if lower else 1 / w
+        # Start from an order which resolves the spread of the narrowest table, as in BetaRat.cdf_below
+        narrowest = min((self[i] if lower else self[i].invert()).spread() for i in np.flatnonzero(todo))
+        n = 4
+        while n < x / narrowest and n < CDF_MAX_ORDER:
+            n *= 2
+        previous = None
+        while todo.any() and n <= CDF_MAX_ORDER:
+            nodes, weights = legendre_nodes(n)
+            # Substituting x u^2 for the variable of integration smooths out the x^(a - 1) factor of the density
+            # at 0 when a < 1, as for the Jeffreys prior
+            u = (nodes + 1) / 2
+            with instrument.span('quadrature'):
+                densities = np.exp(self.lower_logpdf(x * u ** 2, not lower, kw_args['hyp2f1']))
+                estimates = x * densities.dot(weights * u)
+            instrument.count('quadrature_rounds')
+            if previous is not None:
+                done = todo & (np.abs(estimates - previous) <= CDF_TOL)
+                result[done] = estimates[done] if lower else 1 - estimates[done]
+                todo &= ~done
+            previous = estimates
+            n *= 2
+        for i in np.flatnonzero(todo):
+            result[i] = self[i].cdf(w, **kw_args)
+        return result
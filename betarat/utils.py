@@ -1,7 +1,8 @@
 
 
-def plot_fn(f, a, b, points=100, label=None):
-    """ Nice utility function for plotting functions using pylab."""
+def plot_fn(f, a, b, points=100, label=None, vectorized=False):
+    """ Nice utility function for plotting functions using pylab. If vectorized is set, f is called once on
+    the whole array of x values rather than once per point."""
     # Don't want to force users to have pylab, since many may not actually need this function
     try:
         import pylab
@@ -10,10 +11,21 @@ def plot_fn(f, a, b, points=100, label=None):
         return
     inc = float(b-a) / points
     xs = pylab.arange(a, b, inc)
-    ys = [f(x) for x in xs]
+    ys = f(xs) if vectorized else [f(x) for x in xs]
     if not label:
         label = str(f)
     pylab.plot(xs, ys, label=label)
     pylab.legend()
 
 
+
+
+def canonical_params(a1, a2, b1, b2):
+    """ Fold the posterior parameters (a1, a2, b1, b2) of a BetaRat and those of its inverse (a2, a1, b2, b1)
+    onto a single representative, using the same a1*b2 > a2*b1 criterion that BetaRat uses for deciding when to
+    invert (ties are broken by taking the lexicographically smaller of the two). Returns the representative
+    parameters along with a flag indicating whether they are the inverse of the parameters passed in. """
+    inverse = (a2, a1, b2, b1)
+    if a1*b2 > a2*b1 or (a1*b2 == a2*b1 and inverse < (a1, a2, b1, b2)):
+        return inverse, True
+    return (a1, a2, b1, b2), False
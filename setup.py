@@ -12,7 +12,7 @@ ext_modules = [Extension(
     sources=[path.join("betarat/rf_hyp2f1", x) for x in ('rf_hyp2f1.pyx', 'rf_hyp2f1_core.c')],
     include_dirs=['.'],
     language="c",
-    libraries=['gmp']
+    libraries=['gmp', 'm']
     )]
 
 setup(name='betarat',
@@ -0,0 +1,57 @@
+import unittest
+from betarat import BetaRat
+from betarat.asymptotic import Asymptotic
+from betarat.exact_cdf import exact_cdf
+
+
+class TestAsymptotic(unittest.TestCase):
+    def setUp(self):
+        self.approx = Asymptotic(52, 62, 202, 192)
+
+    def test_cdf(self):
+        "The error estimate should be of the same order as the actual error, in the tails and at the mean"
+        for w in (0.6, 0.84, 1.0, 1.2):
+            exact = exact_cdf(52, 62, 202, 192, w)
+            value, error = self.approx.cdf(w)
+            self.assertLess(abs(value - exact), 2 * error)
+            self.assertLess(error, 1e-5)
+
+    def test_saddlepoint_beats_normal(self):
+        exact = exact_cdf(52, 62, 202, 192, 0.6)
+        self.assertLess(abs(self.approx.cdf(0.6)[0] - exact), abs(self.approx.normal_cdf(0.6)[0] - exact) / 100)
+
+    def test_ppf(self):
+        w, error = self.approx.ppf(0.05)
+        self.assertAlmostEqual(exact_cdf(52, 62, 202, 192, w), 0.05, places=5)
+        self.assertLess(error, 1e-5)
+
+    def test_mode(self):
+        "Compared against the MAP of the density"
+        w, error = self.approx.mode()
+        self.assertAlmostEqual(w, BetaRat(51, 61, 201, 191).map(approx_tol=0), places=4)
+
+
+class TestEngine(unittest.TestCase):
+    def test_small_counts(self):
+        br = BetaRat(5, 7, 20, 19)
+        self.assertEqual(br.engine('cdf', 1.0), 'exact')
+        self.assertEqual(br.engine('cdf', 1.0, exact_max_terms=0), 'quadrature')
+        self.assertEqual(br.engine('map'), 'newton')
+        self.assertEqual(br.engine('ppf', 0.05), 'optim')
+
+    def test_large_counts(self):
+        """ Reference value computed by integrating the Beta CDF of X1 against the density of X2 with
+        scipy.integrate.quad (the exact sum has too many terms to be practical here). """
+        br = BetaRat(5000, 6000, 20000, 19000)
+        for quantity, arg in (('cdf', 0.8), ('map', None), ('ppf', 0.05)):
+            self.assertEqual(br.engine(quantity, arg), 'asymptotic')
+            self.assertNotEqual(br.engine(quantity, arg, approx_tol=0), 'asymptotic')
+        self.assertAlmostEqual(br.cdf(0.8), 0.007975106637549346, places=8)
+
+    def test_ppf_mixed(self):
+        "Quantiles meeting the tolerance are approximated, and the rest are solved for"
+        br = BetaRat(51, 61, 201, 191, prior=(0, 0))
+        approx, error = Asymptotic(51, 61, 201, 191).ppf(0.95)
+        result = br.ppf([0.01, 0.95], approx_tol=2 * error / approx)
+        self.assertEqual(result[1], approx)
+        self.assertAlmostEqual(result[0], br.ppf(0.01, approx_tol=0), places=10)
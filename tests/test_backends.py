@@ -0,0 +1,86 @@
+import unittest
+import subprocess
+import sys
+import numpy as np
+import mpmath
+from betarat import BetaRat, backends
+
+
+def reference(a, b, c, z):
+    return np.array([float(mpmath.hyp2f1(*args)) for args in np.broadcast(a, b, c, z)])
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        # Parameters as they come up in the density, with counts from 1 to 100
+        rng = np.random.RandomState(0)
+        a1, a2, b1, b2 = rng.randint(1, 100, (4, 200)).astype(float)
+        self.a, self.b, self.c, self.z = a1 + a2, 1 - b1, a1 + a2 + b2, rng.uniform(0, 1, 200) ** 4
+
+    def test_valid_regimes(self):
+        "Each backend agrees with mpmath wherever it claims to be valid"
+        expected = reference(self.a, self.b, self.c, self.z)
+        for name, backend in backends.registry.items():
+            if not backend.available():
+                continue
+            valid = backend.valid(self.a, self.b, self.c, self.z)
+            self.assertTrue(valid.any(), name)
+            values = backend(self.a[valid], self.b[valid], self.c[valid], self.z[valid])
+            np.testing.assert_allclose(values, expected[valid], rtol=1e-12, err_msg=name)
+
+    def test_scipy_cancellation(self):
+        "scipy isn't trusted where the series cancels heavily"
+        self.assertFalse(backends.scipy_valid(40.0, -200.0, 250.0, 0.9))
+        self.assertTrue(backends.scipy_valid(40.0, -200.0, 250.0, 0.001))
+
+    def test_auto(self):
+        np.testing.assert_allclose(backends.auto(self.a, self.b, self.c, self.z),
+                reference(self.a, self.b, self.c, self.z), rtol=1e-12)
+        self.assertAlmostEqual(backends.auto(3.0, -5.0, 10.0, 0.5), float(mpmath.hyp2f1(3, -5, 10, 0.5)), places=15)
+
+    def test_non_integer_b(self):
+        "Only mpmath (or scipy, in the tails) can be used when b isn't an integer"
+        names = backends.choose(30.0, -10.5, 45.0, [0.0001, 0.5])
+        self.assertEqual(names[1], 'mpmath')
+        self.assertIn(names[0], ('mpmath', 'scipy'))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, backends.resolve, 'nonesuch')
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        def load():
+            def scalar(a, b, c, z):
+                self.calls.append(z)
+                return mpmath.hyp2f1(a, b, c, z)
+            return scalar, None, scalar
+        backends.register(backends.Backend('counting', load))
+
+    def tearDown(self):
+        del backends.registry['counting']
+        backends.choices.clear()
+
+    def test_named(self):
+        br = BetaRat(5, 7, 20, 19)
+        self.assertAlmostEqual(br.pdf(0.5, hypf='counting'), br.pdf(0.5, hypf='mpmath'), places=12)
+        self.assertEqual(self.calls, [0.5])
+        br.cdf(1.0, exact_max_terms=0, hyp2f1='counting')
+        self.assertGreater(len(self.calls), 1)
+
+
+class TestSettings(unittest.TestCase):
+    def test_methods(self):
+        "The hyp2f1 setting threads through to cdf, map and ppf, which agree across backends"
+        br = BetaRat(5, 7, 20, 19)
+        for method, args in (('cdf', (1.0,)), ('map', ()), ('ppf', (0.05,))):
+            fn = getattr(br, method)
+            kw_args = dict(exact_max_terms=0, approx_tol=0)
+            self.assertAlmostEqual(fn(*args, hyp2f1='mpmath', **kw_args), fn(*args, hyp2f1='auto', **kw_args),
+                    places=8)
+
+    def test_lazy_import(self):
+        "Importing betarat doesn't import mpmath, which is only loaded when a backend or exact CDF needs it"
+        code = "import sys, betarat; print('mpmath' in sys.modules)"
+        self.assertEqual(subprocess.check_output([sys.executable, '-c', code]).strip(), 'False')
@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+from betarat import BetaRat, BetaRatBatch
+from betarat.utils import canonical_params
+
+
+class TestBetaRatBatch(unittest.TestCase):
+    def setUp(self):
+        # The first and third rows are duplicates, and the second is their inverse
+        self.tables = [(5, 7, 20, 19), (7, 5, 19, 20), (5, 7, 20, 19), (3, 3, 9, 9)]
+        self.batch = BetaRatBatch(*zip(*self.tables))
+
+    def test_folding(self):
+        self.assertEqual(len(self.batch), 4)
+        self.assertEqual(len(self.batch.tables), 2)
+
+    def test_cdf(self):
+        cdfs = self.batch.cdf(1.0)
+        for table, cdf in zip(self.tables, cdfs):
+            self.assertAlmostEqual(BetaRat(*table).cdf(1.0), cdf, places=6)
+
+    def test_cdf_endpoints(self):
+        "Inverted rows fold w = 0 onto w = inf"
+        self.assertEqual(list(self.batch.cdf(0.0)), [0.0] * 4)
+        self.assertEqual(list(self.batch.cdf(float('inf'))), [1.0] * 4)
+
+    def test_per_row_args(self):
+        cdfs = self.batch.cdf([1.0, 1.0, 2.0, 1.0])
+        self.assertAlmostEqual(BetaRat(*self.tables[2]).cdf(2.0), cdfs[2], places=6)
+
+    def test_cdf_below(self):
+        below = self.batch.cdf_below(1.0, 0.6, exact_max_terms=0)
+        self.assertEqual(below.dtype, bool)
+        self.assertEqual(list(below), [BetaRat(*table).cdf(1.0) < 0.6 for table in self.tables])
+
+    def test_ppf(self):
+        ppfs = self.batch.ppf(0.25)
+        for table, ppf in zip(self.tables, ppfs):
+            self.assertAlmostEqual(BetaRat(*table).ppf(0.25), ppf, places=4)
+
+    def test_map(self):
+        maps = self.batch.map()
+        self.assertAlmostEqual(maps[1], BetaRat(*self.tables[1]).map(), places=6)
+        self.assertEqual(maps[0], maps[2])
+
+    def test_folding_matches_canonical_params(self):
+        for table, inverted in zip(self.tables, self.batch.inverted):
+            posterior = tuple(x + 1.0 for x in table)
+            self.assertEqual(canonical_params(*posterior)[1], inverted)
+
+    def test_rows(self):
+        "Indexing gives each row's BetaRat, oriented as the batch folded it"
+        for table, br, inverted in zip(self.tables, self.batch, self.batch.inverted):
+            self.assertEqual((br.a1, br.a2, br.b1, br.b2), tuple(x + 1.0 for x in table))
+            self.assertEqual(bool(br.inverted), inverted)
+
+    def test_pdf(self):
+        ws = [0.0, 0.5, 1.0, 2.5]
+        pdfs = self.batch.pdf(ws)
+        for table, w, pdf in zip(self.tables, ws, pdfs):
+            self.assertAlmostEqual(BetaRat(*table).pdf(w), pdf, places=10)
+        self.assertTrue(np.allclose(self.batch.logpdf(2.5), np.log(self.batch.pdf(2.5))))
+
+    def test_credible_interval(self):
+        lower, upper = self.batch.credible_interval(0.9)
+        self.assertAlmostEqual(lower[1], BetaRat(*self.tables[1]).credible_interval(0.9)[0], places=6)
+        self.assertAlmostEqual(upper[3], BetaRat(*self.tables[3]).credible_interval(0.9)[1], places=6)
+
+    def test_hpd_interval(self):
+        lower, upper = self.batch.hpd_interval(0.9)
+        for i in (1, 3):
+            single = BetaRat(*self.tables[i]).hpd_interval(0.9)
+            self.assertAlmostEqual(lower[i], single[0], places=8)
+            self.assertAlmostEqual(upper[i], single[1], places=8)
+
+    def test_empty(self):
+        self.assertEqual(len(BetaRatBatch([], [], [], []).cdf(1.0)), 0)
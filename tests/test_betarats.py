@@ -1,5 +1,9 @@
 import unittest
-from betarat import BetaRat
+import math
+import pickle
+import numpy as np
+from scipy.special import beta
+from betarat import BetaRat, instrument
 
 class TestSanity(unittest.TestCase):
     def setUp(self):
@@ -23,6 +27,157 @@ class TestHandlingZeros(unittest.TestCase):
     def test_pdf_on_0(self):
         self.assertEqual(BetaRat(1, 3, 5, 7).pdf(0.0), 0)
 
+class TestVectorizedPdf(unittest.TestCase):
+    def setUp(self):
+        self.br = BetaRat(5, 7, 20, 19)
+        self.ws = [0.0, 0.3, 1.0, 1.5, 3.0]
+
+    def test_pdf_array_matches_scalar(self):
+        pdfs = self.br.pdf(np.array(self.ws))
+        self.assertIsInstance(pdfs, np.ndarray)
+        for w, p in zip(self.ws, pdfs):
+            self.assertAlmostEqual(float(self.br.pdf(w)), p)
+
+    def test_logpdf(self):
+        logpdfs = self.br.logpdf(np.array(self.ws))
+        self.assertEqual(logpdfs[0], -np.inf)
+        for w, lp in zip(self.ws[1:], logpdfs[1:]):
+            self.assertAlmostEqual(math.log(self.br.pdf(w)), lp)
+        self.assertAlmostEqual(self.br.logpdf(0.3), logpdfs[1])
+
+    def test_logpdf_large_counts(self):
+        # pdf underflows here, but the log density should stay finite
+        self.assertTrue(np.isfinite(BetaRat(500, 700, 2000, 1900).logpdf(1.2)))
+
+class TestCompactRepresentation(unittest.TestCase):
+    def test_immutable(self):
+        br = BetaRat(5, 7, 20, 19)
+        self.assertRaises(AttributeError, setattr, br, 'a1', 3)
+        self.assertFalse(hasattr(br, '__dict__'))
+
+    def test_lazy_inverse(self):
+        br = BetaRat(10, 5, 40, 45)
+        self.assertIsNone(br._inverse)
+        self.assertIs(br.inverted, br.inverted)
+        self.assertFalse(BetaRat(5, 10, 45, 40).inverted)
+
+    def test_normalizers(self):
+        br = BetaRat(5, 7, 20, 19)
+        self.assertAlmostEqual(br.A / (beta(br.a1, br.b1) * beta(br.a2, br.b2)), 1.0, places=12)
+        self.assertAlmostEqual(br.Blt / beta(br.a1 + br.a2, br.b2), 1.0, places=12)
+        # The Beta functions underflow to 0 here, but their logs don't
+        self.assertTrue(all(np.isfinite(BetaRat(500, 700, 2000, 1900).log_norms)))
+
+    def test_pickle(self):
+        br = pickle.loads(pickle.dumps(BetaRat(10, 5, 40, 45)))
+        self.assertAlmostEqual(br.pdf(0.7), BetaRat(10, 5, 40, 45).pdf(0.7))
+        self.assertTrue(br.inverted)
+
+class TestMultipleQuantiles(unittest.TestCase):
+    def setUp(self):
+        self.br = BetaRat(5, 7, 20, 19)
+
+    def test_ppf_sequence(self):
+        qs = [0.975, 0.025, 0.5]
+        ppfs = self.br.ppf(qs)
+        self.assertEqual(len(ppfs), 3)
+        for q, ppf in zip(qs, ppfs):
+            self.assertAlmostEqual(self.br.ppf(q), ppf, places=8)
+
+    def test_ppf_sequence_numeric(self):
+        ppfs = self.br.ppf([0.25, 0.75], exact_max_terms=0)
+        for q, ppf in zip([0.25, 0.75], ppfs):
+            self.assertAlmostEqual(self.br.cdf(ppf), q, places=6)
+
+    def test_credible_interval(self):
+        lower, upper = self.br.credible_interval(0.9)
+        self.assertAlmostEqual(self.br.cdf(lower), 0.05, places=8)
+        self.assertAlmostEqual(self.br.cdf(upper), 0.95, places=8)
+
+class TestHpdInterval(unittest.TestCase):
+    def test_skewed(self):
+        "The endpoints enclose level of the mass at equal density, and the interval is the shortest"
+        for br in [BetaRat(10, 3, 0, 12), BetaRat(5, 7, 20, 19), BetaRat(40, 60, 200, 190, prior=(0.5, 0.5))]:
+            lower, upper = br.hpd_interval(0.95)
+            self.assertAlmostEqual(br.cdf(upper) - br.cdf(lower), 0.95, places=9)
+            self.assertAlmostEqual(br.logpdf(lower) - br.logpdf(upper), 0, places=8)
+            credible = br.credible_interval(0.95)
+            self.assertLess(upper - lower, credible[1] - credible[0])
+
+    def test_from_zero(self):
+        "Where the density is highest at 0, or flat up to the MAP, the interval starts at 0"
+        for br in [BetaRat(0, 3, 10, 10), BetaRat(0, 0, 0, 0)]:
+            lower, upper = br.hpd_interval(0.9)
+            self.assertEqual(lower, 0.0)
+            self.assertAlmostEqual(br.cdf(upper), 0.9, places=8)
+
+class TestCdfBelow(unittest.TestCase):
+    def setUp(self):
+        self.tables = [(5, 7, 20, 19), (7, 5, 19, 20), (1, 12, 30, 15), (40, 3, 10, 60), (3, 3, 9, 9)]
+
+    def check(self, w, alpha, **kw_args):
+        for table in self.tables:
+            br = BetaRat(*table)
+            self.assertEqual(br.cdf_below(w, alpha, **kw_args), br.cdf(w, **kw_args) < alpha)
+
+    def test_numerical(self):
+        for w, alpha in [(1.0, 0.05), (1.0, 0.5), (0.5, 0.3), (2.0, 0.9)]:
+            self.check(w, alpha, exact_max_terms=0)
+
+    def test_exact(self):
+        self.check(1.0, 0.05)
+
+    def test_early_termination(self):
+        "Clear cut tables are decided by the low order estimates, without going on to cdf"
+        with instrument.recording() as stats:
+            self.assertFalse(BetaRat(1, 12, 30, 15, prior=(0.5, 0.5)).cdf_below(1.0, 0.05))
+            self.assertTrue(BetaRat(40, 3, 10, 60, prior=(0.5, 0.5)).cdf_below(1.0, 0.05))
+        self.assertEqual(stats.counts['screen_decided'], 2)
+        self.assertNotIn('quadrature_capped', stats.counts)
+        self.assertNotIn('screen_fallbacks', stats.counts)
+
+    def test_endpoints(self):
+        br = BetaRat(5, 7, 20, 19)
+        self.assertTrue(br.cdf_below(0.0, 0.05))
+        self.assertFalse(br.cdf_below(float('inf'), 0.95, exact_max_terms=0))
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self):
+        self.br = BetaRat(40, 50, 160, 150)
+        self.br.map()
+        self.br.ppf([0.025, 0.975])
+
+    def test_posterior(self):
+        updated = self.br.update(2, 1, 0, 3)
+        self.assertEqual((updated.a1, updated.a2, updated.b1, updated.b2), (43.0, 52.0, 161.0, 154.0))
+        self.assertEqual(self.br.a1, 41.0)
+
+    def test_no_inverting(self):
+        "no_inverting sticks through updates"
+        br = BetaRat(10, 5, 40, 45, no_inverting=True).update(3, 0, 0, 0)
+        self.assertFalse(br.inverted)
+        self.assertTrue(BetaRat(10, 5, 40, 45).update(3, 0, 0, 0).inverted)
+
+    def test_warm_start(self):
+        "Carried over solutions give the same results in fewer solver steps"
+        fresh = BetaRat(42, 51, 160, 153)
+        updated = self.br.update(2, 1, 0, 3)
+        with instrument.recording() as cold:
+            expected = [fresh.map()] + fresh.ppf([0.025, 0.975])
+        with instrument.recording() as warm:
+            results = [updated.map()] + updated.ppf([0.025, 0.975])
+        for result, value in zip(results, expected):
+            self.assertAlmostEqual(result / value, 1.0, places=9)
+        self.assertLess(warm.counts['root_iterations'], cold.counts['root_iterations'])
+
+    def test_chained(self):
+        "Solutions are carried along a chain of updates, even through steps where they aren't asked for"
+        updated = self.br.update(1, 0, 0, 0).update(0, 0, 1, 0)
+        with instrument.recording() as stats:
+            lower = updated.ppf(0.025)
+        self.assertAlmostEqual(lower, BetaRat(41, 50, 161, 150).ppf(0.025), places=10)
+        self.assertLessEqual(stats.counts['root_iterations'], 6)
+
 class TestFlippingShit(unittest.TestCase):
     # Only makes sense for simpson...
     def setUp(self):
@@ -0,0 +1,80 @@
+import unittest
+import tempfile
+import shutil
+import os
+from betarat import BetaRat, cache
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.result_cache = cache.enable(maxsize=2)
+
+    def tearDown(self):
+        cache.disable()
+
+    def test_hit(self):
+        br = BetaRat(5, 7, 20, 19)
+        first = br.cdf(1.0)
+        self.assertEqual(self.result_cache.stats()['misses'], 1)
+        self.assertEqual(br.cdf(1.0), first)
+        self.assertEqual(self.result_cache.stats()['memory_hits'], 1)
+
+    def test_settings_in_key(self):
+        br = BetaRat(5, 7, 20, 19)
+        br.cdf(1.0)
+        br.cdf(1.0, quadr_maxiter=20)
+        self.assertEqual(self.result_cache.stats()['misses'], 2)
+
+    def test_inverse_folding(self):
+        cdf = BetaRat(5, 7, 20, 19).cdf(2.0)
+        self.assertAlmostEqual(BetaRat(7, 5, 19, 20).cdf(0.5), 1 - cdf)
+        self.assertEqual(self.result_cache.stats()['memory_hits'], 1)
+
+    def test_folding_endpoints(self):
+        "The inverted table folds w = 0 onto w = inf, and negative w along with it"
+        br = BetaRat(7, 5, 19, 20)
+        self.assertEqual(br.cdf(0.0), 0.0)
+        self.assertEqual(br.cdf(-1.0), 0.0)
+        self.assertEqual(br.cdf(float('inf')), 1.0)
+        self.assertEqual(BetaRat(5, 7, 20, 19).cdf(float('inf')), 1.0)
+
+    def test_ppf_intermediates_not_cached(self):
+        BetaRat(5, 7, 20, 19).ppf(0.5)
+        self.assertEqual(self.result_cache.stats()['memory_size'], 1)
+
+    def test_map_orientation(self):
+        BetaRat(5, 7, 20, 19).map()
+        BetaRat(7, 5, 19, 20).map()
+        self.assertEqual(self.result_cache.stats()['misses'], 2)
+
+    def test_lru_eviction(self):
+        br = BetaRat(5, 7, 20, 19)
+        for w in (0.5, 1.0, 2.0):
+            br.cdf(w)
+        self.assertEqual(self.result_cache.stats()['memory_evictions'], 1)
+        self.assertEqual(self.result_cache.stats()['memory_size'], 2)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.sqlite')
+
+    def tearDown(self):
+        cache.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_persistence(self):
+        cache.enable(path=self.path)
+        cdf = BetaRat(5, 7, 20, 19).cdf(1.0)
+        result_cache = cache.enable(path=self.path)
+        self.assertEqual(BetaRat(5, 7, 20, 19).cdf(1.0), cdf)
+        self.assertEqual(result_cache.stats()['disk_hits'], 1)
+
+    def test_disk_eviction(self):
+        result_cache = cache.enable(maxsize=1, path=self.path, max_disk_entries=2)
+        br = BetaRat(5, 7, 20, 19)
+        for w in (0.5, 1.0, 2.0):
+            br.cdf(w)
+        self.assertEqual(result_cache.stats()['disk_size'], 1)
+        self.assertEqual(result_cache.stats()['disk_evictions'], 2)
@@ -0,0 +1,88 @@
+import unittest
+import tempfile
+import shutil
+import os
+from StringIO import StringIO
+from betarat import BetaRat
+from betarat.scripts.cli import read_tables, compute_chunk, main
+
+
+class TestBatchCli(unittest.TestCase):
+    def test_read_tables(self):
+        infile = StringIO("a,b,c,d\n5,7,20,19\n\n3,3,9,9\n")
+        self.assertEqual(list(read_tables(infile, None, True)), [(5, 7, 20, 19), (3, 3, 9, 9)])
+
+    def test_read_tables_bad_line(self):
+        tables = read_tables(StringIO("5\t7\t20\t19\n5\t7\t20\n"), None, False)
+        self.assertRaises(ValueError, list, tables)
+
+    def test_compute_chunk(self):
+        columns = [('cdf_1.0', 'cdf', 1.0), ('map', 'map', None)]
+        kw_args = dict(quadr_maxiter=50, optim_maxiter=75)
+        rows = compute_chunk([(5, 7, 20, 19), (7, 5, 19, 20)], columns, (1.0, 1.0), False, kw_args)
+        self.assertEqual(rows[0][:4], [5, 7, 20, 19])
+        self.assertAlmostEqual(float(rows[1][4]), BetaRat(7, 5, 19, 20).cdf(1.0), places=6)
+        self.assertAlmostEqual(float(rows[1][5]), BetaRat(7, 5, 19, 20).map(), places=6)
+
+
+class TestBatchPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.input = os.path.join(self.tmpdir, 'tables.csv')
+        self.output = os.path.join(self.tmpdir, 'results.tsv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_batch(self, lines, *extra):
+        with open(self.input, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        main(['batch', self.input, '-o', self.output] + list(extra))
+        with open(self.output) as f:
+            return [line.rstrip('\n').split('\t') for line in f]
+
+    def test_order(self):
+        "With single table chunks spread over two workers, rows still come out in input order"
+        tables = ['5,7,20,19', '7,5,19,20', '3,3,9,9', '0,4,3,8', '5,7,20,19', '2,9,8,1']
+        rows = self.run_batch(tables, '-j', '2', '--chunk-size', '1')
+        self.assertEqual(rows[0], ['a', 'b', 'c', 'd', 'cdf_1.0'])
+        self.assertEqual([','.join(row[:4]) for row in rows[1:]], tables)
+        self.assertEqual(rows[1:], self.run_batch(tables)[1:])
+
+    def test_bad_line(self):
+        self.assertRaises(SystemExit, self.run_batch, ['5,7,20,19', '5,7,20'], '-j', '2', '--chunk-size', '1')
+
+    def test_alpha(self):
+        tables = ['5,7,20,19', '7,5,19,20', '3,3,9,9']
+        rows = self.run_batch(tables, '--cdf', '1.0', '--map', '--alpha', '0.6')
+        self.assertEqual(rows[0], ['a', 'b', 'c', 'd', 'cdf_1.0<0.6', 'map'])
+        self.assertEqual([row[4] for row in rows[1:]], ['0', '1', '1'])
+
+    def test_monte_carlo(self):
+        "Monte Carlo columns don't depend on how the rows are chunked"
+        tables = ['5,7,20,19', '7,5,19,20', '3,3,9,9']
+        rows = self.run_batch(tables, '--monte-carlo', '1000', '--ppf', '0.5', '-j', '2', '--chunk-size', '1')
+        self.assertEqual(rows[0], ['a', 'b', 'c', 'd', 'ppf_0.5', 'ppf_0.5_se'])
+        self.assertEqual(rows, self.run_batch(tables, '--monte-carlo', '1000', '--ppf', '0.5'))
+
+    def test_resume(self):
+        "A run killed partway through a row is carried on from its last complete row"
+        tables = ['5,7,20,19', '7,5,19,20', '3,3,9,9', '0,4,3,8']
+        rows = self.run_batch(tables, '--map', '--chunk-size', '1')
+        with open(self.output, 'w') as f:
+            f.write('\t'.join(rows[0]) + '\n' + '\t'.join(rows[1]) + '\n' + '\t'.join(rows[2])[:9])
+        self.assertEqual(self.run_batch(tables, '--map', '--resume'), rows)
+        # As left by a run stopped during its first chunk
+        with open(self.output, 'w') as f:
+            f.write('\t'.join(rows[0]) + '\n')
+        self.assertEqual(self.run_batch(tables, '--map', '--resume'), rows)
+        self.assertRaises(SystemExit, self.run_batch, tables, '--resume')
+
+    def test_budget(self):
+        "Tables running over the budget are marked as such, and the rest are computed as usual"
+        tables = ['5,7,20,19', '300,280,600,650', '3,3,9,9']
+        rows = self.run_batch(tables, '--max-evals', '10', '--approx-tol', '0')
+        self.assertEqual(rows[0], ['a', 'b', 'c', 'd', 'cdf_1.0', 'status'])
+        self.assertEqual([row[-1] for row in rows[1:]], ['ok', 'over_budget', 'ok'])
+        self.assertEqual(rows[2][4], 'nan')
+        self.assertEqual(rows[3][4], self.run_batch(tables)[3][4])
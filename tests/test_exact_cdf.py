@@ -0,0 +1,37 @@
+import unittest
+from betarat import BetaRat
+from betarat.exact_cdf import exact_cdf, is_integral
+
+
+class TestExactCdf(unittest.TestCase):
+    """ Reference values computed with mpmath at 30 digits, integrating the Beta CDF of X1 against the density of
+    X2. """
+    def test_lower(self):
+        self.assertAlmostEqual(exact_cdf(6, 8, 21, 20, 1.0), 0.711492403123558523, places=14)
+        self.assertAlmostEqual(exact_cdf(6, 8, 21, 20, 0.3), 0.032546807265072933, places=14)
+
+    def test_upper(self):
+        self.assertAlmostEqual(exact_cdf(1, 5, 4, 9, 5.0), 0.998548455838763025, places=14)
+
+    def test_symmetric(self):
+        self.assertEqual(exact_cdf(6, 6, 11, 11, 1.0), 0.5)
+
+    def test_is_integral(self):
+        self.assertTrue(is_integral(6, 8.0, 21, 20))
+        self.assertFalse(is_integral(6, 8.5, 21, 20))
+        self.assertFalse(is_integral(0, 8, 21, 20))
+
+    def test_dispatch(self):
+        br = BetaRat(5, 7, 20, 19)
+        self.assertEqual(br.cdf(1.0), exact_cdf(6, 8, 21, 20, 1.0))
+        self.assertNotEqual(br.cdf(1.0, exact_max_terms=0), exact_cdf(6, 8, 21, 20, 1.0))
+        self.assertAlmostEqual(br.cdf(1.0, exact_max_terms=0), exact_cdf(6, 8, 21, 20, 1.0), places=8)
+
+    def test_infinite(self):
+        self.assertEqual(exact_cdf(6, 8, 21, 20, float('inf')), 1.0)
+        self.assertEqual(BetaRat(5, 7, 20, 19).cdf(float('inf')), 1.0)
+
+    def test_large_a1(self):
+        "Only b1 terms are summed, so a huge a1 is cheap; the reference is mpmath quadrature at 30 digits"
+        self.assertEqual(exact_cdf(10**6, 10**6, 3, 3, 1.0), 0.5)
+        self.assertAlmostEqual(exact_cdf(5001, 5001, 4, 4, 0.9995), 0.172871852640161884, places=14)
@@ -0,0 +1,97 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import betarat.betarat
+from betarat import BetaRat, instrument
+from betarat.scripts.cli import main
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.br = BetaRat(5, 7, 20, 19)
+
+    def test_not_recording(self):
+        self.br.pdf(0.5)
+        self.assertIsNone(instrument.current)
+
+    def test_pdf_counts(self):
+        with instrument.recording() as stats:
+            self.br.pdf(0.5)
+            self.br.pdf([0.5, 1.0, 2.0])
+        self.assertEqual(stats.counts['pdf'], 4)
+        self.assertEqual(stats.counts['hyp2f1'], 4)
+        self.assertGreater(stats.seconds['pdf'], 0)
+
+    def test_quadrature(self):
+        "This table needs a couple of rounds of refinement"
+        br = BetaRat(0, 0, 2, 2, prior=(0.5, 0.5))
+        with instrument.recording() as stats:
+            br.cdf(1.0, exact_max_terms=0, approx_tol=0, quadr_maxiter=2)
+        self.assertEqual(stats.counts['quadrature'], 1)
+        self.assertEqual(stats.counts['quadrature_rounds'], 2)
+        self.assertEqual(stats.counts['quadrature_capped'], 1)
+        with instrument.recording() as stats:
+            br.cdf(1.0, exact_max_terms=0, approx_tol=0)
+        self.assertGreater(stats.counts['quadrature_rounds'], 2)
+        self.assertNotIn('quadrature_capped', stats.counts)
+
+    def test_root_finding(self):
+        with instrument.recording() as stats:
+            self.br.ppf(0.05)
+            self.br.map(approx_tol=0)
+        self.assertGreater(stats.counts['root_iterations'], 0)
+        self.assertGreater(stats.counts['mode_iterations'], 0)
+
+    def test_nested(self):
+        with instrument.recording() as outer:
+            self.br.pdf(0.5)
+            with instrument.recording() as inner:
+                self.br.pdf(2.0)
+        self.assertEqual(inner.counts['pdf'], 1)
+        self.assertEqual(outer.counts['pdf'], 2)
+
+    def test_budget(self):
+        "Running over the budget raises, and what was counted up to then still goes to the outer recording"
+        with instrument.recording() as outer:
+            with instrument.budget(max_evaluations=10):
+                self.br.pdf([0.5, 1.0])
+            def over_budget():
+                with instrument.budget(max_evaluations=10):
+                    self.br.cdf(1.0, exact_max_terms=0)
+            self.assertRaises(instrument.BudgetExceeded, over_budget)
+        self.assertGreater(outer.counts['pdf'], 10)
+        with instrument.budget(max_seconds=0):
+            self.assertRaises(instrument.BudgetExceeded, self.br.pdf, 0.5)
+
+
+class TestCliStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        betarat.betarat.VERBOSE = False
+
+    def test_stats(self):
+        path = os.path.join(self.tmpdir, 'stats.json')
+        main(['cdf', '5', '7', '20', '19', '--exact-max-terms', '0', '--stats', path])
+        with open(path) as f:
+            stats = json.load(f)
+        self.assertEqual(stats['counts']['quadrature'], 1)
+        self.assertIn('total', stats['seconds'])
+
+    def test_batch_pool_stats(self):
+        "Counts are collected from the worker processes"
+        tables, output, path = [os.path.join(self.tmpdir, name) for name in ('tables', 'out', 'stats.json')]
+        with open(tables, 'w') as f:
+            f.write('5,7,20,19\n3,3,9,9\n')
+        main(['batch', tables, '-o', output, '--exact-max-terms', '0', '-j', '2', '--chunk-size', '1',
+            '--stats', path])
+        with open(path) as f:
+            self.assertEqual(json.load(f)['counts']['quadrature'], 2)
+
+    def test_verbose(self):
+        main(['cdf', '5', '7', '20', '19', '-v'])
+        self.assertTrue(betarat.betarat.VERBOSE)
@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from betarat import BetaRat, BetaRatBatch, lookup
+
+
+class TestLookupTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmpdir, 'lookup.brl')
+        lookup.build(cls.path, 1, quantiles=(0.05, 0.95))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def setUp(self):
+        self.table = lookup.load(self.path)
+
+    def tearDown(self):
+        lookup.unload()
+
+    def test_header(self):
+        self.assertEqual(self.table.n, 1)
+        self.assertEqual(self.table.prior, (1.0, 1.0))
+        self.assertEqual(self.table.quantiles, (0.05, 0.95))
+
+    def test_values(self):
+        lookup.unload()
+        br = BetaRat(0, 1, 1, 0)
+        self.assertAlmostEqual(self.table.find(br.a1, br.a2, br.b1, br.b2, 'cdf', 1.0), br.cdf(1.0))
+        self.assertAlmostEqual(self.table.find(br.a1, br.a2, br.b1, br.b2, 'map'), br.map())
+        self.assertAlmostEqual(self.table.find(br.a1, br.a2, br.b1, br.b2, 'optim_ppf', 0.95), br.ppf(0.95))
+
+    def test_outside_grid(self):
+        self.assertEqual(self.table.find(3.0, 1.0, 1.0, 1.0, 'map'), None)
+        self.assertEqual(self.table.find(1.5, 1.0, 1.0, 1.0, 'map'), None)
+        self.assertEqual(self.table.find(1.0, 1.0, 1.0, 1.0, 'cdf', 2.0), None)
+
+    def test_betarat_uses_table(self):
+        self.table.data = np.zeros_like(self.table.data)
+        self.assertEqual(BetaRat(0, 1, 1, 0).cdf(1.0), 0.0)
+        self.assertNotEqual(BetaRat(0, 1, 1, 0).cdf(2.0), 0.0)
+
+    def test_batch_uses_table(self):
+        self.table.data = np.zeros_like(self.table.data)
+        # One of these two is inverted relative to the other, so comes back as 1 - 0
+        cdfs = BetaRatBatch([0, 1, 5], [1, 0, 2], [1, 0, 0], [0, 1, 1]).cdf(1.0)
+        self.assertEqual(sorted(cdfs[:2]), [0.0, 1.0])
+        self.assertNotEqual(cdfs[2], 0.0)
@@ -0,0 +1,65 @@
+import unittest
+import math
+import numpy as np
+from scipy import optimize
+from betarat import BetaRat, BetaRatBatch, instrument
+from betarat.mode import find_modes
+
+
+def brent_mode(br, log_transformed=False):
+    "Mode found by minimizing the negative log density over log(w)"
+    objective = lambda t: - br.logpdf(math.exp(t)) - (t if log_transformed else 0)
+    return math.exp(optimize.brent(objective, tol=1e-12, maxiter=500))
+
+
+class TestModes(unittest.TestCase):
+    tables = [(5, 7, 20, 19), (7, 5, 19, 20), (2, 9, 8, 1), (45, 40, 5, 10), (1, 30, 60, 2), (200, 300, 800, 700)]
+
+    def test_map(self):
+        for table in self.tables:
+            br = BetaRat(*table, no_inverting=True)
+            self.assertAlmostEqual(br.map(approx_tol=0) / brent_mode(br), 1, places=6)
+
+    def test_lt_map(self):
+        for table in self.tables:
+            br = BetaRat(*table, no_inverting=True)
+            self.assertAlmostEqual(br.lt_map() / brent_mode(br, log_transformed=True), 1, places=6)
+
+    def test_few_iterations(self):
+        with instrument.recording() as stats:
+            BetaRat(5, 7, 20, 19).map()
+        self.assertLessEqual(stats.counts['mode_iterations'], 10)
+
+    def test_mode_at_zero(self):
+        "With no successes in X1 (and a uniform prior) the density is largest at 0"
+        self.assertEqual(BetaRat(0, 4, 3, 8, no_inverting=True).map(), 0.0)
+
+    def test_mode_at_one(self):
+        "With the Jeffreys prior and no failures, the density is unbounded at 1, and no iterations are needed"
+        with instrument.recording() as stats:
+            for table in [(1, 1, 0, 0), (3, 3, 0, 0), (0, 0, 0, 0), (2, 5, 0, 0)]:
+                self.assertEqual(BetaRat(*table, prior=(0.5, 0.5)).map(), 1.0)
+        self.assertNotIn('hyp2f1', stats.counts)
+        maps = BetaRatBatch([1, 5], [1, 7], [0, 20], [0, 19], prior=(0.5, 0.5)).map()
+        self.assertEqual(maps[0], 1.0)
+        self.assertAlmostEqual(maps[1], BetaRat(5, 7, 20, 19, prior=(0.5, 0.5)).map(), places=12)
+
+    def test_symmetric(self):
+        "Iterates are kept off w = 1, even for tables whose initial guess is exactly 1"
+        br = BetaRat(5, 5, 10, 10, no_inverting=True)
+        self.assertAlmostEqual(br.map(approx_tol=0) / brent_mode(br), 1, places=6)
+
+    def test_batched(self):
+        params = np.array(self.tables, dtype=float) + 1
+        modes = find_modes(*params.T)
+        for table, w in zip(self.tables, modes):
+            self.assertAlmostEqual(w, BetaRat(*table, no_inverting=True).map(approx_tol=0), places=12)
+        maps = BetaRatBatch(*params.T - 1).map()
+        self.assertTrue(np.allclose(maps, [BetaRat(*table).map(approx_tol=0) for table in self.tables], rtol=1e-12))
+
+    def test_start(self):
+        "Starting points, good or bad, lead to the same modes"
+        params = np.array(self.tables, dtype=float) + 1
+        modes = find_modes(*params.T)
+        for start in (modes * 1.01, modes * 100, np.zeros(len(modes))):
+            self.assertTrue(np.allclose(find_modes(*params.T, start=start), modes, rtol=1e-10))
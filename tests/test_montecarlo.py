@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from betarat import BetaRat, BetaRatBatch
+from betarat.montecarlo import MonteCarlo, batch_rvs
+
+
+class TestMonteCarlo(unittest.TestCase):
+    def setUp(self):
+        self.br = BetaRat(5, 7, 20, 19)
+        self.mc = self.br.monte_carlo(100000, random_state=1)
+
+    def test_rvs(self):
+        self.assertEqual(self.br.rvs(10, random_state=3).shape, (10,))
+        self.assertTrue(np.array_equal(self.br.rvs(10, random_state=3), self.br.rvs(10, random_state=3)))
+
+    def test_cdf(self):
+        estimate, se = self.mc.cdf(1.0)
+        self.assertLess(abs(estimate - self.br.cdf(1.0)), 4 * se)
+        self.assertAlmostEqual(se, np.sqrt(estimate * (1 - estimate) / 100000))
+
+    def test_ppf(self):
+        estimate, se = self.mc.ppf(0.05)
+        self.assertLess(abs(estimate - self.br.ppf(0.05)), 4 * se)
+        self.assertLess(se, 0.005)
+
+    def test_interval(self):
+        (lower, upper), (lower_se, upper_se) = self.mc.interval(0.9)
+        self.assertEqual((lower, lower_se), self.mc.ppf(0.05))
+        self.assertEqual((upper, upper_se), self.mc.ppf(0.95))
+
+    def test_arrays(self):
+        estimates, ses = self.mc.cdf([0.5, 1.0])
+        self.assertEqual(estimates[1], self.mc.cdf(1.0)[0])
+
+
+class TestBatchMonteCarlo(unittest.TestCase):
+    def setUp(self):
+        self.tables = [(5, 7, 20, 19), (7, 5, 19, 20), (5, 7, 20, 19), (3, 3, 9, 9)]
+        self.batch = BetaRatBatch(*zip(*self.tables))
+
+    def test_streams_independent_of_chunking(self):
+        "Drawing rows 2 and 3 as their own chunk reproduces the draws made for the whole batch"
+        whole = self.batch.rvs(50, seed=7)
+        chunk = BetaRatBatch(*zip(*self.tables[2:])).rvs(50, seed=7, first_row=2)
+        self.assertTrue(np.array_equal(whole[2:], chunk))
+
+    def test_duplicate_rows_differ(self):
+        "Rows 0 and 2 are the same table, but get their own streams"
+        samples = self.batch.rvs(50, seed=7)
+        self.assertFalse(np.array_equal(samples[0], samples[2]))
+
+    def test_mc_cdf(self):
+        estimates, ses = self.batch.mc_cdf(1.0, size=20000, seed=1)
+        exact = self.batch.cdf(1.0)
+        self.assertTrue(np.all(np.abs(estimates - exact) < 4 * ses))
@@ -0,0 +1,67 @@
+import unittest
+import math
+import numpy as np
+import mpmath
+from betarat import BetaRat, instrument, quadrature
+from betarat.exact_cdf import exact_cdf
+
+
+class TestIntegrate(unittest.TestCase):
+    def test_integrate(self):
+        value, error = quadrature.integrate(np.exp, [0.0, 1.0, 3.0], 10)
+        self.assertAlmostEqual(value, math.exp(3) - 1, places=12)
+        self.assertLess(error, 1e-10)
+
+    def test_refinement(self):
+        "A kink is only resolved by splitting the panels around it, round after round"
+        with instrument.recording() as stats:
+            value, error = quadrature.integrate(lambda x: np.abs(x - 0.3), [0.0, 1.0], 50)
+        self.assertAlmostEqual(value, 0.29, places=10)
+        self.assertGreater(stats.counts['quadrature_rounds'], 3)
+        self.assertNotIn('quadrature_capped', stats.counts)
+
+    def test_nodes_cached(self):
+        self.assertIs(quadrature.legendre_nodes(8), quadrature.legendre_nodes(8))
+
+
+class TestIntegratePdf(unittest.TestCase):
+    def assert_matches_exact(self, br, ws, places=11):
+        for w in ws:
+            self.assertAlmostEqual(br.cdf(w, exact_max_terms=0, approx_tol=0),
+                    exact_cdf(br.a1, br.a2, br.b1, br.b2, w), places=places)
+
+    def test_exact(self):
+        self.assert_matches_exact(BetaRat(5, 7, 20, 19), [0.3, 1.0, 1.25, 3.0])
+        self.assert_matches_exact(BetaRat(0, 3, 10, 10), [0.3, 1.0, 3.0])
+
+    def test_peaked(self):
+        "Large counts give a density too narrow for a single rule over (0, w) to find"
+        self.assert_matches_exact(BetaRat(580, 500, 61, 43), [0.95, 1.0, 1.05])
+
+    def test_singular(self):
+        "With the Jeffreys prior and no successes, the density is unbounded at 0"
+        br = BetaRat(0, 3, 10, 10, prior=(0.5, 0.5))
+        value, error = br.integrate_pdf(0, 0.5, 50, full_output=True)
+        with mpmath.workdps(25):
+            reference = mpmath.quad(lambda w: br.pdf(w, hypf=mpmath.hyp2f1), [0, 0.05, 0.5])
+        self.assertAlmostEqual(value, float(reference), places=12)
+        self.assertLess(error, 1e-10)
+
+    def test_singular_at_one(self):
+        "With the Jeffreys prior and no failures, the density is unbounded at 1, and the panels are graded towards it"
+        br = BetaRat(1, 1, 0, 0, prior=(0.5, 0.5))
+        with instrument.recording() as stats:
+            # Symmetric about 1, in the sense that the ratio and its inverse have the same distribution
+            self.assertAlmostEqual(br.cdf(1.0), 0.5, places=12)
+        self.assertNotIn('quadrature_capped', stats.counts)
+        self.assertLess(stats.counts['pdf'], 2000)
+        with mpmath.workdps(25):
+            reference = mpmath.quad(lambda w: br.pdf(w, hypf=mpmath.hyp2f1), [0, 0.5, 0.7])
+        self.assertAlmostEqual(br.cdf(0.7), float(reference), places=12)
+
+    def test_masses(self):
+        br = BetaRat(5, 7, 20, 19, prior=(0.5, 0.5))
+        self.assertAlmostEqual(br.mass(0.5, 2.0), br.cdf(2.0) - br.cdf(0.5), places=12)
+        self.assertAlmostEqual(br.integrate_pdf(2.0, float('inf'), 50), 1 - br.cdf(2.0), places=12)
+        self.assertEqual(br.integrate_pdf(0, float('inf'), 50), 1.0)
+        self.assertEqual(br.integrate_pdf(2.0, 2.0, 50), 0.0)
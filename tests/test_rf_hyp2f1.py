@@ -1,5 +1,8 @@
 import unittest
-from betarat.rf_hyp2f1 import hyp2f1
+import threading
+import numpy as np
+from betarat.rf_hyp2f1 import hyp2f1, hyp2f1_array, path_stats, reset_path_stats
+from betarat import BetaRat
 from scipy import special
 
 
@@ -19,3 +22,65 @@ class TestRFHyp2F1(unittest.TestCase):
         args = [40, -200, 250, 1.3]
         self.assertNotAlmostEqual(hyp2f1(*args), special.hyp2f1(*args))
 
+
+
+class TestAdaptivePrecision(unittest.TestCase):
+    def test_double_path(self):
+        value, precision = hyp2f1(3, -5, 10, 0.5, return_precision=True)
+        self.assertEqual(precision, 0)
+        self.assertAlmostEqual(value, special.hyp2f1(3, -5, 10, 0.5), places=15)
+
+    def test_heavy_cancellation(self):
+        # Reference value from mpmath at 50 digits; 300 bits is not nearly enough here
+        value, precision = hyp2f1(600, -2000, 2500, 0.9, return_precision=True)
+        self.assertGreater(precision, 1216)
+        self.assertAlmostEqual(value / 3.55553412084638e-156, 1.0, places=12)
+
+    def test_fixed_precision(self):
+        self.assertEqual(hyp2f1(40, -200, 250, 0.9, mpf_prec=300, return_precision=True)[1], 300)
+
+    def test_path_stats(self):
+        reset_path_stats()
+        hyp2f1_array(40, -200, 250, [0.001, 0.9])
+        stats = path_stats()
+        self.assertEqual(stats['double'], 1)
+        self.assertEqual(stats['mpf'], 1)
+
+    def test_scalar_path_stats(self):
+        "Scalar calls take their own path through the C code, and should be counted the same way"
+        precision = hyp2f1(40, -200, 250, 0.9, return_precision=True)[1]
+        reset_path_stats()
+        hyp2f1(40, -200, 250, 0.001)
+        hyp2f1(40, -200, 250, 0.9)
+        self.assertEqual(path_stats(), dict(double=1, mpf=1, mpf_bits=precision))
+
+
+class TestRFHyp2F1Array(unittest.TestCase):
+    def setUp(self):
+        self.ws = np.linspace(0, 1.5, 31)
+
+    def test_matches_scalar(self):
+        results = hyp2f1_array(40, -200, 250, self.ws)
+        for w, result in zip(self.ws, results):
+            self.assertEqual(hyp2f1(40, -200, 250, w), result)
+
+    def test_shape(self):
+        self.assertEqual(hyp2f1_array(3, -5, 10, self.ws.reshape(1, 31)).shape, (1, 31))
+        self.assertEqual(len(hyp2f1_array(3, -5, 10, [])), 0)
+
+    def test_threads(self):
+        expected = hyp2f1_array(40, -200, 250, self.ws)
+        results = [None] * 4
+        def run(i):
+            results[i] = hyp2f1_array(40, -200, 250, self.ws)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            self.assertTrue((result == expected).all())
+
+    def test_pdf_uses_kernel(self):
+        br = BetaRat(5, 7, 20, 19)
+        np.testing.assert_allclose(br.pdf(self.ws, hypf=hyp2f1), br.pdf(self.ws), rtol=1e-12)
@@ -0,0 +1,120 @@
+import unittest
+import threading
+import tempfile
+import shutil
+import socket
+import json
+import os
+from betarat import BetaRat, server
+
+
+class SlowService(server.Service):
+    "Service whose computations wait until released, so that requests can pile up behind them"
+    def __init__(self, **kw_args):
+        server.Service.__init__(self, jobs=0, **kw_args)
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def run(self, task):
+        self.started.set()
+        self.release.wait()
+        return server.Service.run(self, task)
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        self.service = server.Service(jobs=0)
+
+    def test_ops(self):
+        br = BetaRat(5, 7, 20, 19)
+        response = self.service.handle(dict(id=1, op='cdf', table=[5, 7, 20, 19], w=1.2))
+        self.assertEqual(response['id'], 1)
+        self.assertAlmostEqual(response['result'], br.cdf(1.2), places=10)
+        response = self.service.handle(dict(op='map', table=[5, 7, 20, 19]))
+        self.assertAlmostEqual(response['result'], br.map(), places=8)
+        response = self.service.handle(dict(op='ppf', table=[5, 7, 20, 19], prior=[0.5, 0.5]))
+        self.assertAlmostEqual(response['result'], BetaRat(5, 7, 20, 19, prior=(0.5, 0.5)).ppf(0.05), places=8)
+
+    def test_inverted_tables(self):
+        "Tables are computed in their canonical orientation, but answered in their own"
+        for table in ([5, 7, 20, 19], [7, 5, 19, 20]):
+            br = BetaRat(*table)
+            self.assertAlmostEqual(self.service.handle(dict(op='cdf', table=table, w=0.8))['result'],
+                    br.cdf(0.8), places=10)
+            self.assertAlmostEqual(self.service.handle(dict(op='ppf', table=table, q=0.9))['result'],
+                    br.ppf(0.9), places=6)
+            self.assertAlmostEqual(self.service.handle(dict(op='map', table=table))['result'], br.map(), places=8)
+
+    def test_errors(self):
+        self.assertIn('error', self.service.handle(dict(op='pdf', table=[5, 7, 20, 19])))
+        self.assertIn('error', self.service.handle(dict(op='cdf', table=[5, 7])))
+        self.assertIn('error', self.service.handle(dict(op='cdf', table=[5, 7, 20, 19], settings=dict(x=1))))
+        bad_backend = dict(op='map', table=[5, 7, 20, 19], settings=dict(hyp2f1='x'))
+        self.assertIn('error', self.service.handle(bad_backend))
+        self.assertIn('error', json.loads(self.service.handle_line('not json\n')))
+        self.assertEqual(self.service.handle(dict(op='stats'))['result']['errors'], 5)
+
+    def test_coalescing(self):
+        "Requests for the same computation (here, a CDF and one of its inverse table) share it while in flight"
+        service = SlowService()
+        responses = []
+        requests = [dict(op='cdf', table=[5, 7, 20, 19], w=2.0), dict(op='cdf', table=[7, 5, 19, 20], w=0.5)]
+        threads = [threading.Thread(target=lambda r=r: responses.append(service.handle(r))) for r in requests]
+        threads[0].start()
+        service.started.wait()
+        threads[1].start()
+        while service.handle(dict(op='stats'))['result']['coalesced'] < 1:
+            pass
+        service.release.set()
+        for thread in threads:
+            thread.join()
+        counts = service.handle(dict(op='stats'))['result']
+        self.assertEqual((counts['computed'], counts['coalesced'], counts['in_flight']), (1, 1, 0))
+        self.assertAlmostEqual(sum(response['result'] for response in responses), 1.0, places=10)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def serve(self, address, service):
+        socket_server = server.make_server(address, service)
+        thread = threading.Thread(target=socket_server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(socket_server.server_close)
+        self.addCleanup(socket_server.shutdown)
+        self.addCleanup(service.close)
+        return socket_server.server_address
+
+    def exchange(self, connection, requests):
+        stream = connection.makefile('r+')
+        for request in requests:
+            stream.write(json.dumps(request) + '\n')
+        stream.flush()
+        return [json.loads(stream.readline()) for _ in requests]
+
+    def test_tcp_pool(self):
+        address = self.serve(('127.0.0.1', 0), server.Service(jobs=1, max_pending=1))
+        connection = socket.create_connection(address)
+        try:
+            responses = self.exchange(connection, [dict(id=i, op='cdf', table=[5, 7, 20, 19], w=w)
+                for i, w in enumerate([0.5, 1.0, 2.0])])
+        finally:
+            connection.close()
+        self.assertEqual([response['id'] for response in responses], [0, 1, 2])
+        self.assertAlmostEqual(responses[1]['result'], BetaRat(5, 7, 20, 19).cdf(1.0), places=10)
+
+    def test_unix_socket(self):
+        path = os.path.join(self.tmpdir, 'betarat.sock')
+        self.serve(path, server.Service(jobs=0))
+        connection = socket.socket(socket.AF_UNIX)
+        connection.connect(path)
+        try:
+            response, = self.exchange(connection, [dict(op='map', table=[3, 3, 9, 9])])
+        finally:
+            connection.close()
+        self.assertAlmostEqual(response['result'], BetaRat(3, 3, 9, 9).map(), places=8)
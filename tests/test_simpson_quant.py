@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+from betarat import BetaRat, instrument
+from betarat.simpson_quant import SimpsonQuantiles, simpson_quant_hp, MaxSumReached, MissingMass
+
+
+class CountingDensity(object):
+    "Vectorized density, counting the points at which it is evaluated"
+    def __init__(self, f):
+        self.f = f
+        self.evaluations = 0
+
+    def __call__(self, x):
+        self.evaluations += np.size(x)
+        return self.f(x)
+
+
+class TestSimpsonQuantiles(unittest.TestCase):
+    def setUp(self):
+        self.density = CountingDensity(lambda x: np.exp(-x))
+
+    def test_exponential(self):
+        for q in (0.05, 0.5, 0.9):
+            self.assertAlmostEqual(simpson_quant_hp(self.density, q, tolerance=1e-6), -np.log(1 - q), places=5)
+
+    def test_shared_evaluations(self):
+        "A second quantile within the range already evaluated costs nothing more"
+        quantiles = SimpsonQuantiles(self.density)
+        quantiles.quantile(0.9)
+        evaluations = self.density.evaluations
+        self.assertAlmostEqual(quantiles.quantile(0.5), np.log(2), places=3)
+        self.assertEqual(self.density.evaluations, evaluations)
+
+    def test_refine_keeps_evaluations(self):
+        quantiles = SimpsonQuantiles(self.density)
+        quantiles.extend()
+        values = quantiles.values.copy()
+        quantiles.refine()
+        self.assertTrue(np.array_equal(quantiles.values[::2], values))
+        self.assertEqual(self.density.evaluations, 2 * len(values) - 1)
+
+    def test_missing_mass(self):
+        "Mass hidden between the points of the initial grid is found by refining, rather than starting over"
+        spike = lambda x: np.exp(-((x - 1.0015) / 1e-4) ** 2 / 2) / (1e-4 * np.sqrt(2 * np.pi))
+        with instrument.recording() as stats:
+            x = simpson_quant_hp(spike, 0.5, tolerance=1e-6)
+        self.assertAlmostEqual(x, 1.0015, places=5)
+        self.assertGreater(stats.counts['simpson_restarts'], 0)
+        self.assertRaises(MissingMass, simpson_quant_hp, spike, 0.5, max_levels=2)
+
+    def test_max_sum(self):
+        self.assertRaises(MaxSumReached, simpson_quant_hp, lambda x: 10 * np.exp(-x), 5, max_sum=2)
+
+
+class TestSimpsonPpf(unittest.TestCase):
+    def test_matches_optim(self):
+        br = BetaRat(5, 10, 45, 40)
+        qs = [0.05, 0.5, 0.75]
+        for simpson, optim in zip(br.ppf(qs, method='simpson', tolerance=1e-6), br.ppf(qs)):
+            self.assertAlmostEqual(simpson, optim, places=4)
@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import mpmath
+from betarat import BetaRat, TableSweep, instrument, sweep
+
+
+class TestTableSweep(unittest.TestCase):
+    ws = np.array([0.05, 0.4, 1.0, 1.5, 6.0])
+
+    def assert_matches_tables(self, sweep_, places=10):
+        logpdfs = sweep_.logpdf(self.ws)
+        self.assertEqual(logpdfs.shape, (len(sweep_), len(self.ws)))
+        for br, row in zip(sweep_, logpdfs):
+            np.testing.assert_allclose(row, br.logpdf(self.ws), rtol=0, atol=10 ** -places)
+
+    def test_steps(self):
+        "Each count's step, both ways, and prior"
+        for step in [(1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1), (0, 0, -1, 0), (-1, 0, 0, 0)]:
+            for prior in [(1.0, 1.0), (0.5, 0.5)]:
+                self.assert_matches_tables(TableSweep(20, 12, 25, 30, step, 18, prior=prior))
+
+    def test_recurrence(self):
+        "Long lines cost three direct evaluations per block, and are found by recurrence in between"
+        line = TableSweep(0, 10, 40, 30, (1, 0, 0, 0), 100)
+        with instrument.recording() as stats:
+            line.logpdf(self.ws)
+        blocks = -(-len(line) // sweep.BLOCK_SIZE)
+        self.assertEqual(stats.counts['hyp2f1'], 3 * blocks * len(self.ws))
+        self.assertNotIn('sweep_reseeds', stats.counts)
+        self.assert_matches_tables(line)
+
+    def test_other_steps(self):
+        "Moving successes between arms leaves the 2F1 terms as they are, and other steps are evaluated directly"
+        with instrument.recording() as stats:
+            self.assert_matches_tables(TableSweep(0, 12, 8, 9, (1, -1, 0, 0), 13))
+        self.assertEqual(stats.counts['hyp2f1'], len(self.ws) + 13 * len(self.ws))
+        self.assert_matches_tables(TableSweep(2, 12, 18, 9, (1, 0, -1, 0), 15))
+
+    def test_pdf(self):
+        line = TableSweep(3, 5, 20, 15, (0, 0, 0, 1), 5)
+        pdfs = line.pdf([0.0, 0.5, 2.0])
+        self.assertEqual(list(pdfs[:, 0]), [0.0] * 5)
+        self.assertAlmostEqual(pdfs[2, 2], line[2].pdf(2.0), places=10)
+
+    def test_cdf(self):
+        "Against the exact CDF with the default prior, and mpmath quadrature with the Jeffreys prior"
+        line = TableSweep(0, 6, 20, 15, (1, 0, 0, 0), 12)
+        self.assertEqual(line.cdf(1.0)[4], BetaRat(4, 6, 20, 15).cdf(1.0))
+        for w in [0.5, 1.0, 2.5]:
+            cdfs = line.cdf(w, exact_max_terms=0, approx_tol=0)
+            for i in (0, 5, 11):
+                self.assertAlmostEqual(cdfs[i], line[i].cdf(w), places=12)
+        line = TableSweep(0, 6, 20, 15, (1, 0, 0, 0), 12, prior=(0.5, 0.5))
+        cdfs = line.cdf(1.0)
+        for i in (0, 5):
+            pdf = lambda x: line[i].pdf(float(x), hypf='mpmath')
+            self.assertAlmostEqual(cdfs[i], float(mpmath.quad(pdf, [0, 0.25, 1])), places=8)
+        self.assertEqual(list(line.cdf(0.0)), [0.0] * 12)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, TableSweep, 5, 5, 0, 5, (0, 0, -1, 0), 3, prior=(0, 0))